@@ -5,7 +5,7 @@ from .models import Customer, Product, Inventory, Driver, Delivery, Order, Order
 
 @admin.register(Customer)
 class CustomerAdmin(admin.ModelAdmin):
-    list_display = ('name', 'phone', 'created_at')
+    list_display = ('name', 'phone', 'latitude', 'longitude', 'created_at')
     search_fields = ('name', 'phone')
 
 
@@ -22,7 +22,7 @@ class InventoryAdmin(admin.ModelAdmin):
 
 @admin.register(Driver)
 class DriverAdmin(admin.ModelAdmin):
-    list_display = ('name', 'phone')
+    list_display = ('name', 'phone', 'user', 'capacity', 'shift_start', 'shift_end')
 
 
 class OrderItemInline(admin.TabularInline):
@@ -4,3 +4,8 @@ class PosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pos'
 
+    def ready(self):
+        # connects the role cache invalidation receivers
+        import pos.signals
+        # applies SQLITE_PRAGMAS to new database connections
+        import project.sqlite
@@ -0,0 +1,104 @@
+"""Conditional GETs for POS pages and JSON endpoints.
+
+Tracked models (those whose manager is a ``TrackedQuerySet``) carry an
+``updated_at`` column, and every write to their table also bumps its
+``TableStamp`` row in the same transaction: saves and deletes from
+``pos.signals``, queryset updates and bulk creates from the queryset
+itself. A view decorated with ``conditional(...)`` builds its ETag and
+Last-Modified from the stamps of the tables it shows, read with one
+primary-key lookup, and Django's ``condition`` answers a matching
+``If-None-Match`` / ``If-Modified-Since`` with 304 before the view runs.
+
+The ETag also covers the user, their roles, their CSRF secret (pages embed
+tokens), whether JSON was asked for and, for pages that depend on more than
+their tables, ``conditional(..., vary=...)``. Last-Modified has one-second
+resolution, so it is left out while the latest change is under a second
+old; a client could otherwise miss a second change within the same second.
+It is also left out for views with ``vary``, whose page can change without
+any table changing.
+"""
+import functools
+import hashlib
+from datetime import timedelta
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from .models import TableStamp, TrackedQuerySet
+from .pagination import wants_json
+from .roles import get_roles
+
+
+def tracked(model):
+    return issubclass(getattr(model._default_manager, '_queryset_class', type(None)), TrackedQuerySet)
+
+
+def touch(model, using=None):
+    """Bump the ``TableStamp`` of ``model``'s table (inside the caller's transaction)."""
+    conn = connections[using or DEFAULT_DB_ALIAS]
+    qn = conn.ops.quote_name
+    table = qn(TableStamp._meta.db_table)
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({qn('table')}, {qn('version')}, {qn('changed_at')}) VALUES (%s, 1, %s) "
+            f"ON CONFLICT ({qn('table')}) DO UPDATE SET {qn('version')} = {table}.{qn('version')} + 1, "
+            f"{qn('changed_at')} = excluded.{qn('changed_at')}",
+            [model._meta.db_table, conn.ops.adapt_datetimefield_value(timezone.now())],
+        )
+
+
+def _validators(request, models, vary=None):
+    tables = tuple(sorted(model._meta.db_table for model in models))
+    extra = str(vary(request)) if vary is not None else ''
+    memo = request.__dict__.setdefault('_pos_validators', {})
+    if (tables, extra) not in memo:
+        stamps = {table: (0, None) for table in tables}
+        stamps.update(
+            (table, (version, changed_at))
+            for table, version, changed_at in TableStamp.objects.filter(table__in=tables)
+            .values_list('table', 'version', 'changed_at')
+        )
+        parts = [
+            str(request.user.pk),
+            ','.join(sorted(get_roles(request.user))),
+            request.META.get('CSRF_COOKIE') or request.COOKIES.get('csrftoken', ''),
+            'json' if wants_json(request) else 'html',
+            extra,
+            *(f"{table}.{stamps[table][0]}" for table in tables),
+        ]
+        etag = '"%s"' % hashlib.md5('|'.join(parts).encode(), usedforsecurity=False).hexdigest()
+        times = [changed_at for _, changed_at in stamps.values() if changed_at is not None]
+        last_modified = max(times) if len(times) == len(tables) and vary is None else None
+        if last_modified is not None and timezone.now() - last_modified < timedelta(seconds=1):
+            last_modified = None
+        memo[(tables, extra)] = (etag, last_modified)
+    return memo[(tables, extra)]
+
+
+def conditional(*models, vary=None):
+    """304 for unchanged ``models`` before the view runs; put it below ``use_replica``.
+
+    ``vary(request)`` is added to the ETag, as in ``pagecache.cached_view``.
+    Under ``use_replica`` the stamps are read from the same copy as the page.
+    """
+    def etag_func(request, *args, **kwargs):
+        return _validators(request, models, vary)[0]
+
+    def last_modified_func(request, *args, **kwargs):
+        return _validators(request, models, vary)[1]
+
+    def decorator(view):
+        conditional_view = cache_control(private=True, no_cache=True)(
+            condition(etag_func=etag_func, last_modified_func=last_modified_func)(view)
+        )
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_vary_headers(response, ('Accept',))  # HTML and JSON share URLs
+            return response
+        return wrapper
+    return decorator
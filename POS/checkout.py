@@ -0,0 +1,108 @@
+"""Server-side checkout for the cashier screen.
+
+A cart becomes an ``Order`` with its ``OrderItem`` rows and a ``Payment`` in
+one transaction. Stock is taken with a single ``UPDATE ... CASE`` so the
+number of queries does not grow with the size of the cart.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import IntegrityError, transaction
+
+from project.sqlite import serialized
+
+from . import rollups
+from .models import Inventory, Order, OrderItem, Payment, Product
+
+TAX_RATE = Decimal('0.08')
+CENT = Decimal('0.01')
+
+
+class CheckoutError(Exception):
+    """The cart cannot be turned into an order."""
+
+
+class OutOfStock(CheckoutError):
+    """At least one product does not have enough stock."""
+
+
+def normalise_cart(items):
+    """Merge ``[{'product': id, 'quantity': n}, ...]`` into ``{id: n}``."""
+    quantities = {}
+    for item in items:
+        try:
+            product_id = int(item['product'])
+            quantity = int(item.get('quantity', 1))
+        except (KeyError, TypeError, ValueError):
+            raise CheckoutError("Each cart line needs a product id and a quantity.")
+        if quantity <= 0:
+            raise CheckoutError("Quantities must be positive.")
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    if not quantities:
+        raise CheckoutError("Cart is empty.")
+    return quantities
+
+
+def price_cart(quantities):
+    """Return ``(lines, subtotal, tax, total)`` using current product prices."""
+    products = Product.objects.in_bulk(list(quantities))
+    missing = set(quantities) - set(products)
+    if missing:
+        raise CheckoutError(f"Unknown product(s): {sorted(missing)}")
+
+    lines = [(products[pid], qty) for pid, qty in quantities.items()]
+    subtotal = sum((product.price * qty for product, qty in lines), Decimal('0'))
+    tax = (subtotal * TAX_RATE).quantize(CENT, rounding=ROUND_HALF_UP)
+    return lines, subtotal, tax, subtotal + tax
+
+
+@serialized
+def checkout(items, method='cash', customer=None, idempotency_key=None):
+    """Turn a cart into a paid ``Order`` and return it.
+
+    Replaying a request with the same ``idempotency_key`` returns the order
+    created the first time instead of charging again.
+    """
+    if idempotency_key:
+        existing = Order.objects.filter(idempotency_key=idempotency_key).first()
+        if existing is not None:
+            return existing
+
+    if method not in dict(Payment.PAYMENT_METHODS):
+        raise CheckoutError(f"Unknown payment method: {method}")
+
+    quantities = normalise_cart(items)
+    lines, subtotal, tax, total = price_cart(quantities)
+
+    try:
+        with transaction.atomic():
+            # Write first: SQLite then takes the write lock at the start of the
+            # transaction (waiting on busy_timeout) instead of failing with
+            # "database is locked" when upgrading a read lock later on.
+            taken = Inventory.objects.take(quantities)
+            if taken != len(quantities):
+                raise OutOfStock("Some products have no inventory record.")
+            if Inventory.objects.filter(product_id__in=quantities, quantity__lt=0).exists():
+                raise OutOfStock("Not enough stock for this cart.")
+
+            order = Order.objects.create(
+                customer=customer,
+                total=total,
+                paid=True,
+                idempotency_key=idempotency_key or None,
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=qty, unit_price=product.price)
+                for product, qty in lines
+            ])
+            # bulk_create skips the OrderItem signals, so roll the lines up here.
+            rollups.record_items(order.created_at, [(p.pk, qty, p.price) for p, qty in lines])
+            Payment.objects.create(order=order, amount=total, method=method)
+    except IntegrityError:
+        # Another cashier request with the same key committed first.
+        if idempotency_key:
+            return Order.objects.get(idempotency_key=idempotency_key)
+        raise
+
+    order.subtotal = subtotal
+    order.tax = tax
+    return order
@@ -1,22 +1,26 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
-import json
+from channels.db import database_sync_to_async
+from notifications.counters import user_group
+from .outbound import CoalescingConsumerMixin
+from .roles import has_role
+
+class NotificationConsumer(CoalescingConsumerMixin, AsyncWebsocketConsumer):
+    batch_frames = True  # base.html unpacks them
 
-class NotificationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         user = self.scope['user']
         # Only staff/admin can connect
-        if user.is_anonymous or not user.groups.filter(name__in=['staff', 'admin']).exists():
+        if user.is_anonymous or not await database_sync_to_async(has_role)(user, 'staff', 'admin'):
             await self.close()
         else:
             self.group_name = "staff_admin_group"
+            self.user_group = user_group(user.pk)
             await self.channel_layer.group_add(self.group_name, self.channel_name)
-            await self.accept()
+            await self.channel_layer.group_add(self.user_group, self.channel_name)
+            await self.accept_outbound(self.group_name, self.user_group)
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
-
-    async def send_notification(self, event):
-        await self.send(text_data=json.dumps({
-            "title": event['title'],
-            "message": event['message']
-        }))
+        self.stop_outbound()
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+            await self.channel_layer.group_discard(self.user_group, self.channel_name)
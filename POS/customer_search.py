@@ -0,0 +1,141 @@
+"""Full-text customer search for the cashier typeahead.
+
+Customers are indexed in ``pos_customer_fts``, an SQLite FTS5 table whose
+rowid is the customer id, with three columns: name, phones and address. The
+profile phone number and address (``customer.CustomerProfile``) are indexed
+along with the customer's own. Phone numbers are stored as digits in every
+form a cashier may type them (``+63 917 ...``, ``0917...``, ``917...``), so
+any partial number typed from the start matches as a prefix.
+
+``pos.signals`` and ``customer.signals`` re-index a customer in the same
+transaction whenever it or its profile is saved or deleted; bulk writes
+that skip signals call ``index()`` themselves, and ``manage.py
+rebuild_customer_search`` re-creates the whole index.
+
+Results are ranked by BM25 with name matches weighted over phones over
+addresses (the ``rank`` setting made by the migration), and fetched with
+one index lookup plus a join on the customer primary key.
+"""
+import re
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+
+from .models import Customer
+
+TABLE = 'pos_customer_fts'
+COUNTRY_CODE = getattr(settings, 'PHONE_COUNTRY_CODE', '63')
+MIN_PREFIX = 2
+CHUNK_SIZE = 2000
+
+_NON_DIGITS = re.compile(r'\D')
+_PHONE_QUERY = re.compile(r'^[\d\s()+./-]+$')
+_WORDS = re.compile(r'\w+')
+
+
+def phone_keys(phone):
+    """Digits of ``phone`` in international, national and trunk-prefixed form."""
+    digits = _NON_DIGITS.sub('', phone or '')
+    if not digits:
+        return []
+    if digits.startswith(COUNTRY_CODE):
+        national = digits[len(COUNTRY_CODE):]
+    else:
+        national = digits.lstrip('0')
+    return list(dict.fromkeys((digits, national, '0' + national, COUNTRY_CODE + national)))
+
+
+def document(name, phones, addresses):
+    """The ``(name, phones, address)`` columns for a customer."""
+    keys = []
+    for phone in phones:
+        keys.extend(phone_keys(phone))
+    return name or '', ' '.join(dict.fromkeys(keys)), '\n'.join(a for a in addresses if a)
+
+
+def match_expression(query):
+    """FTS5 query for what the cashier typed, or '' when it is too short to search.
+
+    Digits are looked up as a phone number prefix and also as words, so a
+    house or unit number still finds the address.
+    """
+    query = (query or '').strip()
+    # Every word must match, the last one (still being typed) as a prefix.
+    words = [word for word in _WORDS.findall(query.lower()) if len(word) >= MIN_PREFIX]
+    expression = ' '.join(f'"{word}"*' for word in words)
+    if _PHONE_QUERY.match(query):
+        digits = _NON_DIGITS.sub('', query)
+        if len(digits) >= MIN_PREFIX:
+            phone = f'phones : "{digits}"*'
+            return f'{phone} OR ({expression})' if expression else phone
+    return expression
+
+
+def _documents(customer_ids=None):
+    customers = Customer.objects.order_by()
+    if customer_ids is not None:
+        customers = customers.filter(pk__in=customer_ids)
+    rows = customers.values_list(
+        'id', 'name', 'phone', 'address', 'customerprofile__phone_number', 'customerprofile__address',
+    )
+    for pk, name, phone, address, profile_phone, profile_address in rows.iterator(chunk_size=CHUNK_SIZE):
+        yield (pk, *document(name, (phone, profile_phone), (address, profile_address)))
+
+
+def _insert(cursor, documents):
+    documents = iter(documents)
+    written = 0
+    while True:
+        chunk = list(islice(documents, CHUNK_SIZE))
+        if not chunk:
+            return written
+        cursor.executemany(f"INSERT INTO {TABLE} (rowid, name, phones, address) VALUES (%s, %s, %s, %s)", chunk)
+        written += len(chunk)
+
+
+def index(customer_ids):
+    """Re-index the given customers; ids that no longer exist are dropped from the index."""
+    customer_ids = list(dict.fromkeys(customer_ids))
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(customer_ids), CHUNK_SIZE):
+            chunk = customer_ids[start:start + CHUNK_SIZE]
+            cursor.execute(f"DELETE FROM {TABLE} WHERE rowid IN ({', '.join(['%s'] * len(chunk))})", chunk)
+            _insert(cursor, _documents(chunk))
+
+
+def rebuild():
+    """Re-create the whole index; return the number of customers indexed."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+        written = _insert(cursor, _documents())
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+    return written
+
+
+def search(query, limit=20):
+    """Best matching customers for a typeahead, as dicts."""
+    expression = match_expression(query)
+    if not expression:
+        return []
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT c.id, c.name, c.phone, c.address FROM {TABLE} "
+            f"JOIN {qn(Customer._meta.db_table)} c ON c.id = {TABLE}.rowid "
+            f"WHERE {TABLE} MATCH %s ORDER BY rank LIMIT %s",
+            [expression, limit],
+        )
+        return [
+            {'id': pk, 'name': name, 'phone': phone, 'address': address}
+            for pk, name, phone, address in cursor.fetchall()
+        ]
+
+
+def filter_customers(customers, query):
+    """Narrow a ``Customer`` queryset to full-text matches of ``query``."""
+    expression = match_expression(query)
+    if not expression:
+        return customers
+    return customers.filter(pk__in=RawSQL(f"SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s", [expression]))
@@ -0,0 +1,218 @@
+"""Automatic assignment of pending deliveries to drivers.
+
+``assign()`` takes a batch of unassigned pending deliveries in schedule
+order and gives each to the least-loaded driver who has room
+(``Driver.capacity`` open deliveries) and whose shift covers the delivery
+time. Drivers are bucketed by shift window, with a heap keyed on current
+load per bucket, so a delivery only compares the top of each bucket whose
+window covers it: O(n log d) for n deliveries and d drivers (the number of
+distinct shifts is small). An improvement pass then moves deliveries to
+the driver who already has most stops in the same zone (see
+``pos.routeplan``) when that does not unbalance loads, so routes stay
+compact.
+
+All assignments are written with one ``bulk_update`` and broadcast to the
+staff group through the outbox. The outbox dispatcher calls ``flush()`` on
+every poll, which runs the assignment once the oldest waiting delivery is
+``WINDOW_SECONDS`` old, so a burst of new deliveries shares one run;
+``manage.py assign_drivers`` runs it by hand or on a timer.
+"""
+import heapq
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from notifications import outbox
+from . import outbound, routeplan
+from .models import Delivery, Driver
+from .stock import STAFF_GROUP
+
+OPEN_STATUSES = ('pending', 'in_transit')
+BATCH_SIZE = 500
+WINDOW_SECONDS = getattr(settings, 'DRIVER_ASSIGN_WINDOW_SECONDS', 5.0)
+
+
+def covers(shift, at):
+    """Whether the ``(start, end)`` shift covers the local time ``at``."""
+    start, end = shift
+    if start is None or end is None:
+        return True
+    if start <= end:
+        return start <= at < end
+    return at >= start or at < end  # overnight shift
+
+
+def on_shift(driver, moment):
+    return covers((driver.shift_start, driver.shift_end), timezone.localtime(moment).time())
+
+
+def greedy(deliveries, drivers, loads):
+    """``{delivery: driver_id}`` giving each delivery to the least-loaded eligible driver.
+
+    ``loads`` (driver id -> open deliveries) is updated in place.
+    """
+    by_id = {driver.id: driver for driver in drivers}
+    shifts = defaultdict(list)  # (shift_start, shift_end) -> heap of (load, driver id) with room
+    for driver in drivers:
+        if loads[driver.id] < driver.capacity:
+            shifts[(driver.shift_start, driver.shift_end)].append((loads[driver.id], driver.id))
+    for heap in shifts.values():
+        heapq.heapify(heap)
+    assigned = {}
+    for delivery in deliveries:
+        at = timezone.localtime(delivery.scheduled_at).time()
+        heaps = [heap for shift, heap in shifts.items() if heap and covers(shift, at)]
+        if not heaps:
+            continue
+        heap = min(heaps, key=lambda heap: heap[0])
+        _, chosen = heapq.heappop(heap)
+        assigned[delivery] = chosen
+        loads[chosen] += 1
+        if loads[chosen] < by_id[chosen].capacity:
+            heapq.heappush(heap, (loads[chosen], chosen))
+    return assigned
+
+
+def improve(assigned, drivers, loads, zone_of, owners):
+    """Move deliveries to the driver with most stops in their zone, if loads stay balanced.
+
+    ``owners`` is ``{zone: Counter(driver_id)}`` for deliveries already out.
+    """
+    by_id = {driver.id: driver for driver in drivers}
+    for delivery, driver_id in assigned.items():
+        zone = zone_of.get(delivery.id)
+        if zone is not None:
+            owners[zone][driver_id] += 1
+    moved = 0
+    for delivery, driver_id in assigned.items():
+        zone = zone_of.get(delivery.id)
+        if zone is None:
+            continue
+        best = owners[zone].most_common(1)[0][0]
+        if (best != driver_id and loads[best] < by_id[best].capacity and loads[best] <= loads[driver_id]
+                and on_shift(by_id[best], delivery.scheduled_at)):
+            assigned[delivery] = best
+            loads[best] += 1
+            loads[driver_id] -= 1
+            owners[zone][best] += 1
+            owners[zone][driver_id] -= 1
+            moved += 1
+    return moved
+
+
+def _zones(rows):
+    """``{key: zone}`` for ``(key, latitude, longitude)`` rows that have coordinates."""
+    rows = [row for row in rows if row[1] is not None and row[2] is not None]
+    if not rows:
+        return {}
+    xy = routeplan.project([(lat, lng) for _, lat, lng in rows], settings.ROUTE_DEPOT)
+    cells = np.floor(xy / routeplan.ZONE_KM).astype(int)
+    return {row[0]: tuple(cell) for row, cell in zip(rows, cells)}
+
+
+def assign(batch_size=BATCH_SIZE, after=None):
+    """Assign up to ``batch_size`` pending deliveries; return the updated deliveries.
+
+    ``after`` is a ``(scheduled_at, id)`` key: only deliveries after it are
+    taken (see ``assign_all``).
+    """
+    return _assign(batch_size, after)[0]
+
+
+def _assign(batch_size, after):
+    """``(updated deliveries, key of the last delivery looked at or None when the batch was not full)``."""
+    with transaction.atomic():
+        drivers = list(Driver.objects.all())
+        open_rows = list(
+            Delivery.objects.filter(status__in=OPEN_STATUSES, driver__isnull=False)
+            .values_list('id', 'driver_id', 'order__customer__latitude', 'order__customer__longitude')
+        )
+        loads = Counter({driver.id: 0 for driver in drivers})
+        loads.update(driver_id for _, driver_id, _, _ in open_rows)
+        pending = Delivery.objects.filter(status='pending', driver__isnull=True)
+        if after is not None:
+            scheduled_at, pk = after
+            pending = pending.filter(Q(scheduled_at__gt=scheduled_at) | Q(scheduled_at=scheduled_at, pk__gt=pk))
+        pending = list(pending.select_related('order__customer').order_by('scheduled_at', 'id')[:batch_size])
+        if not pending or not drivers:
+            return [], None
+        last = (pending[-1].scheduled_at, pending[-1].id) if len(pending) == batch_size else None
+
+        assigned = greedy(pending, drivers, loads)
+        owners = defaultdict(Counter)
+        open_zones = _zones([(pk, lat, lng) for pk, _, lat, lng in open_rows])
+        for pk, driver_id, _, _ in open_rows:
+            if pk in open_zones:
+                owners[open_zones[pk]][driver_id] += 1
+        zone_of = _zones([
+            (d.id, d.order.customer.latitude, d.order.customer.longitude)
+            for d in assigned if d.order.customer is not None
+        ])
+        improve(assigned, drivers, loads, zone_of, owners)
+
+        for delivery, driver_id in assigned.items():
+            delivery.driver_id = driver_id
+        changed = list(assigned)
+        Delivery.objects.bulk_update(changed, ['driver'])
+        publish(changed, {driver.id: driver for driver in drivers})
+    return changed, last
+
+
+def publish(deliveries, drivers):
+    if not deliveries:
+        return
+    events = [
+        (STAFF_GROUP, outbound.group_event({
+            'type': 'assignment', 'delivery': d.id, 'order': d.order_id,
+            'driver': d.driver_id, 'driver_name': drivers[d.driver_id].name,
+        }, f"delivery:{d.id}"))
+        for d in deliveries
+    ]
+    used = len({d.driver_id for d in deliveries})
+    events.append((STAFF_GROUP, outbound.notification(
+        "Drivers assigned", f"{len(deliveries)} deliveries assigned to {used} drivers")))
+    outbox.publish_many(events)
+
+
+def assign_all(batch_size=BATCH_SIZE):
+    """Run ``assign()`` over every pending delivery; return the number of deliveries assigned.
+
+    Each batch starts after the last delivery the previous one looked at, so
+    deliveries no driver can take do not hold back the ones behind them.
+    """
+    total, after = 0, None
+    while True:
+        batch, after = _assign(batch_size, after)
+        total += len(batch)
+        if after is None:
+            return total
+
+
+# -- runs for new deliveries, from the outbox dispatcher --
+
+_checked_until = None  # deliveries changed up to here were already considered in this process
+
+
+def flush(window=WINDOW_SECONDS):
+    """Assign waiting deliveries once one changed ``window`` seconds ago; return the number assigned.
+
+    Deliveries nobody could take are only retried when another one arrives
+    (or by ``manage.py assign_drivers``), so an idle poll is one indexed
+    ``EXISTS`` query.
+    """
+    global _checked_until
+    if not settings.DRIVER_AUTO_ASSIGN:
+        return 0
+    due = timezone.now() - timedelta(seconds=window)
+    waiting = Delivery.objects.filter(status='pending', driver__isnull=True, updated_at__lte=due)
+    if _checked_until is not None:
+        waiting = waiting.filter(updated_at__gt=_checked_until)
+    if not waiting.exists():
+        return 0
+    _checked_until = due
+    return assign_all()
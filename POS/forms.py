@@ -1,7 +1,18 @@
 from . import models
 from django import forms
 
+from .importers import IMPORTERS
+
 class TrackForm(forms.ModelForm):
     class Meta:
         model = models.Delivery
-        fields = ['customer','status' ]
+        fields = ['order','status' ]
+
+
+class ImportForm(forms.Form):
+    kind = forms.ChoiceField(choices=[(k, k.title()) for k in IMPORTERS])
+    file = forms.FileField(help_text="CSV with a header row, or NDJSON (one object per line).")
+
+    def file_format(self):
+        name = self.cleaned_data['file'].name.lower()
+        return 'ndjson' if name.endswith(('.ndjson', '.jsonl', '.json')) else 'csv'
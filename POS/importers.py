@@ -0,0 +1,252 @@
+"""Bulk CSV/NDJSON import of products, inventory and customers.
+
+Files are read as a stream and handled in batches: each batch is validated
+field by field, then upserted with one ``bulk_create`` plus one ``bulk_update``
+per set of columns, inside its own transaction. A bad row (including a line
+that is not UTF-8) is reported with its line number and skipped; it never
+aborts the rest of the run.
+
+A row with an ``id`` column updates that row. Without one it is matched on
+the importer's ``key`` (SKU, phone); neither is unique, so a key that matches
+several rows is reported as ambiguous rather than overwriting one of them.
+"""
+import codecs
+import csv
+import json
+from collections import defaultdict
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import customer_search
+from .models import Customer, Inventory, Product
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []  # (line, message), capped at MAX_REPORTED_ERRORS
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def __str__(self):
+        return f"{self.created} created, {self.updated} updated, {self.failed} failed"
+
+
+def _text_lines(fileobj, bad_lines):
+    """Decode ``fileobj`` line by line; lines that are not UTF-8 go into ``bad_lines`` and are replaced."""
+    for line_no, raw in enumerate(fileobj, start=1):
+        if line_no == 1 and raw.startswith(codecs.BOM_UTF8):
+            raw = raw[len(codecs.BOM_UTF8):]
+        try:
+            line = raw.decode('utf-8')
+        except UnicodeDecodeError as exc:
+            bad_lines[line_no] = exc
+            line = raw.decode('utf-8', errors='replace')
+        yield line
+
+
+def read_rows(fileobj, fmt):
+    """Yield ``(line_number, dict)`` from a binary CSV or NDJSON stream.
+
+    Rows that cannot be read come out as the exception instead of a dict, to
+    be reported by the importer against their line.
+    """
+    bad_lines = {}
+    lines = _text_lines(fileobj, bad_lines)
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            # A quoted field may span lines: any bad line read so far spoils this row.
+            bad = [bad_lines.pop(line_no) for line_no in sorted(bad_lines) if line_no <= reader.line_num]
+            yield reader.line_num, bad[0] if bad else row
+    else:
+        for line_no, line in enumerate(lines, start=1):
+            if line_no in bad_lines:
+                yield line_no, bad_lines.pop(line_no)
+                continue
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                row = exc
+            yield line_no, row
+
+
+class Importer:
+    """Validates rows against ``fields`` and upserts them batch by batch."""
+    model = None
+    key = None       # column matching an existing row when the row has no id
+    fields = ()      # importable columns (the key and id included)
+    required = ()
+
+    def clean(self, row):
+        if not isinstance(row, dict):
+            raise ValidationError(f"Unreadable row: {row}")
+        missing = [name for name in self.required if not str(row.get(name) or '').strip()]
+        if missing:
+            raise ValidationError(f"Missing {', '.join(missing)}")
+        cleaned = {}
+        for name in self.fields:
+            if name not in row or row[name] is None:
+                continue
+            value = row[name].strip() if isinstance(row[name], str) else row[name]
+            if name == 'id' and value == '':
+                continue  # a new row in a file that also updates others
+            try:
+                cleaned[name] = self.model._meta.get_field(name).clean(value, None)
+            except ValidationError as exc:
+                raise ValidationError(f"{name}: {'; '.join(exc.messages)}")
+        return cleaned
+
+    def run(self, rows, batch_size=BATCH_SIZE):
+        result = ImportResult()
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            valid = {}
+            for line, row in batch:
+                try:
+                    cleaned = self.clean(row)
+                except ValidationError as exc:
+                    result.error(line, '; '.join(exc.messages))
+                    continue
+                # A row repeated within a batch: the last one wins.
+                ident = ('id', cleaned['id']) if cleaned.get('id') else cleaned.get(self.key) or ('line', line)
+                valid[ident] = (line, cleaned)
+            if valid:
+                with transaction.atomic():
+                    created, updated = self.save_batch(list(valid.values()), result)
+                result.created += created
+                result.updated += updated
+        self.finished()
+        return result
+
+    def save_batch(self, items, result):
+        """Create or update ``(line, row)`` items by id or ``self.key``; return ``(created, updated)``."""
+        ids = [row['id'] for line, row in items if row.get('id')]
+        known = set(self.model.objects.filter(pk__in=ids).values_list('pk', flat=True)) if ids else set()
+        keys = [row[self.key] for line, row in items if not row.get('id') and row.get(self.key)]
+        matches = defaultdict(list)
+        if keys:
+            for key, pk in self.model.objects.filter(**{f"{self.key}__in": keys}).values_list(self.key, 'pk'):
+                matches[key].append(pk)
+
+        to_create, to_update = [], defaultdict(list)
+        for line, row in items:
+            pk = row.pop('id', None)
+            if pk is not None:
+                if pk not in known:
+                    result.error(line, f"Unknown id {pk}")
+                    continue
+            else:
+                found = matches.get(row.get(self.key), ())
+                if len(found) > 1:
+                    result.error(line, f"{self.key} {row[self.key]} matches {len(found)} "
+                                       f"{self.model._meta.verbose_name_plural}; give the id")
+                    continue
+                pk = found[0] if found else None
+            if pk is None:
+                to_create.append(self.model(**row))
+            else:
+                names = tuple(sorted(row))
+                if names:
+                    to_update[names].append((pk, row))
+        self.model.objects.bulk_create(to_create)
+        for names, pending in to_update.items():
+            # Through the queryset's update(): sets updated_at and the table stamp.
+            self.model.objects.bulk_update([self.model(pk=pk, **row) for pk, row in pending], names)
+        self.saved([obj.pk for obj in to_create] + [pk for pending in to_update.values() for pk, row in pending])
+        return len(to_create), sum(len(pending) for pending in to_update.values())
+
+    def saved(self, pks):
+        """Called in the batch's transaction with the primary keys it wrote."""
+
+    def finished(self):
+        pass
+
+
+class ProductImporter(Importer):
+    model = Product
+    key = 'sku'
+    fields = ('id', 'sku', 'name', 'price')
+    required = ('name', 'price')
+
+
+class CustomerImporter(Importer):
+    model = Customer
+    key = 'phone'
+    fields = ('id', 'name', 'phone', 'address', 'latitude', 'longitude')
+    required = ('name',)
+
+    def saved(self, pks):
+        # bulk writes skip the Customer signals.
+        customer_search.index(pks)
+
+
+class InventoryImporter(Importer):
+    """Rows are ``sku, quantity[, low_threshold]``; the product must already exist."""
+    model = Inventory
+    key = 'sku'
+    fields = ('quantity', 'low_threshold')
+    required = ('sku', 'quantity')
+
+    def clean(self, row):
+        cleaned = super().clean(row)
+        cleaned['sku'] = str(row['sku']).strip()
+        return cleaned
+
+    def save_batch(self, items, result):
+        matches = defaultdict(list)
+        for sku, pk in Product.objects.filter(sku__in=[row['sku'] for line, row in items]).values_list('sku', 'id'):
+            matches[sku].append(pk)
+        products, found = {}, []
+        for line, row in items:
+            pks = matches.get(row['sku'], ())
+            if len(pks) == 1:
+                products[row['sku']] = pks[0]
+                found.append(row)
+            elif pks:
+                result.error(line, f"SKU {row['sku']} matches {len(pks)} products")
+            else:
+                result.error(line, f"Unknown SKU {row['sku']}")
+        if not found:
+            return 0, 0
+
+        product_ids = [products[row['sku']] for row in found]
+        existing = set(Inventory.objects.filter(product_id__in=product_ids).values_list('product_id', flat=True))
+        update_fields = sorted({name for row in found for name in row if name != 'sku'})
+        Inventory.objects.bulk_create(
+            [
+                Inventory(product_id=products[row['sku']], **{k: v for k, v in row.items() if k != 'sku'})
+                for row in found
+            ],
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=update_fields,
+        )
+        updated = len(existing)
+        return len(found) - updated, updated
+
+
+IMPORTERS = {
+    'products': ProductImporter,
+    'inventory': InventoryImporter,
+    'customers': CustomerImporter,
+}
+
+
+def import_file(kind, fileobj, fmt='csv', batch_size=BATCH_SIZE):
+    return IMPORTERS[kind]().run(read_rows(fileobj, fmt), batch_size)
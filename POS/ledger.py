@@ -0,0 +1,99 @@
+"""Reads over the append-only ``StockMovement`` ledger.
+
+``Inventory.quantity`` is the materialized running total of the ledger, so
+current stock stays a single row read. ``compact()`` periodically writes a
+``StockSnapshot`` per product with new movements, which keeps point-in-time
+reads (``stock_at()``) to the latest snapshot plus a short ledger tail. The
+ledger itself is never trimmed, so shrinkage can still be audited.
+"""
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Max, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from . import stock
+from .models import Inventory, StockMovement, StockSnapshot, TrackedQuerySet
+
+
+def _latest_snapshot():
+    return StockSnapshot.objects.filter(product=OuterRef('product')).order_by('-through')
+
+
+def compact(min_tail=1, upto=None):
+    """Snapshot products with at least ``min_tail`` movements since their last snapshot.
+
+    One grouped pass over the ledger tails; returns the number of snapshots written.
+    """
+    if upto is None:
+        upto = StockMovement.objects.aggregate(last=Max('id'))['last']
+        if upto is None:
+            return 0
+    latest = _latest_snapshot()
+    tails = (
+        StockMovement.objects.filter(id__lte=upto)
+        .annotate(base=Coalesce(Subquery(latest.values('through')[:1]), 0))
+        .filter(id__gt=F('base'))
+        .values('product')
+        .annotate(
+            base_quantity=Coalesce(Subquery(latest.values('quantity')[:1]), 0),
+            delta=Sum('quantity'), through=Max('id'), taken_at=Max('created_at'), movements=Count('id'),
+        )
+        .filter(movements__gte=min_tail)
+        .order_by()
+    )
+    snapshots = [
+        StockSnapshot(product_id=row['product'], through=row['through'], taken_at=row['taken_at'],
+                      quantity=row['base_quantity'] + row['delta'])
+        for row in tails.iterator()
+    ]
+    StockSnapshot.objects.bulk_create(snapshots, batch_size=1000)
+    return len(snapshots)
+
+
+def stock_at(product_id, moment):
+    """Stock of ``product_id`` at ``moment``: latest snapshot by then plus the movements after it."""
+    snapshot = (
+        StockSnapshot.objects.filter(product_id=product_id, taken_at__lte=moment)
+        .order_by('-taken_at', '-through').first()
+    )
+    tail = StockMovement.objects.filter(product_id=product_id, created_at__lte=moment)
+    if snapshot is not None:
+        tail = tail.filter(id__gt=snapshot.through)
+    total = tail.aggregate(total=Sum('quantity'))['total'] or 0
+    return (snapshot.quantity if snapshot else 0) + total
+
+
+def reconcile():
+    """Yield ``(product_id, inventory_quantity, ledger_quantity)`` wherever the two disagree.
+
+    The ledger is summed in one grouped pass; products without an inventory
+    row are reported with an inventory quantity of ``None``.
+    """
+    inventory = dict(Inventory.objects.values_list('product_id', 'quantity'))
+    totals = StockMovement.objects.values('product').annotate(total=Sum('quantity')).order_by()
+    for product_id, total in totals.values_list('product', 'total').iterator(chunk_size=2000):
+        quantity = inventory.pop(product_id, None)
+        if quantity != total and (quantity is not None or total):
+            yield product_id, quantity, total
+    for product_id, quantity in inventory.items():
+        if quantity:
+            yield product_id, quantity, 0
+
+
+def rematerialize(totals):
+    """Set ``Inventory.quantity`` to the ledger totals ``{product_id: quantity}``; return rows updated.
+
+    No movements are written: the ledger is already right. Live stock events,
+    the low-stock tracker and conditional GETs still see the change.
+    """
+    if not totals:
+        return 0
+    rows = Inventory.objects.filter(product_id__in=totals)
+    with transaction.atomic():
+        before = stock.levels(rows)
+        # Skips InventoryQuerySet.update, which would write movements.
+        count = TrackedQuerySet.update(rows, quantity=Case(
+            *[When(product_id=pid, then=Value(quantity)) for pid, quantity in totals.items()],
+            output_field=IntegerField(),
+        ))
+        stock.record(before, stock.levels(rows), ledger=False)
+    return count
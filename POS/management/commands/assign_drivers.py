@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pos import dispatch
+
+
+class Command(BaseCommand):
+    help = "Assign pending deliveries to drivers by load, capacity and shift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=dispatch.BATCH_SIZE)
+        parser.add_argument('--every', type=float, help="Keep running every N seconds.")
+
+    def handle(self, *args, **options):
+        batch_size = max(options['batch_size'], 1)
+        while True:
+            started = time.perf_counter()
+            total = dispatch.assign_all(batch_size)
+            self.stdout.write(f"Assigned {total} deliveries in {time.perf_counter() - started:.3f}s.")
+            if not options['every']:
+                return
+            time.sleep(options['every'])
@@ -0,0 +1,148 @@
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+ROWS = 200
+
+# name -> (pragmas, transaction_mode, persistent connections, write queue)
+PROFILES = {
+    'default': ({}, None, False, False),
+    'production': (settings.SQLITE_PRAGMAS, 'IMMEDIATE', True, False),
+    'production+queue': (settings.SQLITE_PRAGMAS, 'IMMEDIATE', True, True),
+}
+
+
+def _django(path, profile):
+    """Point this worker's Django at the bench database with ``profile``'s settings.
+
+    The dicts are changed in place so this also works in a forked worker,
+    whose connection and cache handlers have already read them.
+    """
+    import django
+    from django.db import connections
+
+    pragmas, transaction_mode, persistent, queued = PROFILES[profile]
+    options = {'timeout': 5}  # Django's default lock timeout
+    if transaction_mode:
+        options['transaction_mode'] = transaction_mode
+    connections.close_all()
+    settings.DATABASES['default'].update(
+        NAME=path, CONN_MAX_AGE=600 if persistent else 0, OPTIONS=options, PRAGMAS=pragmas,
+    )
+    settings.SQLITE_WRITE_QUEUE = queued
+    # Keep the stamps and page entries the writes bump out of the shared cache.
+    settings.CACHES['default'] = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+    django.setup()
+
+
+def _setup(path):
+    _django(path, 'production')
+    from django.core.management import call_command
+    from pos.models import Inventory, Product
+
+    call_command('migrate', verbosity=0)
+    products = Product.objects.bulk_create(
+        Product(name=f'Bench {n}', sku=f'BENCH-{n}', price=10) for n in range(ROWS)
+    )
+    Inventory.objects.bulk_create(Inventory(product=product, quantity=1_000_000) for product in products)
+
+
+def _worker(path, profile, threads, seconds, write_ratio, results):
+    _django(path, profile)
+    from django.db import OperationalError, connection
+    from pos.checkout import checkout
+    from pos.models import Inventory, StockMovement
+
+    persistent = PROFILES[profile][2]
+    product_ids = list(Inventory.objects.values_list('product_id', flat=True))
+    connection.close()
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def run():
+        rng = random.Random()
+        done = {'reads': 0, 'writes': 0, 'errors': 0}
+        while time.monotonic() < deadline:
+            product_id = rng.choice(product_ids)
+            try:
+                if rng.random() < write_ratio:
+                    # The cashier's write path: @serialized, through the queue when it is on.
+                    checkout([{'product': product_id, 'quantity': 1}])
+                    done['writes'] += 1
+                else:
+                    Inventory.objects.filter(product_id=product_id).values_list('quantity').first()
+                    StockMovement.objects.filter(product_id=product_id).count()
+                    done['reads'] += 1
+            except OperationalError:
+                done['errors'] += 1
+            finally:
+                if not persistent:
+                    connection.close()
+        connection.close()
+        with lock:
+            for key, value in done.items():
+                counts[key] += value
+
+    pool = [threading.Thread(target=run) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    results.put(counts)
+
+
+class Command(BaseCommand):
+    help = "Measure throughput and 'database is locked' errors of the SQLite profiles under concurrent writers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Processes, like ASGI/WSGI workers.")
+        parser.add_argument('--threads', type=int, default=8, help="Request threads per worker.")
+        parser.add_argument('--seconds', type=float, default=5.0, help="Duration of each profile run.")
+        parser.add_argument('--write-ratio', type=float, default=0.2)
+        parser.add_argument('--profile', choices=sorted(PROFILES), action='append',
+                            help="Profiles to run (default: all).")
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{options['workers']} workers x {options['threads']} threads, "
+            f"{options['write_ratio']:.0%} writes (checkouts), {options['seconds']}s per profile"
+        )
+        for profile in options['profile'] or PROFILES:
+            counts = self.bench(profile, options)
+            requests = counts['reads'] + counts['writes'] + counts['errors']
+            seconds = options['seconds']
+            self.stdout.write(
+                f"{profile:17} {requests / seconds:>9,.0f} req/s  {counts['writes'] / seconds:>8,.0f} writes/s  "
+                f"{counts['errors']:>6} errors ({counts['errors'] / requests if requests else 0:.2%})"
+            )
+
+    def bench(self, profile, options):
+        # The platform's default start method (spawn on Windows and macOS), so
+        # each worker sets Django up for the bench database itself.
+        results = multiprocessing.Queue()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.sqlite3')
+            setup = multiprocessing.Process(target=_setup, args=(path,))
+            setup.start()
+            setup.join()
+            if setup.exitcode:
+                raise RuntimeError(f"Setting up the bench database failed (exit code {setup.exitcode}).")
+            procs = [
+                multiprocessing.Process(target=_worker, args=(
+                    path, profile, options['threads'], options['seconds'], options['write_ratio'], results,
+                ))
+                for _ in range(options['workers'])
+            ]
+            for proc in procs:
+                proc.start()
+            reports = [results.get() for _ in procs]
+            for proc in procs:
+                proc.join()
+        return {key: sum(report[key] for report in reports) for key in reports[0]}
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from pos import ledger
+
+
+class Command(BaseCommand):
+    help = "Snapshot stock per product so point-in-time reads only replay a short ledger tail."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-tail', type=int, default=1,
+                            help="Only snapshot products with at least this many new movements.")
+
+    def handle(self, *args, **options):
+        written = ledger.compact(min_tail=max(options['min_tail'], 1))
+        self.stdout.write(f"Wrote {written} stock snapshots.")
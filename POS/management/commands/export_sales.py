@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from pos.exports import EXPORTS, FORMATS, stream_export
+
+
+def _date(value):
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD.")
+    return parsed
+
+
+class Command(BaseCommand):
+    help = "Stream orders, order items, payments or deliveries to CSV/NDJSON without loading them into memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--since', type=_date, help="First day to include (YYYY-MM-DD).")
+        parser.add_argument('--until', type=_date, help="Last day to include (YYYY-MM-DD).")
+        parser.add_argument('--gzip', action='store_true', help="Gzip the output.")
+        parser.add_argument('--output', '-o', default='-', help="File to write, '-' for stdout.")
+
+    def handle(self, *args, **options):
+        chunks = stream_export(options['kind'], options['format'], options['since'], options['until'], options['gzip'])
+        out = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+            else:
+                out.flush()
@@ -0,0 +1,35 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pos.importers import BATCH_SIZE, IMPORTERS, import_file
+
+
+class Command(BaseCommand):
+    help = "Bulk upsert products, inventory or customers from a CSV or NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS))
+        parser.add_argument('path', help="File to read, '-' for stdin.")
+        parser.add_argument('--format', choices=('csv', 'ndjson'),
+                            help="Defaults to ndjson for .ndjson/.jsonl files, csv otherwise.")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be positive.")
+        try:
+            fileobj = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        with fileobj:
+            result = import_file(options['kind'], fileobj, fmt, options['batch_size'])
+
+        for line, message in result.errors:
+            self.stderr.write(f"line {line}: {message}")
+        if result.failed > len(result.errors):
+            self.stderr.write(f"... and {result.failed - len(result.errors)} more errors")
+        self.stdout.write(str(result))
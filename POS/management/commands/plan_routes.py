@@ -0,0 +1,43 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from pos import routeplan
+
+
+class Command(BaseCommand):
+    help = "Plan today's routes for drivers with pending deliveries."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--driver', type=int, action='append', help="Only plan for these driver ids.")
+        parser.add_argument('--benchmark', action='store_true',
+                            help="Plan random stops instead, and report the time taken.")
+        parser.add_argument('--stops', type=int, default=500, help="Stops for --benchmark.")
+        parser.add_argument('--drivers', type=int, default=20, help="Drivers for --benchmark.")
+
+    def handle(self, *args, **options):
+        if options['benchmark']:
+            return self.benchmark(options['stops'], options['drivers'])
+        started = time.perf_counter()
+        routes = routeplan.plan_routes(options['driver'])
+        for driver_id, route in sorted(routes.items()):
+            self.stdout.write(f"Driver {driver_id}: {len(route.stops)} stops, {route.km:.1f} km")
+            for position, delivery in enumerate(route.stops, 1):
+                customer = delivery.order.customer
+                self.stdout.write(f"  {position:>3}. delivery #{delivery.id} {customer.name} - {customer.address}")
+            for delivery in route.unlocated:
+                self.stdout.write(f"    -. delivery #{delivery.id} (no coordinates)")
+        self.stdout.write(f"Planned {len(routes)} routes in {time.perf_counter() - started:.3f}s.")
+
+    def benchmark(self, stops, drivers):
+        lat, lng = settings.ROUTE_DEPOT
+        rng = random.Random(0)
+        per_driver = [[] for _ in range(drivers)]
+        for n in range(stops):
+            per_driver[n % drivers].append((lat + rng.uniform(-0.1, 0.1), lng + rng.uniform(-0.1, 0.1)))
+        started = time.perf_counter()
+        total = sum(routeplan.order_stops(points, settings.ROUTE_DEPOT)[1] for points in per_driver)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{stops} stops across {drivers} drivers: {total:.1f} km in {elapsed * 1000:.1f} ms")
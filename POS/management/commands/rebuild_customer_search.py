@@ -0,0 +1,14 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pos import customer_search
+
+
+class Command(BaseCommand):
+    help = "Re-create the customer full-text search index from the customer and profile tables."
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = customer_search.rebuild()
+        self.stdout.write(f"Indexed {count} customers in {time.monotonic() - started:.1f}s")
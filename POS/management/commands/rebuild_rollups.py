@@ -0,0 +1,100 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, Min, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+from pos.models import DailySales, HourlySales, Order, OrderItem, Payment, ProductDailySales
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"Invalid date '{value}', expected YYYY-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = "Rebuild the sales rollup tables from raw orders, one chunk of days at a time."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="First day to rebuild (YYYY-MM-DD). Defaults to the first order.")
+        parser.add_argument('--until', help="Last day to rebuild (YYYY-MM-DD). Defaults to today.")
+        parser.add_argument('--chunk-days', type=int, default=31, help="Days rebuilt per transaction.")
+
+    def handle(self, *args, **options):
+        if options['since']:
+            since = _parse_date(options['since'])
+        else:
+            first = Order.objects.aggregate(first=Min('created_at'))['first']
+            if first is None:
+                self.stdout.write("No orders, nothing to rebuild.")
+                return
+            since = timezone.localtime(first).date()
+        until = _parse_date(options['until']) if options['until'] else timezone.localdate()
+        step = timedelta(days=max(options['chunk_days'], 1))
+
+        day = since
+        while day <= until:
+            end = min(day + step, until + timedelta(days=1))
+            self.rebuild_chunk(day, end)
+            self.stdout.write(f"Rebuilt {day} .. {end - timedelta(days=1)}")
+            day = end
+
+    @transaction.atomic
+    def rebuild_chunk(self, start_day, end_day):
+        tz = timezone.get_current_timezone()
+        start = datetime.combine(start_day, time.min, tzinfo=tz)
+        end = datetime.combine(end_day, time.min, tzinfo=tz)
+
+        HourlySales.objects.filter(hour__gte=start, hour__lt=end).delete()
+        DailySales.objects.filter(date__gte=start_day, date__lt=end_day).delete()
+        ProductDailySales.objects.filter(date__gte=start_day, date__lt=end_day).delete()
+
+        hours = defaultdict(lambda: {'orders': 0, 'revenue': Decimal('0'), 'payments': Decimal('0')})
+        orders = (
+            Order.objects.created_between(start, end)
+            .annotate(bucket=TruncHour('created_at', tzinfo=tz))
+            .values('bucket')
+            .annotate(orders=Count('id'), revenue=Sum('total'))
+        )
+        for row in orders:
+            hours[row['bucket']]['orders'] = row['orders']
+            hours[row['bucket']]['revenue'] = row['revenue'] or Decimal('0')
+
+        payments = (
+            Payment.objects.filter(recorded_at__gte=start, recorded_at__lt=end)
+            .annotate(bucket=TruncHour('recorded_at', tzinfo=tz))
+            .values('bucket')
+            .annotate(amount=Sum('amount'))
+        )
+        for row in payments:
+            hours[row['bucket']]['payments'] = row['amount'] or Decimal('0')
+
+        days = defaultdict(lambda: {'orders': 0, 'revenue': Decimal('0'), 'payments': Decimal('0')})
+        for hour, values in hours.items():
+            day = timezone.localtime(hour, tz).date()
+            for field, value in values.items():
+                days[day][field] += value
+
+        HourlySales.objects.bulk_create([HourlySales(hour=hour, **values) for hour, values in hours.items()])
+        DailySales.objects.bulk_create([DailySales(date=day, **values) for day, values in days.items()])
+
+        items = (
+            OrderItem.objects.filter(order__created_at__gte=start, order__created_at__lt=end)
+            .annotate(date=TruncDate('order__created_at', tzinfo=tz))
+            .values('date', 'product')
+            .annotate(qty=Sum('quantity'), revenue=Sum(F('quantity') * F('unit_price')))
+        )
+        ProductDailySales.objects.bulk_create(
+            [
+                ProductDailySales(date=row['date'], product_id=row['product'],
+                                  quantity=row['qty'] or 0, revenue=row['revenue'] or Decimal('0'))
+                for row in items.iterator(chunk_size=2000)
+            ],
+            batch_size=1000,
+        )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pos import ledger
+
+
+class Command(BaseCommand):
+    help = "Check Inventory quantities against the stock movement ledger."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help="Reset mismatched inventory quantities to the ledger totals.")
+
+    def handle(self, *args, **options):
+        mismatches = list(ledger.reconcile())
+        for product_id, quantity, total in mismatches:
+            shown = 'no inventory row' if quantity is None else f"inventory {quantity}"
+            self.stdout.write(f"Product {product_id}: {shown}, ledger {total}")
+        if not mismatches:
+            self.stdout.write("Inventory matches the ledger.")
+            return
+        if not options['fix']:
+            raise CommandError(f"{len(mismatches)} products disagree with the ledger.")
+        fixed = ledger.rematerialize({pid: total for pid, quantity, total in mismatches if quantity is not None})
+        self.stdout.write(f"Reset {fixed} inventory rows from the ledger.")
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from project import replica
+
+
+class Command(BaseCommand):
+    help = "Copy the primary database into the read replica with the SQLite backup API."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, help="Keep refreshing every N seconds.")
+
+    def handle(self, *args, **options):
+        while True:
+            took = replica.refresh()
+            self.stdout.write(f"Replica refreshed in {took:.2f}s.")
+            if not options['every']:
+                return
+            time.sleep(max(options['every'] - took, 0))
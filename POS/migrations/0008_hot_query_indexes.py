@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0007_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['status', 'scheduled_at'], name='pos_delivery_status_sched_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['scheduled_at'], name='pos_delivery_scheduled_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventory',
+            index=models.Index(condition=models.Q(('quantity__lte', models.F('low_threshold'))), fields=['product'], name='inventory_low_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='pos_order_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('paid', False)), fields=['created_at'], name='pos_order_unpaid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['recorded_at'], name='pos_payment_recorded_idx'),
+        ),
+    ]
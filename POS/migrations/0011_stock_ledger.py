@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def open_ledger(apps, schema_editor):
+    # Existing stock becomes one opening movement (and snapshot) per product.
+    Inventory = apps.get_model('pos', 'Inventory')
+    StockMovement = apps.get_model('pos', 'StockMovement')
+    StockSnapshot = apps.get_model('pos', 'StockSnapshot')
+    StockMovement.objects.bulk_create(
+        [
+            StockMovement(product_id=product_id, kind='adjustment', quantity=quantity, note='Opening balance')
+            for product_id, quantity in Inventory.objects.exclude(quantity=0).values_list('product_id', 'quantity').iterator()
+        ],
+        batch_size=1000,
+    )
+    StockSnapshot.objects.bulk_create(
+        [
+            StockSnapshot(product_id=m.product_id, through=m.id, quantity=m.quantity, taken_at=m.created_at)
+            for m in StockMovement.objects.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0010_import_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('sale', 'Sale'), ('restock', 'Restock'), ('adjustment', 'Adjustment'), ('return', 'Return')], max_length=20)),
+                ('quantity', models.IntegerField()),
+                ('note', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='stock_movements', to='pos.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'id', 'quantity'], name='pos_stock_movement_ledger_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('through', models.BigIntegerField()),
+                ('quantity', models.IntegerField()),
+                ('taken_at', models.DateTimeField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='stock_snapshots', to='pos.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'taken_at'], name='pos_stock_snapshot_taken_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'through'), name='pos_stock_snapshot_unique')],
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0012_customer_location_driver_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='driver',
+            name='capacity',
+            field=models.PositiveIntegerField(default=20),
+        ),
+        migrations.AddField(
+            model_name='driver',
+            name='shift_end',
+            field=models.TimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='driver',
+            name='shift_start',
+            field=models.TimeField(blank=True, null=True),
+        ),
+    ]
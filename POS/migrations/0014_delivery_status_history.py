@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0013_driver_capacity_shift'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliverySLA',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('delivered', models.IntegerField(default=0)),
+                ('late', models.IntegerField(default=0)),
+                ('p50_seconds', models.FloatField(blank=True, null=True)),
+                ('p90_seconds', models.FloatField(blank=True, null=True)),
+                ('sketch', models.JSONField(default=dict)),
+                ('driver', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sla', to='pos.driver')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'driver'), name='unique_delivery_sla'), models.UniqueConstraint(condition=models.Q(('driver__isnull', True)), fields=('day',), name='unique_delivery_sla_all_drivers')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DeliveryStatusTransition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('pos', 'POS delivery'), ('tracking', 'Delivery tracking')], max_length=10)),
+                ('from_status', models.CharField(blank=True, max_length=20)),
+                ('to_status', models.CharField(max_length=20)),
+                ('at', models.DateTimeField(auto_now_add=True)),
+                ('delivery', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transitions', to='pos.delivery')),
+                ('driver', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='pos.driver')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['delivery', 'at'], name='pos_delivery_transition_idx')],
+            },
+        ),
+    ]
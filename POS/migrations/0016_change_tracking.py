@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:19
+
+from django.db import migrations, models
+from django.utils import timezone
+
+# Tables whose manager is a TrackedQuerySet.
+TRACKED_TABLES = [
+    'pos_customer', 'pos_product', 'pos_inventory', 'pos_driver', 'pos_delivery', 'pos_order',
+    'pos_orderitem', 'pos_payment', 'pos_deliverysla', 'deliveries_delivery', 'notifications_notification',
+]
+
+
+def seed_stamps(apps, schema_editor):
+    # Clients cannot hold validators from before this, so one common start is enough.
+    TableStamp = apps.get_model('pos', 'TableStamp')
+    now = timezone.now()
+    TableStamp.objects.bulk_create([TableStamp(table=table, version=1, changed_at=now) for table in TRACKED_TABLES])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0015_customer_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableStamp',
+            fields=[
+                ('table', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+                ('changed_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='delivery',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='driver',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='inventory',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(seed_stamps, migrations.RunPython.noop),
+    ]
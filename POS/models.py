@@ -1,14 +1,89 @@
 
-from django.db import models
+from datetime import datetime, time, timedelta
+
+from django.db import models, transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
 from django.utils import timezone
 from django.contrib.auth.models import User
 
+
+def day_range(day):
+    """Aware ``[start, end)`` datetimes for a local date, for index-friendly range filters."""
+    start = datetime.combine(day, time.min, tzinfo=timezone.get_current_timezone())
+    return start, start + timedelta(days=1)
+
+
+class TrackedQuerySet(models.QuerySet):
+    """Sets ``updated_at`` and moves the table's ``TableStamp`` on queryset writes, for pos.changes.
+
+    Saves and deletes are tracked from pos.signals; bulk_update() runs through update().
+    """
+
+    def _touch(self):
+        from . import changes
+
+        changes.touch(self.model, using=self.db)
+
+    def update(self, **kwargs):
+        if hasattr(self.model, 'updated_at'):
+            kwargs.setdefault('updated_at', timezone.now())
+        with transaction.atomic(using=self.db):
+            count = super().update(**kwargs)
+            if count:
+                self._touch()
+        return count
+
+    def bulk_create(self, objs, *args, **kwargs):
+        if kwargs.get('update_fields') and hasattr(self.model, 'updated_at'):
+            kwargs['update_fields'] = [*kwargs['update_fields'], 'updated_at']
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            if created:
+                self._touch()
+        return created
+
+
+class StampedQuerySet(TrackedQuerySet):
+    """Also moves the model's ``pos.versions`` stamp after queryset writes, for pos.pagecache.
+
+    Saves and deletes move it from pos.signals.
+    """
+    stamp = None  # defaults to the model name
+
+    def _stamp(self):
+        from . import versions
+
+        versions.bump_on_commit(self.stamp or self.model._meta.model_name, using=self.db)
+
+    def update(self, **kwargs):
+        count = super().update(**kwargs)
+        self._stamp()
+        return count
+
+    def bulk_create(self, objs, *args, **kwargs):
+        created = super().bulk_create(objs, *args, **kwargs)
+        self._stamp()
+        return created
+
+
 class Customer(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, default=None, null=True, blank=True)
     name = models.CharField(max_length=200)
     phone = models.CharField(max_length=50, blank=True)
     address = models.TextField(blank=True)
+    # Delivery location (WGS84), entered by hand or imported; used by pos.routeplan.
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TrackedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='pos_customer_created_idx'),
+            models.Index(fields=['phone'], name='pos_customer_phone_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.phone})"
@@ -19,28 +94,218 @@ class Product(models.Model):
     sku = models.CharField(max_length=100, blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = StampedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sku'], name='pos_product_sku_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class InventoryQuerySet(TrackedQuerySet):
+    # Writes to the stock columns are diffed so pos.stock can publish deltas
+    # and threshold crossings; this covers F() expressions and bulk writes
+    # (bulk_update() runs through update()).
+
+    def low_stock(self):
+        return self.filter(quantity__lte=F('low_threshold'))
+
+    def update(self, **kwargs):
+        from . import stock
+
+        if not stock.STOCK_FIELDS & kwargs.keys():
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            before = stock.levels(self)
+            count = super().update(**kwargs)
+            stock.record(before, stock.levels(self.model.objects.filter(pk__in=before)))
+        return count
+
+    def move(self, deltas, kind, note=''):
+        """Add ``{product_id: delta}`` to stock as ``kind`` movements; return the number of rows updated.
+
+        Writes before reading (see pos.checkout) and works the old levels out
+        from the deltas.
+        """
+        from . import stock
+
+        with transaction.atomic(using=self.db):
+            count = TrackedQuerySet.update(
+                self.filter(product_id__in=deltas),
+                quantity=F('quantity') + Case(
+                    *[When(product_id=pid, then=Value(delta)) for pid, delta in deltas.items()],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                ),
+            )
+            after = stock.levels(self.model.objects.filter(product_id__in=deltas))
+            before = {pk: {**row, 'quantity': row['quantity'] - deltas[row['product']]}
+                      for pk, row in after.items()}
+            stock.record(before, after, kind=kind, note=note)
+        return count
+
+    def take(self, quantities, note=''):
+        """Subtract ``{product_id: quantity}`` from stock as sales."""
+        return self.move({pid: -qty for pid, qty in quantities.items()}, StockMovement.SALE, note)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from . import stock
+
+        objs = list(objs)
+        product_ids = [obj.product_id for obj in objs]
+        with transaction.atomic(using=self.db):
+            before = stock.levels(self.model.objects.filter(product_id__in=product_ids))
+            created = super().bulk_create(objs, *args, **kwargs)
+            stock.record(before, stock.levels(self.model.objects.filter(product_id__in=product_ids)))
+        return created
+
+
 class Inventory(models.Model):
     product = models.OneToOneField(Product, on_delete=models.CASCADE)
     quantity = models.IntegerField(default=0)
     low_threshold = models.IntegerField(default=5)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = InventoryQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Partial index: only the (few) rows at or below threshold are indexed.
+            models.Index(fields=['product'], name='inventory_low_stock_idx',
+                         condition=Q(quantity__lte=F('low_threshold'))),
+        ]
 
     def __str__(self):
         return f"{self.product.name}: {self.quantity}"
 
 
+class AppendOnlyQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        raise TypeError(f"{self.model.__name__} rows are append-only")
+
+    def delete(self):
+        raise TypeError(f"{self.model.__name__} rows are append-only")
+
+
+class AppendOnly(models.Model):
+    """Rows are inserted once and never changed or deleted.
+
+    Deleting a parent still cascades: the collector removes related rows
+    with raw deletes, not through these methods.
+    """
+    objects = AppendOnlyQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise TypeError(f"{type(self).__name__} rows are append-only")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise TypeError(f"{type(self).__name__} rows are append-only")
+
+
+class StockMovement(AppendOnly):
+    """Append-only stock ledger; ``Inventory.quantity`` is its running total.
+
+    Rows are written by pos.stock for every change to an inventory quantity
+    and never changed afterwards. ``quantity`` is signed.
+
+    ``product`` is PROTECT, like ``OrderItem.product``: a product with stock
+    history cannot be deleted (``ProtectedError``), since its ledger and
+    snapshots would go with it. Only products never stocked can be deleted.
+    """
+    SALE = 'sale'
+    RESTOCK = 'restock'
+    ADJUSTMENT = 'adjustment'
+    RETURN = 'return'
+    KIND_CHOICES = [
+        (SALE, 'Sale'),
+        (RESTOCK, 'Restock'),
+        (ADJUSTMENT, 'Adjustment'),
+        (RETURN, 'Return'),
+    ]
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='stock_movements')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    quantity = models.IntegerField()
+    note = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Covers both the ledger tail after a snapshot and the grouped reconcile sum.
+            models.Index(fields=['product', 'id', 'quantity'], name='pos_stock_movement_ledger_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.quantity:+} {self.product_id}"
+
+
+class StockSnapshot(models.Model):
+    """Stock of a product once all movements up to ``through`` (inclusive) are applied.
+
+    Written by ``manage.py compact_stock_ledger``; point-in-time stock is the
+    latest snapshot taken by then plus the ledger tail after it.
+    """
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='stock_snapshots')
+    through = models.BigIntegerField()
+    quantity = models.IntegerField()
+    taken_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'through'], name='pos_stock_snapshot_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'taken_at'], name='pos_stock_snapshot_taken_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.quantity} through #{self.through}"
+
+
 class Driver(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, default=None, null=True, blank=True)
     name = models.CharField(max_length=200)
     phone = models.CharField(max_length=50, blank=True)
+    # Used by pos.dispatch: most open deliveries at once, and the daily shift
+    # (local time; may wrap past midnight; empty means any time).
+    capacity = models.PositiveIntegerField(default=20)
+    shift_start = models.TimeField(null=True, blank=True)
+    shift_end = models.TimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = StampedQuerySet.as_manager()
 
     def __str__(self):
         return self.name
 
 
+class DeliveryQuerySet(StampedQuerySet):
+    # Status changes made with update()/bulk_update() are recorded by pos.sla too.
+    def update(self, **kwargs):
+        from . import sla
+
+        if 'status' not in kwargs:
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            before = dict(self.values_list('id', 'status'))
+            count = super().update(**kwargs)
+            after = self.model.objects.filter(pk__in=before).values_list('id', 'status', 'driver_id')
+            sla.record(
+                [(pk, before[pk], status, driver_id) for pk, status, driver_id in after if status != before[pk]],
+                DeliveryStatusTransition.POS,
+            )
+        return count
+
+
 class Delivery(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -53,27 +318,91 @@ class Delivery(models.Model):
     driver = models.ForeignKey(Driver, on_delete=models.SET_NULL, null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     notes = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = DeliveryQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'scheduled_at'], name='pos_delivery_status_sched_idx'),
+            models.Index(fields=['scheduled_at'], name='pos_delivery_scheduled_idx'),
+        ]
 
     def __str__(self):
         return f"Delivery for Order #{self.order.id} - {self.status}"
 
 
+class DeliveryStatusTransition(AppendOnly):
+    """One status change of a delivery, from the POS or the driver's tracking form.
+
+    Written by pos.sla on every save and queryset update, always in POS
+    statuses; ``from_status`` is empty for the status a delivery was created
+    with.
+    """
+    POS = 'pos'
+    TRACKING = 'tracking'
+    SOURCE_CHOICES = [
+        (POS, 'POS delivery'),
+        (TRACKING, 'Delivery tracking'),
+    ]
+    delivery = models.ForeignKey(Delivery, on_delete=models.CASCADE, related_name='transitions')
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES)
+    from_status = models.CharField(max_length=20, blank=True)
+    to_status = models.CharField(max_length=20)
+    driver = models.ForeignKey(Driver, on_delete=models.SET_NULL, null=True, blank=True)
+    at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['delivery', 'at'], name='pos_delivery_transition_idx'),
+        ]
+
+    def __str__(self):
+        return f"Delivery #{self.delivery_id}: {self.from_status or '-'} -> {self.to_status}"
+
+
+class OrderQuerySet(StampedQuerySet):
+    def created_between(self, start, end):
+        return self.filter(created_at__gte=start, created_at__lt=end)
+
+    def created_on(self, day):
+        # Range instead of created_at__date so the created_at index is usable.
+        return self.created_between(*day_range(day))
+
+
 class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     paid = models.BooleanField(default=False)
+    idempotency_key = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='pos_order_created_idx'),
+            # filter(paid=False) compiles to NOT "paid", which only a partial index can serve.
+            models.Index(fields=['created_at'], name='pos_order_unpaid_idx', condition=Q(paid=False)),
+        ]
 
     def __str__(self):
         return f"Order #{self.id} - {self.customer or 'Walk-in'}"
 
 
+class OrderItemQuerySet(StampedQuerySet):
+    stamp = 'order'
+
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
     quantity = models.IntegerField(default=1)
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
 
+    objects = OrderItemQuerySet.as_manager()
+
     def line_total(self):
         return self.quantity * self.unit_price
 
@@ -91,6 +420,14 @@ class Payment(models.Model):
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     method = models.CharField(max_length=20, choices=PAYMENT_METHODS, default='cash')
     recorded_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = StampedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['recorded_at'], name='pos_payment_recorded_idx'),
+        ]
 
     def __str__(self):
         return f"{self.method} {self.amount} on Order #{self.order.id}"
@@ -112,4 +449,86 @@ class Admin(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"{self.full_name} (Admin)"
\ No newline at end of file
+        return f"{self.full_name} (Admin)"
+
+# Sales rollups, maintained incrementally by pos.rollups and rebuilt by
+# `manage.py rebuild_rollups`. Reports read these instead of raw orders.
+
+class HourlySales(models.Model):
+    hour = models.DateTimeField(unique=True)
+    orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    payments = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H}:00 - {self.revenue}"
+
+
+class DailySales(models.Model):
+    date = models.DateField(unique=True)
+    orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    payments = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.date} - {self.revenue}"
+
+
+class ProductDailySales(models.Model):
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product'], name='unique_product_daily_sales'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.product_id} x{self.quantity}"
+
+
+class DeliverySLA(models.Model):
+    """Delivery times for a day and driver (``driver`` empty: all drivers), kept by pos.sla.
+
+    ``sketch`` is a mergeable quantile sketch of the seconds from pending to
+    delivered; p50/p90 are read from it whenever it changes.
+    """
+    day = models.DateField()
+    driver = models.ForeignKey(Driver, on_delete=models.CASCADE, null=True, blank=True, related_name='sla')
+    delivered = models.IntegerField(default=0)
+    late = models.IntegerField(default=0)
+    p50_seconds = models.FloatField(null=True, blank=True)
+    p90_seconds = models.FloatField(null=True, blank=True)
+    sketch = models.JSONField(default=dict)
+
+    objects = TrackedQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'driver'], name='unique_delivery_sla'),
+            models.UniqueConstraint(fields=['day'], condition=Q(driver__isnull=True),
+                                    name='unique_delivery_sla_all_drivers'),
+        ]
+
+    @property
+    def late_share(self):
+        return self.late / self.delivered if self.delivered else 0
+
+    def __str__(self):
+        return f"{self.day} {self.driver_id or 'all'}: {self.delivered} delivered"
+
+
+class TableStamp(models.Model):
+    """When a table last changed, for conditional GETs (see pos.changes).
+
+    ``version`` goes up by one on every write to the table, in the writing
+    transaction; ``changed_at`` is the time of the latest one.
+    """
+    table = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    changed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.table} v{self.version} at {self.changed_at}"
@@ -0,0 +1,266 @@
+"""Outbound stage for the live dashboard websocket consumers.
+
+Group events are built with ``group_event()``, which serialises the payload
+to JSON once when the event is published; every recipient forwards that
+string instead of calling ``json.dumps`` itself. Consumers using
+``CoalescingConsumerMixin`` hold incoming events for ``flush_interval``
+seconds, keep only the newest event per ``entity`` (say ``delivery:12``),
+and send whatever is left. Consumers whose clients understand it
+(``batch_frames``, the staff dashboard in ``base.html``) get it as one
+``{"type": "batch", "events": [...]}`` frame spliced together from the
+pre-serialised parts; the others get one frame per event.
+
+Clients that offer the ``pos.msgpack`` subprotocol get binary msgpack
+frames instead, when msgpack is installed. The packed form is cached on the
+message the channel layer delivers: the Unix socket layer hands one decoded
+message to all of a process's consumers, so it is packed once per process,
+but the in-memory layer deep-copies the message for every recipient, so
+there each recipient copies the event and packs its own.
+
+Events sent through the outbox carry their group's sequence number, which
+consumers use to replay what a reconnecting client missed (see
+``pos.replay``), to drop duplicates and to forward each group in order:
+an event that arrives ahead of a missing one is held back until the gap
+closes, and if it has not closed within ``GAP_TIMEOUT`` the missing events
+are read from the outbox log. When they are gone (pruned, or given up on by
+the dispatcher) or too many events are held, the client gets a ``resync``
+frame for the group instead.
+"""
+import asyncio
+import json
+
+from channels.db import database_sync_to_async
+
+try:
+    import msgpack
+except ImportError:  # the binary subprotocol is optional
+    msgpack = None
+
+from . import replay
+
+FLUSH_INTERVAL = 0.1
+GAP_TIMEOUT = 1.0
+MAX_HELD = 500
+MSGPACK_SUBPROTOCOL = 'pos.msgpack'
+
+
+def _dumps(payload):
+    return json.dumps(payload, separators=(',', ':'))
+
+
+def group_event(payload, entity=None):
+    """A group message carrying ``payload`` already serialised for every recipient.
+
+    Events with the same ``entity`` replace each other within a flush interval.
+    """
+    event = {'type': 'outbound.event', 'payload': payload, 'frame': _dumps(payload)}
+    if entity is not None:
+        event['entity'] = entity
+    return event
+
+
+def notification(title, message, entity=None):
+    return group_event({'title': title, 'message': message}, entity)
+
+
+def sequenced(event, group, seq):
+    """``event`` stamped with its group and sequence number, serialised again once."""
+    if seq is None:
+        return event
+    event = _prepared(dict(event))
+    payload = {**event['payload'], 'group': group, 'seq': seq}
+    stamped = {k: v for k, v in event.items() if k != 'packed'}
+    stamped.update(payload=payload, frame=_dumps(payload), group=group, seq=seq)
+    return stamped
+
+
+def _prepared(event):
+    # Events published without group_event() (e.g. queued before it existed).
+    if 'frame' not in event:
+        event['payload'] = {k: v for k, v in event.items() if k != 'type'}
+        event['frame'] = _dumps(event['payload'])
+    return event
+
+
+def json_frame(events):
+    if len(events) == 1:
+        return events[0]['frame']
+    return '{"type":"batch","events":[' + ','.join(event['frame'] for event in events) + ']}'
+
+
+def _packed(event):
+    packed = event.get('packed')
+    if packed is None:
+        packed = event['packed'] = msgpack.packb(event['payload'])
+    return packed
+
+
+def msgpack_frame(events):
+    if len(events) == 1:
+        return _packed(events[0])
+    packer = msgpack.Packer()
+    return (
+        packer.pack_map_header(2) + packer.pack('type') + packer.pack('batch')
+        + packer.pack('events') + packer.pack_array_header(len(events))
+        + b''.join(_packed(event) for event in events)
+    )
+
+
+class CoalescingConsumerMixin:
+    """Mix into an ``AsyncWebsocketConsumer``; accept with ``accept_outbound(*groups)``."""
+    flush_interval = FLUSH_INTERVAL
+    batch_frames = False  # the client unpacks {"type": "batch"} frames
+    binary = False
+    _pending = None
+    _flush_handle = None
+    _seen = None  # group -> sequence number forwarded last, with none missing before it
+    _held = None  # group -> {seq: event} that arrived ahead of a missing one
+    _gap_handles = None  # group -> timer to look up the missing events
+    _replay_groups = ()
+
+    async def accept_outbound(self, *groups):
+        """Accept, then bring the client up to date on ``groups`` (already joined).
+
+        Group messages are not dispatched to the consumer until ``connect``
+        returns, so live events never overtake the replayed ones.
+        """
+        offered = self.scope.get('subprotocols') or []
+        self.binary = msgpack is not None and MSGPACK_SUBPROTOCOL in offered
+        await self.accept(MSGPACK_SUBPROTOCOL if self.binary else None)
+        self._replay_groups = groups
+        if groups:
+            wanted = replay.requested_seqs(self.scope)
+            seqs, events, resync = await replay.catch_up(groups, wanted)
+            await self.send_control({'type': 'hello', 'seqs': seqs})
+            for group in resync:
+                await self.send_control({'type': 'resync', 'group': group})
+            # Replayed events run from where the client was up to seqs.
+            self._seen = {
+                group: wanted[group] if group in wanted and group not in resync else seqs[group]
+                for group in groups
+            }
+            for event in events:
+                self.push(event)
+            replay.joined(groups)
+
+    async def send_control(self, payload):
+        if self.binary:
+            await self.send(bytes_data=msgpack.packb(payload))
+        else:
+            await self.send(text_data=_dumps(payload))
+
+    async def outbound_event(self, event):
+        self.push(event)
+
+    # Handlers for events in the older {'type': 'send_notification', ...} shape.
+    async def send_notification(self, event):
+        self.push(event)
+
+    def push(self, event):
+        event = _prepared(event)
+        seq = event.get('seq')
+        if seq is None:
+            self._queue(event)
+            return
+        group = event['group']
+        if self._seen is None:
+            self._seen = {}
+        if self._held is None:
+            self._held, self._gap_handles = {}, {}
+        seen = self._seen.setdefault(group, seq - 1)
+        if seq <= seen:
+            return  # already replayed or delivered
+        if seq > seen + 1:
+            held = self._held.setdefault(group, {})
+            held[seq] = event
+            if len(held) > MAX_HELD:
+                asyncio.ensure_future(self._resync(group))
+            elif group not in self._gap_handles:
+                self._gap_handles[group] = asyncio.get_running_loop().call_later(
+                    GAP_TIMEOUT, lambda: asyncio.ensure_future(self._fill_gap(group)),
+                )
+            return
+        self._release(group, event)
+
+    def _release(self, group, event):
+        """Forward ``event``, the next one in ``group``, and whatever was held behind it."""
+        held = self._held.get(group) or {}
+        while event is not None:
+            self._seen[group] = event['seq']
+            replay.record(event)
+            self._queue(event)
+            event = held.pop(event['seq'] + 1, None)
+        if not held:
+            self._held.pop(group, None)
+            handle = self._gap_handles.pop(group, None)
+            if handle is not None:
+                handle.cancel()
+
+    async def _fill_gap(self, group):
+        if self._held is None:
+            return  # disconnected
+        self._gap_handles.pop(group, None)
+        if not self._held.get(group):
+            return
+        events, ends = await database_sync_to_async(replay.sent_after)(group, self._seen[group])
+        if self._held is None:
+            return  # disconnected meanwhile
+        for event in events:
+            # Live events may have closed part of the gap in the meantime.
+            if self._held.get(group) and event['seq'] == self._seen[group] + 1:
+                self._release(group, event)
+        if not self._held.get(group):
+            return
+        if ends == replay.PENDING:
+            self._gap_handles[group] = asyncio.get_running_loop().call_later(
+                GAP_TIMEOUT, lambda: asyncio.ensure_future(self._fill_gap(group)),
+            )
+        else:
+            await self._resync(group)
+
+    async def _resync(self, group):
+        """Give up on the gap: the client reloads the group's data and we carry on after what is held."""
+        if self._held is None:
+            return  # disconnected
+        held = self._held.pop(group, None)
+        handle = self._gap_handles.pop(group, None)
+        if handle is not None:
+            handle.cancel()
+        if not held:
+            return
+        self._seen[group] = max(held)
+        await self.send_control({'type': 'resync', 'group': group})
+
+    def _queue(self, event):
+        if self._pending is None:
+            self._pending = {}
+        key = event.get('entity') or object()
+        self._pending.pop(key, None)  # re-inserted so the newest update keeps its place last
+        self._pending[key] = event
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(
+                self.flush_interval, lambda: asyncio.ensure_future(self.flush_outbound()),
+            )
+
+    async def flush_outbound(self):
+        self._flush_handle = None
+        if not self._pending:
+            return
+        events = list(self._pending.values())
+        self._pending = {}
+        for frame in ([events] if self.batch_frames else [[event] for event in events]):
+            if self.binary:
+                await self.send(bytes_data=msgpack_frame(frame))
+            else:
+                await self.send(text_data=json_frame(frame))
+
+    def stop_outbound(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        for handle in (self._gap_handles or {}).values():
+            handle.cancel()
+        self._pending = self._held = self._gap_handles = None
+        replay.left(self._replay_groups)
+        self._replay_groups = ()
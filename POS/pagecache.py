@@ -0,0 +1,154 @@
+"""Cache of rendered POS pages and template fragments, invalidated by version stamps.
+
+``cached_view`` keys a response on the viewer's roles, the page's URL and
+format, and the ``pos.versions`` stamps of the data it shows; the
+``{% fragment %}`` tag (``pagecache_tags``) does the same for a piece of a
+template. Writes move the stamps once they commit:
+
+* ``order``, ``payment``, ``delivery`` and ``driver`` from ``pos.signals``
+  and ``StampedQuerySet`` (queryset updates and bulk creates),
+* ``product`` from ``pos.search`` and ``StampedQuerySet``,
+* ``inventory`` from ``pos.stock``.
+
+So an entry is never served after a write to what it shows, and entries
+need no timeout: superseded keys are simply never read again and get culled.
+
+The stamps are read before the view runs, so a render racing a write is
+stored under the stamps from before the write and cannot outlive it. Views
+reading the replica (``project.replica.use_replica``) also key on the
+replica copy they read.
+
+Hits and misses are counted per page in each process and added to shared
+counters every ``FLUSH_EVERY`` lookups; ``stats()`` reports them.
+"""
+import functools
+import hashlib
+import threading
+from collections import Counter
+
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from project import replica
+from . import versions
+from .pagination import wants_json
+from .roles import get_roles
+
+STATS_KEY = 'pagecache:stats:{name}:{outcome}'
+FLUSH_EVERY = 100
+
+_counts = Counter()  # (name, 'hits' | 'misses') -> lookups not yet added to the cache
+_lock = threading.Lock()
+
+# Cached views and fragments, for stats().
+NAMES = set()
+
+
+def snapshot(request, *names):
+    """Read the named stamps for this request, before it reads any data."""
+    stamps = getattr(request, 'page_stamps', None)
+    if stamps is None:
+        stamps = request.page_stamps = {}
+    missing = [name for name in names if name not in stamps]
+    if missing:
+        stamps.update(versions.get_versions(*missing))
+    return stamps
+
+
+def with_stamps(*stamp_names):
+    """Take the stamps for a view that is not cached whole but has ``{% fragment %}`` blocks."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            snapshot(request, *stamp_names)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def make_key(kind, name, request, stamp_names, *vary):
+    stamps = getattr(request, 'page_stamps', {})
+    parts = [
+        ','.join(sorted(get_roles(request.user))),
+        '-'.join(f"{stamp}.{stamps[stamp]}" for stamp in stamp_names),
+        str(replica.reading_from() or ''),
+        *map(str, vary),
+    ]
+    digest = hashlib.md5('|'.join(parts).encode(), usedforsecurity=False).hexdigest()
+    return f"pagecache:{kind}:{name}:{digest}"
+
+
+def count(name, hit):
+    outcome = 'hits' if hit else 'misses'
+    with _lock:
+        _counts[(name, outcome)] += 1
+        if sum(_counts.values()) < FLUSH_EVERY:
+            return
+        pending = dict(_counts)
+        _counts.clear()
+    _add(pending)
+
+
+def _add(pending):
+    for (name, outcome), value in pending.items():
+        key = STATS_KEY.format(name=name, outcome=outcome)
+        if not cache.add(key, value, None):
+            try:
+                cache.incr(key, value)
+            except ValueError:  # culled in between
+                cache.set(key, value, None)
+
+
+def stats(names=None):
+    """``{name: {'hits', 'misses', 'hit_rate'}}`` over all processes, this one flushed first."""
+    names = sorted(NAMES if names is None else names)
+    with _lock:
+        pending = dict(_counts)
+        _counts.clear()
+    _add(pending)
+    keys = {
+        STATS_KEY.format(name=name, outcome=outcome): (name, outcome)
+        for name in names for outcome in ('hits', 'misses')
+    }
+    found = cache.get_many(list(keys))
+    result = {name: {'hits': 0, 'misses': 0} for name in names}
+    for key, (name, outcome) in keys.items():
+        result[name][outcome] = found.get(key, 0)
+    for row in result.values():
+        lookups = row['hits'] + row['misses']
+        row['hit_rate'] = round(row['hits'] / lookups, 4) if lookups else None
+    return result
+
+
+def cached_view(*stamp_names, vary=None):
+    """Serve the view from the cache until one of ``stamp_names`` moves.
+
+    ``vary(request)`` is added to the key for pages that depend on more than
+    their data, e.g. ``timezone.localdate()`` for a page showing "today".
+    Responses that set cookies or use a CSRF token (per-user forms) are not
+    stored; such pages can still cache their heavy parts with ``{% fragment %}``.
+    Put it below ``use_replica`` so replica reads are part of the key.
+    """
+    def decorator(view):
+        name = view.__name__
+        NAMES.add(name)
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            snapshot(request, *stamp_names)
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            key = make_key('view', name, request, stamp_names, request.get_full_path(), wants_json(request),
+                           vary(request) if vary is not None else '')
+            cached = cache.get(key)
+            count(name, cached is not None)
+            if cached is not None:
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+            response = view(request, *args, **kwargs)
+            if (response.status_code == 200 and not response.streaming and not response.cookies
+                    and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')):
+                cache.set(key, (response.content, response['Content-Type']), None)
+            return response
+        return wrapper
+    return decorator
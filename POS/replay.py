@@ -0,0 +1,169 @@
+"""Replay of missed websocket events for reconnecting clients.
+
+Every event sent through the outbox carries ``group`` and ``seq``. Clients
+remember the highest ``seq`` they saw per group and reconnect with
+``?last_seq=<group>:<seq>`` (repeated per group). The consumer then sends
+what they missed: first from this process's ring of recent events per
+group, otherwise from the retained outbox rows. If the gap is larger than
+``MAX_REPLAY`` or reaches back past what is retained, the client gets a
+``{"type": "resync", "group": ...}`` frame and reloads that data instead.
+
+Consumers also use the log to fill a gap in live delivery: several
+dispatchers, concurrent sends and retries can deliver a group's events out
+of order, so a consumer holds early arrivals and, if the gap does not close
+by itself, looks the missing events up with ``sent_after()``.
+"""
+from collections import OrderedDict, deque
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+
+from notifications.models import GroupSequence, OutboxEvent
+from . import outbound
+
+RING_SIZE = 256
+MAX_RINGS = 1000
+MAX_REPLAY = 500
+
+_rings = OrderedDict()  # group -> deque of recent sequenced events, least recently used first
+_members = {}  # group -> consumers in this process; a ring is only complete while this is > 0
+
+
+def joined(groups):
+    for group in groups:
+        _members[group] = _members.get(group, 0) + 1
+
+
+def left(groups):
+    for group in groups:
+        count = _members.get(group, 0) - 1
+        if count > 0:
+            _members[group] = count
+        else:
+            # Nobody here receives the group any more, so the ring would fall behind.
+            _members.pop(group, None)
+            _rings.pop(group, None)
+
+
+def record(event):
+    """Remember a delivered event; called on the event loop by the consumers."""
+    group, seq = event['group'], event['seq']
+    if group not in _members:
+        return
+    ring = _rings.get(group)
+    if ring is None:
+        ring = _rings[group] = deque(maxlen=RING_SIZE)
+        if len(_rings) > MAX_RINGS:
+            _rings.popitem(last=False)
+    else:
+        _rings.move_to_end(group)
+    if ring and seq > ring[-1]['seq'] + 1:
+        ring.clear()  # a consumer skipped ahead after a resync; keep the ring without holes
+    if not ring or seq > ring[-1]['seq']:
+        ring.append(event)
+
+
+def from_ring(group, last):
+    """Events after ``last`` if the ring still reaches back that far, else ``None``."""
+    ring = _rings.get(group)
+    if not ring or ring[0]['seq'] > last + 1:
+        return None
+    return [event for event in ring if event['seq'] > last]
+
+
+def requested_seqs(scope):
+    wanted = {}
+    query = parse_qs(scope.get('query_string', b'').decode())
+    for value in query.get('last_seq', []):
+        group, _, seq = value.rpartition(':')
+        if group and seq.isdigit():
+            wanted[group] = int(seq)
+    return wanted
+
+
+def start_seq(group):
+    """Where a client joining now starts: the last seq with every event up to it sent."""
+    from notifications.outbox import MAX_ATTEMPTS
+
+    # Read first: an event committed after this is delivered live.
+    published = GroupSequence.objects.filter(group=group).values_list('last_seq', flat=True).first() or 0
+    unsent = (
+        OutboxEvent.objects.filter(group=group, sent_at__isnull=True, attempts__lt=MAX_ATTEMPTS)
+        .order_by('seq').values_list('seq', flat=True).first()
+    )
+    return published if unsent is None else min(published, unsent - 1)
+
+
+# How a run of events from sent_after() ends.
+END = 'end'          # nothing has been published after them
+PENDING = 'pending'  # the next event is still on its way through the dispatcher
+LOST = 'lost'        # the next event was pruned or given up on, or too many follow
+
+
+def sent_after(group, last):
+    """``(events, how_it_ends)``: sent events following ``last`` with no seq missing."""
+    from notifications.outbox import MAX_ATTEMPTS
+
+    rows = OutboxEvent.objects.filter(group=group, seq__gt=last).order_by('seq').values_list(
+        'seq', 'payload', 'sent_at', 'attempts',
+    )[:MAX_REPLAY + 1]
+    events = []
+    for seq, payload, sent_at, attempts in rows:
+        if seq != last + len(events) + 1 or len(events) == MAX_REPLAY:
+            return events, LOST
+        if sent_at is None:
+            return events, LOST if attempts >= MAX_ATTEMPTS else PENDING
+        events.append(outbound.sequenced(payload, group, seq))
+    reached = last + len(events)
+    published = GroupSequence.objects.filter(group=group).values_list('last_seq', flat=True).first() or 0
+    if reached == published:
+        return events, END
+    if reached < published and OutboxEvent.objects.filter(group=group, seq=reached + 1).exists():
+        return events, PENDING  # committed since the rows were read
+    # Later events were pruned, or the client is ahead of us (say after a database reset).
+    return events, LOST
+
+
+def from_log(group, last):
+    """Sent events after ``last`` from the outbox, or ``None`` if a resync is needed.
+
+    Events still on their way are left to arrive live.
+    """
+    events, ends = sent_after(group, last)
+    return None if ends == LOST else events
+
+
+def _catch_up_from_db(groups, wanted):
+    seqs, events, resync = {}, [], []
+    for group in groups:
+        last = wanted.get(group)
+        missed = None if last is None else from_log(group, last)
+        if missed is None:
+            if last is not None:
+                resync.append(group)
+            seqs[group] = start_seq(group)
+        else:
+            events.extend(missed)
+            seqs[group] = missed[-1]['seq'] if missed else last
+    return seqs, events, resync
+
+
+async def catch_up(groups, wanted):
+    """Return ``(seqs, events, resync_groups)`` for a client joining ``groups``.
+
+    ``seqs`` is where the client stands afterwards in each group.
+    """
+    seqs, events, rest = {}, [], []
+    for group in groups:
+        missed = from_ring(group, wanted[group]) if group in wanted else None
+        if missed is None:
+            rest.append(group)
+        else:
+            events.extend(missed)
+            seqs[group] = missed[-1]['seq'] if missed else wanted[group]
+    resync = []
+    if rest:
+        db_seqs, db_events, resync = await database_sync_to_async(_catch_up_from_db)(rest, wanted)
+        seqs.update(db_seqs)
+        events.extend(db_events)
+    return seqs, events, resync
@@ -0,0 +1,59 @@
+"""Role resolution shared by views, template filters and websocket consumers.
+
+A user's group names are loaded once and memoised on the user object, so a
+request (or a websocket connection, whose scope user lives as long as the
+socket) pays for at most one lookup. Between processes the names are shared
+through the cache under a per-user version that ``pos.signals`` bumps whenever
+``User.groups`` changes.
+"""
+import time
+
+from django.core.cache import cache
+
+ROLE_CACHE_TIMEOUT = 60 * 60 * 24
+_MEMO_ATTR = '_pos_roles'
+
+
+def _version_key(user_id):
+    return f"roles:ver:{user_id}"
+
+
+def _roles_key(user_id, version):
+    return f"roles:{user_id}:{version}"
+
+
+def get_roles(user):
+    """Return the frozenset of group names for ``user``."""
+    if user is None or not user.is_authenticated:
+        return frozenset()
+
+    roles = getattr(user, _MEMO_ATTR, None)
+    if roles is not None:
+        return roles
+
+    version_key = _version_key(user.pk)
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, time.time_ns(), ROLE_CACHE_TIMEOUT)
+        version = cache.get(version_key)
+
+    roles_key = _roles_key(user.pk, version)
+    names = cache.get(roles_key)
+    if names is None:
+        names = list(user.groups.values_list('name', flat=True))
+        cache.set(roles_key, names, ROLE_CACHE_TIMEOUT)
+
+    roles = frozenset(names)
+    setattr(user, _MEMO_ATTR, roles)
+    return roles
+
+
+def has_role(user, *names):
+    """True when ``user`` belongs to any of the given groups."""
+    return not get_roles(user).isdisjoint(names)
+
+
+def invalidate_roles(*user_ids):
+    """Move the given users to a fresh cache version."""
+    version = time.time_ns()
+    cache.set_many({_version_key(uid): version for uid in user_ids}, ROLE_CACHE_TIMEOUT)
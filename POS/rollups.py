@@ -0,0 +1,132 @@
+"""Incremental maintenance of the sales rollup tables.
+
+Each change to an ``Order``, ``OrderItem`` or ``Payment`` is turned into
+deltas against ``HourlySales``, ``DailySales`` and ``ProductDailySales``
+and applied with a single ``INSERT ... ON CONFLICT DO UPDATE`` per table, so
+concurrent writers add to the same row instead of overwriting it.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection
+from django.utils import timezone
+
+from .models import DailySales, HourlySales, ProductDailySales
+
+ZERO = Decimal('0')
+
+
+def hour_bucket(moment):
+    return timezone.localtime(moment).replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(moment):
+    return timezone.localtime(moment).date()
+
+
+def _accumulate(model, key_fields, value_fields, rows):
+    """Add ``rows`` (tuples of key values then deltas) onto ``model``."""
+    if not rows:
+        return
+    qn = connection.ops.quote_name
+    opts = model._meta
+    columns = [opts.get_field(name).column for name in key_fields + value_fields]
+    updates = ', '.join(
+        f"{qn(col)} = {qn(opts.db_table)}.{qn(col)} + excluded.{qn(col)}"
+        for col in columns[len(key_fields):]
+    )
+    sql = (
+        f"INSERT INTO {qn(opts.db_table)} ({', '.join(qn(c) for c in columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))}) "
+        f"ON CONFLICT ({', '.join(qn(c) for c in columns[:len(key_fields)])}) DO UPDATE SET {updates}"
+    )
+    fields = [opts.get_field(name) for name in key_fields + value_fields]
+    params = [
+        [field.get_db_prep_save(value, connection) for field, value in zip(fields, row)]
+        for row in rows
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def record_sales(moment, orders=0, revenue=ZERO, payments=ZERO):
+    """Add order/payment deltas to the hour and day containing ``moment``."""
+    if not (orders or revenue or payments):
+        return
+    _accumulate(HourlySales, ['hour'], ['orders', 'revenue', 'payments'],
+                [(hour_bucket(moment), orders, revenue, payments)])
+    _accumulate(DailySales, ['date'], ['orders', 'revenue', 'payments'],
+                [(day_bucket(moment), orders, revenue, payments)])
+
+
+def record_items(moment, lines, sign=1):
+    """Add ``(product_id, quantity, unit_price)`` lines to the per-product day rows."""
+    totals = defaultdict(lambda: [0, ZERO])
+    for product_id, quantity, unit_price in lines:
+        totals[product_id][0] += sign * quantity
+        totals[product_id][1] += sign * quantity * unit_price
+    date = day_bucket(moment)
+    _accumulate(ProductDailySales, ['date', 'product'], ['quantity', 'revenue'],
+                [(date, pid, qty, rev) for pid, (qty, rev) in totals.items() if qty or rev])
+
+
+# -- snapshots used by the signal receivers to compute deltas on update --
+
+def snapshot_order(order):
+    order._rollup_state = (order.created_at, order.total)
+
+
+def snapshot_item(item):
+    unit_price = None if item.unit_price is None else Decimal(item.unit_price)
+    item._rollup_state = (item.product_id, item.quantity, unit_price)
+
+
+def snapshot_payment(payment):
+    payment._rollup_state = (payment.recorded_at, payment.amount)
+
+
+def order_saved(order, created):
+    old_created_at, old_total = getattr(order, '_rollup_state', (None, None))
+    if created or old_created_at is None:
+        record_sales(order.created_at, orders=1, revenue=order.total)
+    elif old_total != order.total:
+        record_sales(order.created_at, revenue=Decimal(order.total) - Decimal(old_total))
+    snapshot_order(order)
+
+
+def order_deleted(order):
+    created_at, total = getattr(order, '_rollup_state', (order.created_at, order.total))
+    if created_at is not None:
+        record_sales(created_at, orders=-1, revenue=-Decimal(total))
+
+
+def item_saved(item, created):
+    old = getattr(item, '_rollup_state', None)
+    moment = item.order.created_at
+    if not created and old is not None and old[0] is not None:
+        record_items(moment, [old], sign=-1)
+    record_items(moment, [(item.product_id, item.quantity, Decimal(item.unit_price))])
+    snapshot_item(item)
+
+
+def item_deleted(item):
+    old = getattr(item, '_rollup_state', None) or (item.product_id, item.quantity, Decimal(item.unit_price))
+    try:
+        moment = item.order.created_at
+    except item._meta.get_field('order').related_model.DoesNotExist:
+        return  # the order went first: its own delete handler already subtracted it
+    record_items(moment, [old], sign=-1)
+
+
+def payment_saved(payment, created):
+    old_recorded_at, old_amount = getattr(payment, '_rollup_state', (None, None))
+    if not created and old_recorded_at is not None:
+        record_sales(old_recorded_at, payments=-Decimal(old_amount))
+    record_sales(payment.recorded_at, payments=Decimal(payment.amount))
+    snapshot_payment(payment)
+
+
+def payment_deleted(payment):
+    recorded_at, amount = getattr(payment, '_rollup_state', (payment.recorded_at, payment.amount))
+    if recorded_at is not None:
+        record_sales(recorded_at, payments=-Decimal(amount))
@@ -0,0 +1,147 @@
+"""Delivery route planning for drivers.
+
+Each driver's pending deliveries are grouped into square zones of
+``ZONE_KM``; zones are visited nearest-first from the depot
+(``settings.ROUTE_DEPOT``) and the stops within and across them are ordered
+with nearest-neighbour followed by 2-opt. Distances are straight lines on a
+local flat projection, computed as NumPy matrices, which is accurate enough
+within a city. Routes are open: they start at the depot and end at the last
+stop.
+
+Deliveries whose customer has no coordinates are put after the planned
+stops, in schedule order.
+"""
+import math
+from dataclasses import dataclass, field
+
+import numpy as np
+from django.conf import settings
+
+from .models import Delivery
+
+EARTH_RADIUS_KM = 6371.0
+ZONE_KM = 3.0
+PENDING = ('pending',)
+
+
+@dataclass
+class Route:
+    driver_id: int
+    stops: list = field(default_factory=list)       # deliveries in visiting order
+    unlocated: list = field(default_factory=list)   # deliveries without coordinates
+    km: float = 0.0
+
+
+def project(points, origin):
+    """``(lat, lng)`` degrees to km on a plane tangent at ``origin``."""
+    points = np.radians(np.asarray(points, dtype=float).reshape(-1, 2))
+    lat0, lng0 = np.radians(origin)
+    x = (points[:, 1] - lng0) * math.cos(lat0) * EARTH_RADIUS_KM
+    y = (points[:, 0] - lat0) * EARTH_RADIUS_KM
+    return np.column_stack((x, y))
+
+
+def distance_matrix(xy):
+    diff = xy[:, None, :] - xy[None, :, :]
+    return np.sqrt((diff ** 2).sum(axis=-1))
+
+
+def nearest_neighbour(dist, start=0):
+    """Greedy visiting order over every node of ``dist``, starting at ``start``."""
+    n = len(dist)
+    visited = np.zeros(n, dtype=bool)
+    order = [start]
+    visited[start] = True
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, dist[order[-1]])
+        nxt = int(row.argmin())
+        order.append(nxt)
+        visited[nxt] = True
+    return np.array(order)
+
+
+def two_opt(route, dist, max_passes=1000):
+    """Improve a path whose first and last nodes stay put, best move first.
+
+    Every candidate exchange of edges (a, b), (c, d) for (a, c), (b, d) is
+    scored at once as a matrix; the best one is applied until none helps.
+    """
+    route = np.array(route)
+    n = len(route)
+    if n < 4:
+        return route
+    i, j = np.triu_indices(n - 1, k=2)
+    for _ in range(max_passes):
+        a, b = route[i], route[i + 1]
+        c, d = route[j], route[j + 1]
+        gain = dist[a, b] + dist[c, d] - dist[a, c] - dist[b, d]
+        best = int(gain.argmax())
+        if gain[best] <= 1e-9:
+            break
+        route[i[best] + 1:j[best] + 1] = route[i[best] + 1:j[best] + 1][::-1].copy()
+    return route
+
+
+def zones(xy, size=ZONE_KM):
+    """``{cell: [indexes]}`` for a square grid of ``size`` km."""
+    cells = {}
+    for index, cell in enumerate(map(tuple, np.floor(xy / size).astype(int))):
+        cells.setdefault(cell, []).append(index)
+    return cells
+
+
+def order_stops(points, depot, zone_km=ZONE_KM):
+    """Visiting order (indexes into ``points``) and length in km of a route from ``depot``."""
+    if not len(points):
+        return [], 0.0
+    xy = np.vstack((np.zeros((1, 2)), project(points, depot)))  # node 0 is the depot
+
+    # Batch by zone: zones nearest-first by centroid, nearest-neighbour inside each.
+    cells = zones(xy[1:], zone_km)
+    keys = list(cells)
+    centroids = np.array([xy[1:][cells[key]].mean(axis=0) for key in keys])
+    zone_order = nearest_neighbour(distance_matrix(np.vstack((np.zeros((1, 2)), centroids))))[1:] - 1
+    dist = distance_matrix(xy)
+    route = [0]
+    for zone in zone_order:
+        members = [index + 1 for index in cells[keys[zone]]]
+        nodes = [route[-1]] + members
+        local = nearest_neighbour(dist[np.ix_(nodes, nodes)])[1:]
+        route.extend(nodes[k] for k in local)
+
+    # 2-opt over the whole route; a free dummy end node lets the last stop move.
+    n = len(xy)
+    open_dist = np.zeros((n + 1, n + 1))
+    open_dist[:n, :n] = dist
+    route = two_opt(route + [n], open_dist)[1:-1]
+    km = float(dist[np.concatenate(([0], route[:-1])), route].sum())
+    return [int(node) - 1 for node in route], km
+
+
+def pending_deliveries(driver_ids=None):
+    deliveries = (
+        Delivery.objects.filter(status__in=PENDING, driver__isnull=False)
+        .select_related('order__customer')
+        .order_by('scheduled_at', 'id')
+    )
+    if driver_ids is not None:
+        deliveries = deliveries.filter(driver_id__in=driver_ids)
+    return deliveries
+
+
+def plan_routes(driver_ids=None, depot=None):
+    """``{driver_id: Route}`` for every driver with pending deliveries."""
+    depot = depot or settings.ROUTE_DEPOT
+    routes = {}
+    for delivery in pending_deliveries(driver_ids):
+        route = routes.setdefault(delivery.driver_id, Route(delivery.driver_id))
+        customer = delivery.order.customer
+        if customer is None or customer.latitude is None or customer.longitude is None:
+            route.unlocated.append(delivery)
+        else:
+            route.stops.append(delivery)
+    for route in routes.values():
+        points = [(d.order.customer.latitude, d.order.customer.longitude) for d in route.stops]
+        order, route.km = order_stops(points, depot)
+        route.stops = [route.stops[index] for index in order]
+    return routes
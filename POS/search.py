@@ -0,0 +1,165 @@
+"""In-process product search index for the cashier typeahead.
+
+The index keeps, per worker process, a sorted token list for prefix lookups
+and a trigram posting map for substring lookups over ``Product.name`` and
+``Product.sku``. ``pos.signals`` applies product saves and deletes to it
+incrementally; if another process changed products in the meantime (the
+shared ``product`` version moved without us seeing the signal) the index is
+rebuilt on the next search.
+
+An index is never changed while searches may be reading it: a change is
+applied to a copy (posting sets are shared and replaced, not mutated) which
+is then swapped in, so searches take no lock.
+"""
+import threading
+from bisect import bisect_left, insort
+
+from . import versions
+from .models import Product
+
+
+def _tokens(text):
+    return {t for t in text.lower().replace('-', ' ').split() if t}
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class ProductIndex:
+    def __init__(self):
+        self.docs = {}       # id -> {'id', 'name', 'sku', 'price'}
+        self._haystack = {}  # id -> lowercased "name sku"
+        self._terms = []     # sorted (token, id)
+        self._grams = {}     # trigram -> set(id)
+        self.version = None
+
+    def build(self, products, version):
+        self.__init__()
+        for product in products:
+            self._index(product)
+        self._terms.sort()
+        self.version = version
+
+    def copy(self):
+        """A copy for ``add``/``remove`` to change while this one is still searched."""
+        other = ProductIndex()
+        other.docs = dict(self.docs)
+        other._haystack = dict(self._haystack)
+        other._terms = list(self._terms)
+        other._grams = dict(self._grams)
+        other.version = self.version
+        return other
+
+    def add(self, product):
+        if product['id'] in self.docs:
+            self.remove(product['id'])
+        self._index(product, incremental=True)
+
+    def _index(self, product, incremental=False):
+        pid = product['id']
+        haystack = f"{product['name']} {product['sku']}".lower()
+        self.docs[pid] = product
+        self._haystack[pid] = haystack
+        for token in _tokens(haystack):
+            if incremental:
+                insort(self._terms, (token, pid))
+            else:
+                self._terms.append((token, pid))
+        for gram in _trigrams(haystack):
+            if incremental:
+                # The set may be shared with the index being searched.
+                self._grams[gram] = self._grams.get(gram, set()) | {pid}
+            else:
+                self._grams.setdefault(gram, set()).add(pid)
+
+    def remove(self, pid):
+        haystack = self._haystack.pop(pid, None)
+        if haystack is None:
+            return
+        del self.docs[pid]
+        for token in _tokens(haystack):
+            i = bisect_left(self._terms, (token, pid))
+            if i < len(self._terms) and self._terms[i] == (token, pid):
+                del self._terms[i]
+        for gram in _trigrams(haystack):
+            ids = self._grams.get(gram, set()) - {pid}
+            if ids:
+                self._grams[gram] = ids
+            else:
+                self._grams.pop(gram, None)
+
+    def _prefix(self, prefix, limit):
+        found = []
+        i = bisect_left(self._terms, (prefix,))
+        while i < len(self._terms) and len(found) < limit:
+            token, pid = self._terms[i]
+            if not token.startswith(prefix):
+                break
+            if pid not in found:
+                found.append(pid)
+            i += 1
+        return found
+
+    def search(self, query, limit=20):
+        query = query.strip().lower()
+        if not query:
+            return []
+
+        # Word-prefix hits rank ahead of plain substring hits.
+        first_word = query.split()[0]
+        ids = self._prefix(first_word, limit)
+        if len(query) >= 3 and len(ids) < limit:
+            postings = sorted((self._grams.get(g, set()) for g in _trigrams(query)), key=len)
+            candidates = set.intersection(*postings) if postings and postings[0] else set()
+            seen = set(ids)
+            extra = sorted(
+                (pid for pid in candidates if pid not in seen and query in self._haystack[pid]),
+                key=lambda pid: self.docs[pid]['name'],
+            )
+            ids.extend(extra[:limit - len(ids)])
+        if ' ' in query:
+            ids = [pid for pid in ids if query in self._haystack[pid]]
+        return [self.docs[pid] for pid in ids]
+
+
+def product_doc(product):
+    return {'id': product.pk, 'name': product.name, 'sku': product.sku, 'price': str(product.price)}
+
+
+_index = ProductIndex()
+_lock = threading.Lock()
+
+
+def get_index():
+    """Return the process index, rebuilding it if another process changed products."""
+    global _index
+    current = versions.get_version('product')
+    if _index.version != current:
+        with _lock:
+            if _index.version != current:
+                # Build aside and swap so concurrent searches never see a half-built index.
+                fresh = ProductIndex()
+                products = Product.objects.values_list('id', 'name', 'sku', 'price')
+                fresh.build(
+                    ({'id': i, 'name': n, 'sku': s, 'price': str(p)} for i, n, s, p in products.iterator()),
+                    current,
+                )
+                _index = fresh
+    return _index
+
+
+def apply_change(product=None, deleted_id=None):
+    """Apply one product save/delete and move the stamp, keeping the index in sync."""
+    global _index
+    with _lock:
+        in_sync = _index.version is not None and _index.version == versions.get_version('product')
+        changed = _index.copy()
+        if product is not None:
+            changed.add(product_doc(product))
+        elif deleted_id is not None:
+            changed.remove(deleted_id)
+        token = versions.bump('product')
+        # Only claim the new stamp if nothing else was missed before it.
+        changed.version = token if in_sync else None
+        _index = changed
@@ -0,0 +1,181 @@
+# pos/signals.py
+from django.contrib.auth.models import Group, User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import changes, customer_search, rollups, search, sla, stock, versions
+from .models import Customer, Delivery, DeliveryStatusTransition, Driver, Inventory, Order, OrderItem, Payment, Product
+from .roles import invalidate_roles
+
+
+def invalidate_roles_on_commit(*user_ids):
+    # Another process could otherwise re-cache the old names under the new
+    # version before this transaction commits.
+    transaction.on_commit(lambda: invalidate_roles(*user_ids))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # user.groups.add(...) / remove / clear
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_roles_on_commit(instance.pk)
+        return
+
+    # group.user_set.add(...) / remove / clear
+    if action == 'pre_clear':
+        instance._pos_cleared_users = list(instance.user_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        user_ids = getattr(instance, '_pos_cleared_users', [])
+        if user_ids:
+            invalidate_roles_on_commit(*user_ids)
+    elif action in ('post_add', 'post_remove') and pk_set:
+        invalidate_roles_on_commit(*pk_set)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # A renamed or deleted group changes the role names of all its members.
+    if kwargs.get('created'):
+        return
+    user_ids = list(instance.user_set.values_list('pk', flat=True))
+    if user_ids:
+        invalidate_roles_on_commit(*user_ids)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: search.apply_change(product=instance))
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: search.apply_change(deleted_id=pk))
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+def customer_changed(sender, instance, **kwargs):
+    customer_search.index([instance.pk])
+
+
+# -- stock levels (bulk writes go through InventoryQuerySet) --
+
+@receiver(pre_save, sender=Inventory)
+@receiver(pre_delete, sender=Inventory)
+def inventory_changing(sender, instance, **kwargs):
+    instance._stock_before = stock.levels(Inventory.objects.filter(pk=instance.pk)) if instance.pk else {}
+
+
+@receiver(post_save, sender=Inventory)
+def inventory_saved(sender, instance, **kwargs):
+    stock.record(getattr(instance, '_stock_before', {}), stock.levels(Inventory.objects.filter(pk=instance.pk)))
+
+
+@receiver(post_delete, sender=Inventory)
+def inventory_deleted(sender, instance, **kwargs):
+    stock.record(getattr(instance, '_stock_before', {}), {})
+
+
+# -- delivery status history and driver assignment (updates go through DeliveryQuerySet) --
+
+@receiver(post_init, sender=Delivery)
+def delivery_loaded(sender, instance, **kwargs):
+    deferred = instance.pk is None or 'status' in instance.get_deferred_fields()
+    instance._status_before = None if deferred else instance.status
+
+
+@receiver(post_save, sender=Delivery)
+def delivery_saved(sender, instance, created, **kwargs):
+    before = '' if created else instance._status_before
+    if before is not None and before != instance.status:
+        sla.record([(instance.pk, before, instance.status, instance.driver_id)], DeliveryStatusTransition.POS)
+    instance._status_before = instance.status
+
+
+# -- sales rollups --
+
+@receiver(post_init, sender=Order)
+def order_loaded(sender, instance, **kwargs):
+    rollups.snapshot_order(instance)
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, created, **kwargs):
+    rollups.order_saved(instance, created)
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    rollups.order_deleted(instance)
+
+
+@receiver(post_init, sender=OrderItem)
+def order_item_loaded(sender, instance, **kwargs):
+    rollups.snapshot_item(instance)
+
+
+@receiver(post_save, sender=OrderItem)
+def order_item_saved(sender, instance, created, **kwargs):
+    rollups.item_saved(instance, created)
+
+
+@receiver(post_delete, sender=OrderItem)
+def order_item_deleted(sender, instance, **kwargs):
+    rollups.item_deleted(instance)
+
+
+@receiver(post_init, sender=Payment)
+def payment_loaded(sender, instance, **kwargs):
+    rollups.snapshot_payment(instance)
+
+
+@receiver(post_save, sender=Payment)
+def payment_saved(sender, instance, created, **kwargs):
+    rollups.payment_saved(instance, created)
+
+
+@receiver(post_delete, sender=Payment)
+def payment_deleted(sender, instance, **kwargs):
+    rollups.payment_deleted(instance)
+
+
+# -- page cache stamps (queryset writes go through StampedQuerySet; product and
+# inventory stamps are moved by pos.search and pos.stock) --
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def order_changed(sender, **kwargs):
+    versions.bump_on_commit('order')
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def payment_changed(sender, **kwargs):
+    versions.bump_on_commit('payment')
+
+
+@receiver(post_save, sender=Delivery)
+@receiver(post_delete, sender=Delivery)
+def delivery_changed(sender, **kwargs):
+    versions.bump_on_commit('delivery')
+
+
+@receiver(post_save, sender=Driver)
+@receiver(post_delete, sender=Driver)
+def driver_changed(sender, **kwargs):
+    versions.bump_on_commit('driver')
+
+
+# -- table stamps for conditional GETs, every app (queryset writes go through TrackedQuerySet) --
+
+@receiver(post_save)
+@receiver(post_delete)
+def table_changed(sender, using, **kwargs):
+    if changes.tracked(sender):
+        changes.touch(sender, using=using)
@@ -0,0 +1,187 @@
+"""Delivery status history and incrementally maintained SLA aggregates.
+
+Every status change of a delivery, whether made on the POS ``Delivery`` or
+through the driver's tracking form (``deliveries.Delivery``), single save or
+queryset update, is passed to ``record()``. That appends
+``DeliveryStatusTransition`` rows and, for deliveries reaching "delivered"
+for the first time, adds the time since the delivery went pending to the
+day's ``DeliverySLA`` rows (per driver and for all drivers) in the same
+transaction. Reports read those rows; history is never re-scanned.
+
+Tracking form statuses are stored in POS terms (``TRACKING_STATUSES``) and
+chained onto the delivery's last recorded status, so each delivery has a
+single history whatever the source of a change.
+
+Times go into a ``Sketch``, a log-bucketed quantile sketch in the style of
+DDSketch: quantiles are within ``RELATIVE_ACCURACY`` of the true value, its
+size grows with the log of the range instead of the number of deliveries,
+and sketches of different days or drivers merge by adding bucket counts.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, OuterRef, Q, Subquery
+
+from . import versions
+from .models import Delivery, DeliverySLA, DeliveryStatusTransition
+from .rollups import day_bucket
+
+DELIVERED = 'delivered'
+RELATIVE_ACCURACY = 0.01
+LATE_AFTER = timedelta(minutes=getattr(settings, 'DELIVERY_LATE_MINUTES', 30))
+
+# deliveries.Delivery status -> pos.Delivery status
+TRACKING_STATUSES = {
+    'picked_up': 'in_transit',  # the driver has the order
+    'transporting': 'in_transit',
+    'delivered': DELIVERED,
+}
+
+
+class Sketch:
+    """Quantile sketch over positive values; ``{bucket: count}`` serialises as JSON."""
+    gamma = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+
+    def __init__(self, buckets=None, zeros=0):
+        self.buckets = defaultdict(int, buckets or {})
+        self.zeros = zeros  # values below one second
+
+    @classmethod
+    def from_json(cls, data):
+        data = data or {}
+        return cls({int(key): count for key, count in data.get('buckets', {}).items()}, data.get('zeros', 0))
+
+    def to_json(self):
+        return {'buckets': {str(key): count for key, count in self.buckets.items() if count}, 'zeros': self.zeros}
+
+    @property
+    def count(self):
+        return self.zeros + sum(self.buckets.values())
+
+    def add(self, value):
+        if value < 1:
+            self.zeros += 1
+        else:
+            self.buckets[math.ceil(math.log(value, self.gamma))] += 1
+
+    def merge(self, other):
+        for key, count in other.buckets.items():
+            self.buckets[key] += count
+        self.zeros += other.zeros
+        return self
+
+    def quantile(self, q):
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+def record(changes, source):
+    """Store ``(delivery_id, old_status, new_status, driver_id)`` changes and update the SLA rows.
+
+    ``delivery_id`` is always the POS delivery; ``old_status`` is '' for new deliveries.
+    """
+    if source == DeliveryStatusTransition.TRACKING:
+        changes = _from_tracking(changes)
+    if not changes:
+        return
+    with transaction.atomic():
+        transitions = DeliveryStatusTransition.objects.bulk_create([
+            DeliveryStatusTransition(delivery_id=delivery_id, source=source, from_status=old or '',
+                                     to_status=new, driver_id=driver_id)
+            for delivery_id, old, new, driver_id in changes
+        ])
+        delivered = {t.delivery_id: t for t in transitions if t.to_status == DELIVERED}
+        if delivered:
+            _deliveries_done(delivered)
+
+
+def _from_tracking(changes):
+    """Tracking form changes in POS statuses, from each delivery's last recorded status."""
+    last = (
+        DeliveryStatusTransition.objects.filter(delivery=OuterRef('pk'))
+        .order_by('-at', '-id').values('to_status')[:1]
+    )
+    current = {
+        pk: recorded or status
+        for pk, status, recorded in Delivery.objects.filter(pk__in={change[0] for change in changes})
+        .annotate(recorded=Subquery(last)).values_list('id', 'status', 'recorded')
+    }
+    mapped = []
+    for delivery_id, _, new, driver_id in changes:
+        new = TRACKING_STATUSES.get(new, new)
+        if delivery_id in current and new != current[delivery_id]:
+            mapped.append((delivery_id, current[delivery_id], new, driver_id))
+            current[delivery_id] = new
+    return mapped
+
+
+def _deliveries_done(delivered):
+    history = (
+        DeliveryStatusTransition.objects.filter(delivery_id__in=delivered)
+        .values('delivery_id')
+        .annotate(start=Min('at'), times_delivered=Count('id', filter=Q(to_status=DELIVERED)))
+    )
+    history = {row['delivery_id']: row for row in history}
+    # Deliveries from before transitions were kept start when their order was placed.
+    deliveries = Delivery.objects.filter(pk__in=delivered).values_list('id', 'scheduled_at', 'order__created_at')
+
+    groups = defaultdict(list)  # (day, driver_id or None) -> [(seconds, late)]
+    for delivery_id, scheduled_at, ordered_at in deliveries:
+        row = history[delivery_id]
+        if row['times_delivered'] > 1:
+            continue  # already counted the first time it was delivered
+        done = delivered[delivery_id]
+        start = row['start'] if row['start'] < done.at else ordered_at
+        sample = ((done.at - start).total_seconds(), done.at > scheduled_at + LATE_AFTER)
+        day = day_bucket(done.at)
+        groups[(day, None)].append(sample)
+        if done.driver_id is not None:
+            groups[(day, done.driver_id)].append(sample)
+
+    # The sketch is read, merged and written back, so each row stays locked until
+    # commit (on SQLite, BEGIN IMMEDIATE already holds the write lock); rows are
+    # taken in one order so two transactions never wait on each other.
+    for (day, driver_id), samples in sorted(groups.items(), key=lambda item: (item[0][0], item[0][1] or 0)):
+        sla, _ = DeliverySLA.objects.select_for_update().get_or_create(day=day, driver_id=driver_id)
+        sketch = Sketch.from_json(sla.sketch)
+        for seconds, late in samples:
+            sketch.add(seconds)
+            sla.late += late
+        sla.delivered += len(samples)
+        sla.sketch = sketch.to_json()
+        sla.p50_seconds = sketch.quantile(0.5)
+        sla.p90_seconds = sketch.quantile(0.9)
+        sla.save()
+    # Pages showing the SLA are cached on the delivery stamp (pos.pagecache),
+    # and tracking-form changes do not save the POS delivery.
+    versions.bump_on_commit('delivery')
+
+
+def summary(rows):
+    """Merge ``DeliverySLA`` rows into delivered/late counts and p50/p90 minutes."""
+    sketch, delivered, late = Sketch(), 0, 0
+    for row in rows:
+        sketch.merge(Sketch.from_json(row.sketch))
+        delivered += row.delivered
+        late += row.late
+    p50, p90 = sketch.quantile(0.5), sketch.quantile(0.9)
+    return {
+        'delivered': delivered,
+        'late': late,
+        'late_share': late / delivered if delivered else 0,
+        'p50_minutes': p50 / 60 if p50 is not None else None,
+        'p90_minutes': p90 / 60 if p90 is not None else None,
+    }
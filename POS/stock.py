@@ -0,0 +1,132 @@
+"""Incremental low-stock tracking and live inventory events.
+
+Every write to ``Inventory.quantity``/``low_threshold`` (single saves via
+``pos.signals``, and ``update``/``bulk_update``/``bulk_create``/``take`` on
+``InventoryQuerySet``) snapshots the affected rows before and after and
+hands both to ``record()``. That appends the quantity changes to the
+``StockMovement`` ledger and publishes, in the same transaction, a
+``stock`` event per changed product plus a notification when a product
+crosses its threshold, to the staff/admin group. On commit the per-process
+``LowStockTracker`` is updated and the ``inventory`` version stamp moves;
+a tracker that missed another process's change reloads the (partially
+indexed) low-stock rows on its next use, like the search index.
+"""
+import threading
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from notifications import outbox
+from . import outbound, versions
+from .models import Inventory, StockMovement
+
+STOCK_FIELDS = {'quantity', 'low_threshold'}
+STAFF_GROUP = 'staff_admin_group'
+
+_COLUMNS = ('id', 'product_id', 'product__name', 'product__sku', 'quantity', 'low_threshold')
+_KEYS = ('id', 'product', 'name', 'sku', 'quantity', 'low_threshold')
+
+
+def levels(queryset):
+    """``{inventory_id: row}`` snapshot of the stock columns of ``queryset``."""
+    return {row[0]: dict(zip(_KEYS, row)) for row in queryset.values_list(*_COLUMNS)}
+
+
+def is_low(row):
+    return row['quantity'] <= row['low_threshold']
+
+
+def movements(changes, kind=None, note=''):
+    """Ledger rows for ``(old, new)`` changes; without a ``kind``, increases are restocks."""
+    rows = []
+    for old, new in changes:
+        delta = (new['quantity'] if new else 0) - (old['quantity'] if old else 0)
+        if delta:
+            rows.append(StockMovement(
+                product_id=(new or old)['product'], quantity=delta, note=note,
+                kind=kind or (StockMovement.RESTOCK if delta > 0 else StockMovement.ADJUSTMENT),
+            ))
+    return rows
+
+
+def record(before, after, kind=None, note='', ledger=True):
+    """Record the differences between two ``levels()`` snapshots; update the tracker on commit.
+
+    ``ledger=False`` is for writes that bring ``Inventory`` back in line with
+    the ledger (see ``pos.ledger.rematerialize``).
+    """
+    changes = [(before.get(pk), after.get(pk)) for pk in before.keys() | after.keys()
+               if before.get(pk) != after.get(pk)]
+    if not changes:
+        return
+    if ledger:
+        StockMovement.objects.bulk_create(movements(changes, kind, note))
+    events = []
+    for old, new in changes:
+        row = new or old
+        entity = f"stock:{row['product']}"
+        if new is None:
+            events.append((STAFF_GROUP, outbound.group_event(
+                {'type': 'stock', 'product': row['product'], 'removed': True}, entity)))
+            continue
+        events.append((STAFF_GROUP, outbound.group_event({'type': 'stock', **new, 'low': is_low(new)}, entity)))
+        was_low = old is not None and is_low(old)
+        if is_low(new) and not was_low:
+            events.append((STAFF_GROUP, outbound.notification(
+                "Low stock", f"{new['name']} is down to {new['quantity']} (threshold {new['low_threshold']})")))
+        elif was_low and not is_low(new):
+            events.append((STAFF_GROUP, outbound.notification(
+                "Restocked", f"{new['name']} is back to {new['quantity']}")))
+    outbox.publish_many(events)
+    transaction.on_commit(lambda: apply_changes(changes))
+
+
+class LowStockTracker:
+    def __init__(self):
+        self.low = {}  # product id -> row, for products at or below threshold
+        self.version = None
+
+    def load(self, rows, version):
+        self.low = {row['product']: row for row in rows}
+        self.version = version
+
+    def apply(self, changes):
+        for old, new in changes:
+            product = (new or old)['product']
+            if new is not None and is_low(new):
+                self.low[product] = new
+            else:
+                self.low.pop(product, None)
+
+    def items(self):
+        return sorted(self.low.values(), key=lambda row: (row['quantity'] - row['low_threshold'], row['name']))
+
+    def __len__(self):
+        return len(self.low)
+
+
+_tracker = LowStockTracker()
+_lock = threading.Lock()
+
+
+def get_tracker():
+    """Return the process tracker, reloading it if another process changed stock."""
+    global _tracker
+    current = versions.get_version('inventory')
+    if _tracker.version != current:
+        with _lock:
+            if _tracker.version != current:
+                fresh = LowStockTracker()
+                # Never from the read replica: the rows must match the stamp.
+                fresh.load(levels(Inventory.objects.using(DEFAULT_DB_ALIAS).low_stock()).values(), current)
+                _tracker = fresh
+    return _tracker
+
+
+def apply_changes(changes):
+    """Apply committed changes and move the stamp, keeping the tracker in sync."""
+    with _lock:
+        in_sync = _tracker.version is not None and _tracker.version == versions.get_version('inventory')
+        _tracker.apply(changes)
+        token = versions.bump('inventory')
+        # Only claim the new stamp if nothing else was missed before it.
+        _tracker.version = token if in_sync else None
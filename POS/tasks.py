@@ -0,0 +1,8 @@
+from celery import shared_task
+
+from . import dispatch
+
+
+@shared_task
+def assign_drivers():
+    return f"{dispatch.assign_all()} deliveries assigned"
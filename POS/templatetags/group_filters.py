@@ -1,4 +1,5 @@
 from django import template
+from pos.roles import has_role
 
 register = template.Library()
 
@@ -6,4 +7,4 @@ register = template.Library()
 def has_group(user, group_names): #Check if user belongs to one or multiple groups. group_names: comma-separated string, e.g. "staff,admin"
 
     group_list = [g.strip() for g in group_names.split(',')]
-    return user.groups.filter(name__in=group_list).exists()
\ No newline at end of file
+    return has_role(user, *group_list)
\ No newline at end of file
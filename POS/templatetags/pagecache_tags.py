@@ -0,0 +1,58 @@
+from django import template
+from django.core.cache import cache
+
+from pos import pagecache
+
+register = template.Library()
+
+
+class FragmentNode(template.Node):
+    def __init__(self, nodelist, name, stamp_names, vary):
+        self.nodelist = nodelist
+        self.name = name
+        self.stamp_names = stamp_names
+        self.vary = vary
+
+    def render(self, context):
+        request = context.get('request')
+        stamps = getattr(request, 'page_stamps', {})
+        if request is None or not all(name in stamps for name in self.stamp_names):
+            # Stamps read now could be newer than the data the view read.
+            return self.nodelist.render(context)
+        key = pagecache.make_key('fragment', self.name, request, self.stamp_names,
+                                 *(value.resolve(context) for value in self.vary))
+        content = cache.get(key)
+        pagecache.count(self.name, content is not None)
+        if content is None:
+            content = self.nodelist.render(context)
+            cache.set(key, content, None)
+        return content
+
+
+@register.tag
+def fragment(parser, token):
+    """Cache a block until one of its stamps moves, per role.
+
+    ``{% fragment "deliveries-rows" "delivery" "driver" for request.GET.cursor %}...{% endfragment %}``
+
+    The view must take the stamps first (``pagecache.cached_view`` or
+    ``pagecache.with_stamps``); anything after ``for`` is added to the key.
+    """
+    bits = token.split_contents()[1:]
+    if not bits:
+        raise template.TemplateSyntaxError("'fragment' needs a name.")
+    if 'for' in bits:
+        split = bits.index('for')
+        bits, vary = bits[:split], bits[split + 1:]
+    else:
+        vary = []
+    literals = []
+    for bit in bits:
+        if len(bit) < 2 or bit[0] != bit[-1] or bit[0] not in '"\'':
+            raise template.TemplateSyntaxError("'fragment' name and stamps must be quoted strings.")
+        literals.append(bit[1:-1])
+    name, stamp_names = literals[0], tuple(literals[1:])
+    pagecache.NAMES.add(name)
+    nodelist = parser.parse(('endfragment',))
+    parser.delete_first_token()
+    return FragmentNode(nodelist, name, stamp_names, [parser.compile_filter(bit) for bit in vary])
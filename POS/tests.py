@@ -0,0 +1,1206 @@
+import asyncio
+import io
+import json
+import math
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, time as dtime, timedelta
+from decimal import Decimal
+from unittest import mock
+
+import numpy as np
+from channels.db import database_sync_to_async
+from django.contrib.auth.models import Group, User
+from django.core import signing
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, models
+from django.db.models import F
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from notifications import outbox
+from notifications.models import OutboxEvent
+from project import replica, sqlite
+from project.layers import UnixSocketChannelLayer
+from . import customer_search, dispatch, ledger, pagecache, pagination, routeplan, sla, stock
+from .exports import astream
+from .importers import import_file
+from .models import (
+    Customer, DailySales, Delivery, DeliverySLA, DeliveryStatusTransition, Driver, HourlySales, Inventory, Order,
+    OrderItem, Payment, Product, ProductDailySales, StockMovement, StockSnapshot,
+)
+from .outbound import CoalescingConsumerMixin, group_event, sequenced
+from .roles import get_roles
+from .search import ProductIndex, get_index
+
+# Any SCAN reads a whole table or index; only SEARCH lines are bounded lookups.
+SCAN = re.compile(r'\bSCAN (?!CONSTANT ROW)\S+(?: USING (?:COVERING )?INDEX (\S+))?')
+
+
+class QueryPlanAssertions:
+    """Fails a test when SQLite plans a hot query as a full table or index scan."""
+
+    def assertNoFullScan(self, queryset, partial_index=None):
+        """``partial_index`` names a partial index the query may scan: it holds only matching rows."""
+        if connection.vendor != 'sqlite':
+            self.skipTest("query plans are only checked on SQLite")
+        if partial_index is not None:
+            conditions = {index.name: index.condition for index in queryset.model._meta.indexes}
+            self.assertIsNotNone(conditions.get(partial_index), f"{partial_index} is not a partial index")
+        plan = queryset.explain()
+        scans = [
+            line for line in plan.splitlines()
+            if (match := SCAN.search(line)) and (partial_index is None or match[1] != partial_index)
+        ]
+        self.assertFalse(scans, f"full scan in plan:\n{plan}\nfor query:\n{queryset.query}")
+
+
+class PosQueryPlanTests(QueryPlanAssertions, TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+
+    def test_orders_created_on_day(self):
+        self.assertNoFullScan(Order.objects.created_on(timezone.localdate()))
+
+    def test_unpaid_orders(self):
+        self.assertNoFullScan(Order.objects.filter(paid=False).order_by('-created_at'), 'pos_order_unpaid_idx')
+
+    def test_low_stock(self):
+        self.assertNoFullScan(Inventory.objects.low_stock().select_related('product'), 'inventory_low_stock_idx')
+
+    def test_deliveries_by_status(self):
+        self.assertNoFullScan(Delivery.objects.filter(status='pending').order_by('scheduled_at'))
+
+    def test_deliveries_scheduled_window(self):
+        self.assertNoFullScan(
+            Delivery.objects.filter(scheduled_at__gte=self.now, scheduled_at__lt=self.now + timedelta(days=1))
+        )
+
+    def test_payments_recorded_window(self):
+        self.assertNoFullScan(
+            Payment.objects.filter(recorded_at__gte=self.now - timedelta(days=1)).order_by('-recorded_at')
+        )
+
+    def test_reports_rollups(self):
+        today = timezone.localdate()
+        self.assertNoFullScan(DailySales.objects.filter(date__gte=today - timedelta(days=6), date__lte=today))
+        self.assertNoFullScan(ProductDailySales.objects.filter(date__gte=today - timedelta(days=6)))
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    REPLICA_MAX_LAG=60,
+)
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = replica.ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def routed_view(self, write=False):
+        seen = []
+
+        def view(request):
+            if write:
+                self.router.db_for_write(Product)
+            seen.append(self.router.db_for_read(Product))
+            return HttpResponse()
+        return seen, replica.ReplicaMiddleware(replica.use_replica(view))
+
+    def test_refresh_copies_primary(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            primary, target = os.path.join(tmp, 'primary.sqlite3'), os.path.join(tmp, 'replica.sqlite3')
+            db = sqlite3.connect(primary)
+            db.execute("PRAGMA journal_mode = wal")
+            db.execute("CREATE TABLE t (n INTEGER)")
+            db.executemany("INSERT INTO t VALUES (?)", [(n,) for n in range(100)])
+            db.commit()
+            replica.refresh(primary, target)
+            db.close()
+
+            copy = replica.current()[1]
+            self.assertRegex(os.path.basename(copy), r'^replica\.\d+\.sqlite3$')
+            db = sqlite3.connect(copy)
+            self.assertEqual(db.execute("SELECT COUNT(*) FROM t").fetchone(), (100,))
+            self.assertEqual(db.execute("PRAGMA journal_mode").fetchone(), ('delete',))
+            db.close()
+        self.assertLess(replica.lag(), 5)
+
+    def test_refresh_writes_a_new_copy_and_keeps_the_previous_one(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            primary, target = os.path.join(tmp, 'primary.sqlite3'), os.path.join(tmp, 'replica.sqlite3')
+            sqlite3.connect(primary).close()
+            copies = []
+            for _ in range(3):
+                replica.refresh(primary, target)
+                copies.append(replica.current()[1])
+                time.sleep(0.002)
+            self.assertEqual(len(set(copies)), 3)
+            self.assertEqual(sorted(os.listdir(tmp)), sorted(['primary.sqlite3', *map(os.path.basename, copies[1:])]))
+
+    def test_reads_open_the_copy_the_request_started_with(self):
+        conn = connections[replica.REPLICA]
+        settings_dict = conn.settings_dict
+        self.addCleanup(setattr, conn, 'settings_dict', settings_dict)
+        cache.set(replica.STAMP_KEY, (time.time(), '/tmp/db.replica.1.sqlite3'))
+        seen, view = self.routed_view()
+        view(self.factory.get('/'))
+        self.assertEqual(seen[-1], replica.REPLICA)
+        self.assertEqual(conn.settings_dict['NAME'], '/tmp/db.replica.1.sqlite3')
+
+    def test_reads_only_opted_in_views_from_fresh_replica(self):
+        self.assertIsNone(self.router.db_for_read(Product))
+        seen, view = self.routed_view()
+        view(self.factory.get('/'))
+        self.assertEqual(seen, [None])  # never refreshed
+
+        cache.set(replica.STAMP_KEY, (time.time(), None))
+        view(self.factory.get('/'))
+        self.assertEqual(seen[-1], replica.REPLICA)
+        self.assertIsNone(self.router.db_for_read(Product))
+
+        cache.set(replica.STAMP_KEY, (time.time() - 61, None))
+        view(self.factory.get('/'))
+        self.assertIsNone(seen[-1])
+
+    def test_read_your_writes(self):
+        cache.set(replica.STAMP_KEY, (time.time() - 1, None))
+        seen, view = self.routed_view(write=True)
+        response = view(self.factory.get('/'))
+        self.assertIsNone(seen[-1])
+        wrote = response.cookies[replica.WROTE_COOKIE].value
+
+        seen, view = self.routed_view()
+        request = self.factory.get('/')
+        request.COOKIES[replica.WROTE_COOKIE] = wrote
+        view(request)
+        self.assertIsNone(seen[-1])
+
+        cache.set(replica.STAMP_KEY, (float(wrote) + 0.001, None))
+        view(request)
+        self.assertEqual(seen[-1], replica.REPLICA)
+
+    def test_streamed_body_reads_replica(self):
+        cache.set(replica.STAMP_KEY, (time.time(), None))
+        view = replica.ReplicaMiddleware(replica.use_replica(lambda request: StreamingHttpResponse(
+            str(self.router.db_for_read(Product)) for _ in range(2)
+        )))
+        response = view(self.factory.get('/'))
+        self.assertEqual(b''.join(response.streaming_content), b'replicareplica')
+
+    async def test_async_streamed_body_reads_replica(self):
+        cache.set(replica.STAMP_KEY, (time.time(), None))
+        view = replica.ReplicaMiddleware(replica.use_replica(lambda request: StreamingHttpResponse(
+            astream(str(self.router.db_for_read(Product)) for _ in range(2))
+        )))
+        response = view(self.factory.get('/'))
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), b'replicareplica')
+
+
+class SQLiteProfileTests(SimpleTestCase):
+    def pragmas(self, **settings_dict):
+        with tempfile.TemporaryDirectory() as tmp:
+            wrapper = connections['default'].__class__(
+                {**connections['default'].settings_dict, 'NAME': os.path.join(tmp, 'pragmas.sqlite3'), **settings_dict},
+                alias='pragmas',
+            )
+            try:
+                with wrapper.cursor() as cursor:
+                    return {name: cursor.execute(f"PRAGMA {name}").fetchone()[0]
+                            for name in ('journal_mode', 'synchronous', 'cache_size', 'mmap_size',
+                                         'busy_timeout', 'query_only')}
+            finally:
+                wrapper.close()
+
+    def test_new_connections_get_the_pragmas(self):
+        self.assertEqual(self.pragmas(), {
+            'journal_mode': 'wal', 'synchronous': 1, 'cache_size': -64000, 'mmap_size': 268435456,
+            'busy_timeout': 5000, 'query_only': 0,
+        })
+
+    def test_a_database_entry_brings_its_own_pragmas(self):
+        pragmas = self.pragmas(PRAGMAS={'query_only': 1, 'busy_timeout': 250})
+        self.assertEqual((pragmas['query_only'], pragmas['busy_timeout'], pragmas['journal_mode']), (1, 250, 'delete'))
+
+    def test_write_queue_runs_one_callable_at_a_time_in_order(self):
+        queue = sqlite.WriteQueue(name='test-writer')
+        running, overlaps, order = [], [], []
+
+        def write(n):
+            running.append(n)
+            overlaps.append(len(running))
+            time.sleep(0.001)
+            order.append(n)
+            running.remove(n)
+            return threading.current_thread().name
+
+        futures = [queue.submit(write, n) for n in range(20)]
+        threads = {future.result(timeout=5) for future in futures}
+        self.assertEqual(threads, {'test-writer'})
+        self.assertEqual(order, list(range(20)))
+        self.assertEqual(max(overlaps), 1)
+        with self.assertRaises(ZeroDivisionError):
+            queue.call(lambda: 1 / 0)
+        self.assertEqual(queue.call(lambda: 'still running'), 'still running')
+
+
+@override_settings(SQLITE_WRITE_QUEUE=True)
+class SerializedWriteTests(TransactionTestCase):
+    def test_concurrent_read_modify_writes_are_not_lost(self):
+        inventory = Inventory.objects.create(product=Product.objects.create(name='Gallon', price=30), quantity=0)
+        writers = set()
+
+        @sqlite.serialized
+        def add_one():
+            writers.add(threading.current_thread().name)
+            quantity = Inventory.objects.get(pk=inventory.pk).quantity
+            time.sleep(0.002)  # without the queue, another thread reads the same quantity here
+            Inventory.objects.filter(pk=inventory.pk).update(quantity=quantity + 1)
+
+        threads = [threading.Thread(target=add_one) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(Inventory.objects.get(pk=inventory.pk).quantity, 8)
+        self.assertEqual(writers, {sqlite.writer.name})
+
+    async def test_coroutines_wait_on_the_queue(self):
+        @sqlite.serialized
+        def create(name):
+            return Product.objects.create(name=name, price=1).pk
+
+        pks = await asyncio.gather(*(create.awrite(f'P{n}') for n in range(5)))
+        self.assertEqual(len(set(pks)), 5)
+        self.assertEqual(await Product.objects.filter(pk__in=pks).acount(), 5)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user('clerk')
+        user.groups.add(Group.objects.get_or_create(name='staff')[0])
+        self.client.force_login(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = Product.objects.create(name='Gallon', sku='G1', price=30)
+            Inventory.objects.create(product=self.product, quantity=40)
+
+    def get(self, url):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(url).content.decode()
+
+    def test_cached_page_is_never_stale_after_a_write(self):
+        self.assertIn('Gallon', self.get('/pos/inventory/'))
+        hits = pagecache.stats(['inventory'])['inventory']['hits']
+        self.assertIn('Gallon', self.get('/pos/inventory/'))
+        self.assertEqual(pagecache.stats(['inventory'])['inventory']['hits'], hits + 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.product.pk).update(name='Jug')
+        self.assertIn('Jug', self.get('/pos/inventory/'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Inventory.objects.filter(product=self.product).update(quantity=7)
+        self.assertRegex(self.get('/pos/inventory/'), r'stock-quantity">7<')
+
+    def test_fragment_follows_its_stamps(self):
+        driver = Driver.objects.create(name='Ana')
+        with self.captureOnCommitCallbacks(execute=True):
+            Delivery.objects.create(order=Order.objects.create(), driver=driver)
+        self.assertIn('Ana', self.get('/pos/deliveries/'))
+        self.assertIn('Ana', self.get('/pos/deliveries/'))
+        self.assertEqual(pagecache.stats(['deliveries-list'])['deliveries-list']['hits'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            driver.name = 'Ben'
+            driver.save()
+        page = self.get('/pos/deliveries/')
+        self.assertIn('Ben', page)
+        self.assertNotIn('Ana', page)
+
+    def test_reports_are_cached_per_local_day(self):
+        admin = User.objects.create_user('owner')
+        admin.groups.add(Group.objects.get_or_create(name='admin')[0])
+        self.client.force_login(admin)
+        today = timezone.localdate()
+        self.get('/pos/reports/')
+        self.get('/pos/reports/')
+        self.assertEqual(pagecache.stats(['reports'])['reports'], {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+        with mock.patch('django.utils.timezone.localdate', return_value=today + timedelta(days=1)):
+            self.get('/pos/reports/')
+        self.assertEqual(pagecache.stats(['reports'])['reports']['misses'], 2)
+
+    def test_uncommitted_writes_keep_the_old_stamp(self):
+        before = pagecache.versions.get_version('order')
+        with self.captureOnCommitCallbacks() as callbacks:
+            Order.objects.create()
+        self.assertEqual(pagecache.versions.get_version('order'), before)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(pagecache.versions.get_version('order'), before)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class RoleCacheTests(TestCase):
+    def test_membership_change_invalidates_after_commit(self):
+        cache.clear()
+        user = User.objects.create_user('clerk')
+        staff = Group.objects.create(name='staff')
+        self.assertEqual(get_roles(User.objects.get(pk=user.pk)), frozenset())
+        with self.captureOnCommitCallbacks() as callbacks:
+            user.groups.add(staff)
+        self.assertEqual(get_roles(User.objects.get(pk=user.pk)), frozenset())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(get_roles(User.objects.get(pk=user.pk)), {'staff'})
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CheckoutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user('cashier')
+        user.groups.add(Group.objects.get_or_create(name='staff')[0])
+        self.client.force_login(user)
+        self.products = [Product.objects.create(name=f'P{n}', sku=f'P{n}', price=10) for n in range(5)]
+        for product in self.products:
+            Inventory.objects.create(product=product, quantity=3)
+
+    def post(self, body, headers=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/pos/checkout/', json.dumps(body), content_type='application/json',
+                                    headers=headers)
+
+    def cart(self, count, quantity=1):
+        return {'items': [{'product': p.pk, 'quantity': quantity} for p in self.products[:count]]}
+
+    def test_malformed_bodies_are_rejected(self):
+        for body in ([], {'items': 3}, {'items': {'product': 1}}, {'customer': 'abc', **self.cart(1)},
+                     {'customer': [1], **self.cart(1)}, {'method': ['cash'], **self.cart(1)},
+                     {'items': [{'product': 'x'}]}, {'items': []}):
+            with self.subTest(body=body):
+                self.assertEqual(self.post(body).status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_idempotency_key_replays_the_first_order(self):
+        first = self.post(self.cart(2), {'Idempotency-Key': 'till-1-0001'}).json()
+        again = self.post(self.cart(2), {'Idempotency-Key': 'till-1-0001'}).json()
+        self.assertEqual(first, again)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Payment.objects.count(), 1)
+        self.assertEqual(Inventory.objects.get(product=self.products[0]).quantity, 2)
+
+    def test_oversell_is_rejected_and_rolled_back(self):
+        response = self.post({'items': [{'product': self.products[0].pk, 'quantity': 1},
+                                        {'product': self.products[1].pk, 'quantity': 4}]})
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(list(Inventory.objects.values_list('quantity', flat=True).distinct()), [3])
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        def queries(count):
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual(self.post(self.cart(count)).status_code, 200)
+            return len(captured)
+        queries(1)  # first sale of the day creates the rollup rows
+        self.assertEqual(queries(1), queries(4))
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.products = [Product.objects.create(name=f'P{n}', sku=f'P{n}', price=10) for n in range(2)]
+        # Another sale the same day, so a rebuild always has the day to rebuild.
+        self.sell(Order.objects.create(total=5), self.products[1], 1, '5.00')
+
+    def sell(self, order, product, quantity, unit_price):
+        return OrderItem.objects.create(order=order, product=product, quantity=quantity, unit_price=unit_price)
+
+    def rollups(self):
+        return (
+            sorted(HourlySales.objects.exclude(orders=0, revenue=0, payments=0)
+                   .values_list('hour', 'orders', 'revenue', 'payments')),
+            sorted(DailySales.objects.exclude(orders=0, revenue=0, payments=0)
+                   .values_list('date', 'orders', 'revenue', 'payments')),
+            sorted(ProductDailySales.objects.exclude(quantity=0, revenue=0)
+                   .values_list('date', 'product_id', 'quantity', 'revenue')),
+        )
+
+    def assertMatchesRebuild(self):
+        kept = self.rollups()
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        self.assertEqual(kept, self.rollups())
+        return kept
+
+    def test_creates_updates_and_deletes_match_a_rebuild(self):
+        order = Order.objects.create(total=30)
+        item = self.sell(order, self.products[0], 2, '10.00')
+        self.sell(order, self.products[1], 1, '10.00')
+        payment = Payment.objects.create(order=order, amount=30)
+        hours, days, products = self.assertMatchesRebuild()
+        self.assertEqual(days[0][1:], (2, 35, 30))
+        self.assertEqual([row[1:] for row in products],
+                         [(self.products[0].pk, 2, 20), (self.products[1].pk, 2, 15)])
+
+        item.quantity, item.unit_price = 3, Decimal('9.50')
+        item.save()
+        order.total = Decimal('38.50')
+        order.save()
+        payment.amount = Decimal('38.50')
+        payment.save()
+        hours, days, products = self.assertMatchesRebuild()
+        self.assertEqual(days[0][1:], (2, Decimal('43.50'), Decimal('38.50')))
+        self.assertEqual(products[0][2:], (3, Decimal('28.50')))
+
+        # Rows loaded fresh, so the deltas come from the post_init snapshots.
+        OrderItem.objects.get(pk=item.pk).delete()
+        Payment.objects.get(pk=payment.pk).delete()
+        hours, days, products = self.assertMatchesRebuild()
+        self.assertEqual(days[0][1:], (2, Decimal('43.50'), 0))
+        self.assertEqual([row[1:] for row in products], [(self.products[1].pk, 2, 15)])
+
+    def test_deleting_an_order_removes_its_items_and_payments(self):
+        before = self.rollups()
+        order = Order.objects.create(total=20)
+        self.sell(order, self.products[0], 2, '10.00')
+        Payment.objects.create(order=order, amount=20)
+        self.assertNotEqual(self.rollups(), before)
+
+        Order.objects.get(pk=order.pk).delete()
+        self.assertEqual(self.rollups(), before)
+        self.assertEqual(self.assertMatchesRebuild(), before)
+
+
+class ProductIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = ProductIndex()
+        self.index.build((
+            {'id': n, 'name': f'Mineral water {n} litre', 'sku': f'MW-{n:05d}', 'price': '25.00'}
+            for n in range(30000)
+        ), 'v1')
+
+    def test_typeahead_latency(self):
+        timings = []
+        for query in ('min', 'mineral wa', 'mw-0', 'mw-123', '1234', 'litre', 'water 99', 'zzz') * 25:
+            start = time.perf_counter()
+            self.index.search(query)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        self.assertLess(timings[int(len(timings) * 0.95)], 0.010)
+
+    def test_changes_go_to_a_copy(self):
+        before = [doc['id'] for doc in self.index.search('mw-00012')]
+        changed = self.index.copy()
+        changed.add({'id': 30000, 'name': 'Mineral water jug', 'sku': 'MW-000120', 'price': '90.00'})
+        changed.remove(12)
+        self.assertEqual([doc['id'] for doc in self.index.search('mw-00012')], before)
+        self.assertEqual(self.index.search('jug'), [])
+        self.assertIn(12, before)
+        after = [doc['id'] for doc in changed.search('mw-00012')]
+        self.assertIn(30000, after)
+        self.assertNotIn(12, after)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PaginationTests(TestCase):
+    ordering = ('-created_at', '-id')
+
+    def setUp(self):
+        cache.clear()
+        Customer.objects.bulk_create(Customer(name=f'C{n}') for n in range(55))
+        # Most rows share a created_at, so only the id breaks the ties.
+        moment = timezone.now().replace(microsecond=123456)
+        Customer.objects.filter(pk__lte=Customer.objects.order_by('pk')[49].pk).update(created_at=moment)
+        self.expected = list(Customer.objects.order_by(*self.ordering).values_list('pk', flat=True))
+
+    def test_cursors_walk_ties_without_gaps_or_repeats(self):
+        seen, cursor = [], None
+        while True:
+            page = pagination.paginate(Customer.objects.all(), self.ordering, cursor, page_size=7)
+            seen.extend(customer.pk for customer in page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, self.expected)
+
+    def test_tampered_or_garbage_cursors_are_404(self):
+        cursor = pagination.paginate(Customer.objects.all(), self.ordering, page_size=7).next_cursor
+        short = signing.dumps([1], salt=pagination.CURSOR_SALT)
+        for bad in (cursor[:-1] + ('A' if cursor[-1] != 'A' else 'B'), 'garbage', short, cursor + ':x'):
+            with self.subTest(cursor=bad), self.assertRaises(Http404):
+                pagination.paginate(Customer.objects.all(), self.ordering, bad)
+
+    def test_json_variant(self):
+        user = User.objects.create_user('cashier')
+        user.groups.add(Group.objects.get_or_create(name='staff')[0])
+        self.client.force_login(user)
+        first = self.client.get('/pos/customers/', {'format': 'json'}).json()
+        self.assertEqual(len(first['results']), pagination.PAGE_SIZE)
+        self.assertEqual(set(first['results'][0]), {'id', 'name', 'phone', 'address', 'created_at'})
+        second = self.client.get('/pos/customers/', {'cursor': first['next']},
+                                 headers={'Accept': 'application/json'}).json()
+        self.assertIsNone(second['next'])
+        self.assertEqual([row['id'] for row in first['results'] + second['results']], self.expected)
+        self.assertEqual(self.client.get('/pos/customers/', {'format': 'json', 'cursor': 'x'}).status_code, 404)
+
+
+class ExportStreamTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('owner')
+        self.user.groups.add(Group.objects.get_or_create(name='admin')[0])
+        order = Order.objects.create()
+        Payment.objects.bulk_create(Payment(order=order, amount=n) for n in range(1, 51))
+
+    async def test_chunks_are_made_as_they_are_sent(self):
+        made = []
+
+        def chunks():
+            for n in range(3):
+                made.append(n)
+                yield b'%d' % n
+        stream = astream(chunks())
+        self.assertEqual(await anext(stream), b'0')
+        self.assertEqual(made, [0])
+        self.assertEqual([chunk async for chunk in stream], [b'1', b'2'])
+
+    async def test_asgi_export_is_sent_incrementally(self):
+        await self.async_client.aforce_login(self.user)
+        with mock.patch('pos.exports.FLUSH_BYTES', 200):
+            response = await self.async_client.get('/pos/export/payments/')
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertGreater(len(chunks), 2)
+        lines = b''.join(chunks).decode().splitlines()
+        self.assertEqual(lines[0], 'id,order_id,amount,method,recorded_at')
+        self.assertEqual(len(lines), 51)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ImporterTests(TestCase):
+    def run_import(self, kind, content, fmt='csv', batch_size=2):
+        with self.captureOnCommitCallbacks(execute=True):
+            return import_file(kind, io.BytesIO(content), fmt, batch_size)
+
+    def test_products_are_created_then_updated_by_sku(self):
+        result = self.run_import('products', b'\xef\xbb\xbfsku,name,price\nA1,Gallon,30\nB2,Jug,45.50\nC3,Cap,x\n')
+        self.assertEqual((result.created, result.updated, result.failed), (2, 0, 1))
+        self.assertEqual(result.errors[0][0], 4)
+        before = Product.objects.get(sku='A1').updated_at
+
+        result = self.run_import('products', b'sku,name,price\nA1,Gallon refill,28\nD4,Lid,5\n')
+        self.assertEqual((result.created, result.updated), (1, 1))
+        product = Product.objects.get(sku='A1')
+        self.assertEqual((product.name, product.price), ('Gallon refill', 28))
+        self.assertGreater(product.updated_at, before)
+        self.assertEqual([doc['name'] for doc in get_index().search('gallon')], ['Gallon refill'])
+
+    def test_lines_that_are_not_utf8_are_reported(self):
+        result = self.run_import('customers', b'name,phone\nAna,0917 111 2222\nB\xffn,0917 333\nCara,0917 444\n')
+        self.assertEqual((result.created, result.failed), (2, 1))
+        self.assertEqual(result.errors[0][0], 3)
+        self.assertIn('utf-8', result.errors[0][1])
+
+        result = self.run_import('customers', b'{"name": "Dan"}\n\xff\n{"name": "Eve"}\n', fmt='ndjson')
+        self.assertEqual((result.created, result.failed), (2, 1))
+        self.assertEqual(result.errors[0][0], 2)
+
+    def test_ambiguous_keys_are_reported_and_ids_match_exactly(self):
+        first = Customer.objects.create(name='Ana', phone='0917 111')
+        second = Customer.objects.create(name='Ana Jr', phone='0917 111')
+        result = self.run_import('customers', b'name,phone,address\nAna,0917 111,Street 1\n')
+        self.assertEqual((result.created, result.updated, result.failed), (0, 0, 1))
+        self.assertIn('matches 2 customers', result.errors[0][1])
+        self.assertFalse(Customer.objects.exclude(address='').exists())
+
+        result = self.run_import(
+            'customers', f'id,name,phone,address\n{second.pk},Ana Jr,0917 222,Street 2\n999,Nobody,,\n'.encode(),
+        )
+        self.assertEqual((result.created, result.updated, result.failed), (0, 1, 1))
+        self.assertEqual(result.errors, [(3, 'Unknown id 999')])
+        second.refresh_from_db()
+        self.assertEqual((second.phone, second.address), ('0917 222', 'Street 2'))
+        first.refresh_from_db()
+        self.assertEqual(first.address, '')
+
+    def test_products_and_inventory_reject_shared_skus(self):
+        Product.objects.create(name='Gallon', sku='A1', price=30)
+        Product.objects.create(name='Gallon (old)', sku='A1', price=25)
+        result = self.run_import('products', b'sku,name,price\nA1,Gallon,28\n')
+        self.assertEqual((result.updated, result.failed), (0, 1))
+        self.assertEqual(sorted(Product.objects.values_list('price', flat=True)), [25, 30])
+        result = self.run_import('inventory', b'sku,quantity\nA1,40\n')
+        self.assertEqual(result.errors, [(2, 'SKU A1 matches 2 products')])
+        self.assertFalse(Inventory.objects.exists())
+
+    def test_inventory_needs_a_known_sku(self):
+        product = Product.objects.create(name='Gallon', sku='A1', price=30)
+        result = self.run_import('inventory', b'sku,quantity\nA1,40\nZZ,3\n')
+        self.assertEqual((result.created, result.failed), (1, 1))
+        self.assertEqual(result.errors, [(3, 'Unknown SKU ZZ')])
+        result = self.run_import('inventory', b'sku,quantity,low_threshold\nA1,12,2\n')
+        self.assertEqual(result.updated, 1)
+        inventory = Inventory.objects.get(product=product)
+        self.assertEqual((inventory.quantity, inventory.low_threshold), (12, 2))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class StockCrossingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def crossings(self):
+        return list(OutboxEvent.objects.filter(payload__payload__title__in=['Low stock', 'Restocked'])
+                    .order_by('pk').values_list('payload__payload__title', flat=True))
+
+    def write(self, change):
+        tracker = stock.get_tracker()
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        # Applied in place on commit, not reloaded, and still what the table says.
+        self.assertIs(stock.get_tracker(), tracker)
+        low = stock.levels(Inventory.objects.low_stock())
+        self.assertEqual(tracker.items(), sorted(low.values(), key=lambda row: row['quantity'] - row['low_threshold']))
+
+    def test_each_write_path_emits_one_event_per_crossing(self):
+        def upsert(product, quantity):
+            Inventory.objects.bulk_create([Inventory(product=product, quantity=quantity)], update_conflicts=True,
+                                          unique_fields=['product'], update_fields=['quantity'])
+
+        paths = {
+            'update': (lambda p, q: Inventory.objects.filter(product=p).update(quantity=q),
+                       lambda p, q: Inventory.objects.filter(product=p).update(quantity=F('quantity') + q)),
+            'take': (lambda p, q: Inventory.objects.take({p.pk: q}),
+                     lambda p, q: Inventory.objects.move({p.pk: q}, StockMovement.RESTOCK)),
+            'bulk_create': (upsert, upsert),
+        }
+        for name, (down, up) in paths.items():
+            with self.subTest(path=name):
+                OutboxEvent.objects.all().delete()
+                product = Product.objects.create(name=f'Gallon {name}', sku=name, price=30)
+                self.write(lambda: Inventory.objects.create(product=product, quantity=10, low_threshold=5))
+                self.write(lambda: down(product, 7 if name == 'take' else 3))
+                self.write(lambda: down(product, 1 if name == 'take' else 2))  # still low: no second alert
+                self.assertEqual(self.crossings(), ['Low stock'])
+                self.write(lambda: up(product, 10 if name != 'bulk_create' else 12))
+                self.assertEqual(self.crossings(), ['Low stock', 'Restocked'])
+                self.assertEqual(Inventory.objects.get(product=product).quantity, 12)
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Gallon', sku='G1', price=30)
+        self.inventory = Inventory.objects.create(product=self.product, quantity=10)
+
+    def set_quantity(self, quantity):
+        self.inventory.quantity = quantity
+        self.inventory.save()
+
+    def test_movements_cannot_be_changed_or_deleted(self):
+        movement = StockMovement.objects.get(product=self.product)
+        with self.assertRaises(TypeError):
+            movement.save()
+        with self.assertRaises(TypeError):
+            movement.delete()
+        with self.assertRaises(TypeError):
+            StockMovement.objects.update(quantity=0)
+        with self.assertRaises(TypeError):
+            StockMovement.objects.all().delete()
+
+    def test_products_with_stock_history_cannot_be_deleted(self):
+        with self.assertRaises(models.ProtectedError):
+            self.product.delete()
+        self.assertEqual(StockMovement.objects.filter(product=self.product).count(), 1)
+        self.assertTrue(Inventory.objects.filter(pk=self.inventory.pk).exists())
+
+        unstocked = Product.objects.create(name='Cap', sku='C1', price=5)
+        Inventory.objects.create(product=unstocked, quantity=0)
+        unstocked.delete()
+        self.assertFalse(Inventory.objects.filter(product_id=unstocked.pk).exists())
+
+    def test_deleting_a_delivery_cascades_to_its_transitions(self):
+        delivery = Delivery.objects.create(order=Order.objects.create())
+        self.assertTrue(DeliveryStatusTransition.objects.filter(delivery=delivery).exists())
+        delivery.delete()
+        self.assertFalse(DeliveryStatusTransition.objects.exists())
+
+    def test_stock_at_reads_snapshots_and_the_tail_after_them(self):
+        first = timezone.now()
+        self.set_quantity(7)
+        self.assertEqual(ledger.compact(), 1)
+        self.assertEqual(ledger.compact(), 0)
+        second = timezone.now()
+        self.set_quantity(12)
+        self.assertEqual(ledger.compact(min_tail=2), 0)
+
+        self.assertEqual(ledger.stock_at(self.product.pk, first), 10)
+        self.assertEqual(ledger.stock_at(self.product.pk, second), 7)
+        self.assertEqual(ledger.stock_at(self.product.pk, timezone.now()), 12)
+
+        self.assertEqual(ledger.compact(), 1)
+        snapshot = StockSnapshot.objects.order_by('through').last()
+        self.assertEqual(snapshot.quantity, 12)
+        self.assertEqual(ledger.stock_at(self.product.pk, timezone.now()), 12)
+        self.assertEqual(ledger.stock_at(self.product.pk, second), 7)
+
+    def test_reconcile_finds_drift_and_rematerialize_repairs_it(self):
+        other = Product.objects.create(name='Jug', sku='J1', price=45)
+        Inventory.objects.create(product=other, quantity=0)
+        self.assertEqual(list(ledger.reconcile()), [])
+
+        models.QuerySet.update(Inventory.objects.filter(product=self.product), quantity=4)
+        models.QuerySet.update(Inventory.objects.filter(product=other), quantity=3)
+        drift = sorted(ledger.reconcile())
+        self.assertEqual(drift, [(self.product.pk, 4, 10), (other.pk, 3, 0)])
+
+        movements = StockMovement.objects.count()
+        self.assertEqual(ledger.rematerialize({pid: total for pid, _, total in drift}), 2)
+        self.assertEqual(list(ledger.reconcile()), [])
+        self.assertEqual(StockMovement.objects.count(), movements)
+        self.assertEqual(Inventory.objects.get(product=self.product).quantity, 10)
+
+
+class RoutePlanTests(SimpleTestCase):
+    KM = routeplan.EARTH_RADIUS_KM * math.pi / 180  # per degree at the equator
+
+    def on_line(self, *xs):
+        xy = np.array([(x, 0.0) for x in xs])
+        return routeplan.distance_matrix(xy)
+
+    def point(self, x, y):
+        """``(lat, lng)`` ``x`` km east and ``y`` km north of (0, 0)."""
+        return y / self.KM, x / self.KM
+
+    def test_nearest_neighbour_takes_the_closest_unvisited_node(self):
+        dist = self.on_line(0, 3, 1, 2, 10)
+        self.assertEqual(routeplan.nearest_neighbour(dist).tolist(), [0, 2, 3, 1, 4])
+        self.assertEqual(routeplan.nearest_neighbour(dist, start=1).tolist(), [1, 3, 2, 0, 4])
+
+    def test_two_opt_uncrosses_and_keeps_the_ends(self):
+        dist = self.on_line(0, 3, 2, 1, 4)
+        self.assertEqual(routeplan.two_opt([0, 1, 2, 3, 4], dist).tolist(), [0, 3, 2, 1, 4])
+        # Corners of a unit square visited crosswise.
+        square = routeplan.distance_matrix(np.array([(0, 0), (1, 1), (1, 0), (0, 1), (0, 2)], dtype=float))
+        self.assertEqual(routeplan.two_opt([0, 1, 2, 3, 4], square).tolist(), [0, 2, 1, 3, 4])
+        self.assertEqual(routeplan.two_opt([0, 2, 1], dist).tolist(), [0, 2, 1])
+
+    def test_zones_group_points_by_grid_cell(self):
+        xy = np.array([(0.5, 0.5), (1.0, 2.0), (3.5, 0.1), (-0.2, 0.0), (2.9, 2.9)])
+        self.assertEqual(routeplan.zones(xy, 3.0), {(0, 0): [0, 1, 4], (1, 0): [2], (-1, 0): [3]})
+
+    def test_stops_are_ordered_zone_by_zone(self):
+        self.assertEqual(routeplan.order_stops([], (0.0, 0.0)), ([], 0.0))
+        points = [self.point(*xy) for xy in [(7.5, 0.5), (0.5, 1.0), (7.0, 0.5), (1.0, 0.5), (1.5, 1.0)]]
+        order, km = routeplan.order_stops(points, (0.0, 0.0))
+        self.assertEqual(order, [1, 3, 4, 2, 0])
+        expected = math.hypot(0.5, 1.0) + 2 * math.hypot(0.5, 0.5) + math.hypot(5.5, 0.5) + 0.5
+        self.assertAlmostEqual(km, expected, places=2)
+
+    def test_stops_on_a_street_are_visited_in_order(self):
+        points = [self.point(x, 0.0) for x in (4.0, 1.0, 9.0, 2.5, 6.0)]
+        order, km = routeplan.order_stops(points, (0.0, 0.0))
+        self.assertEqual(order, [1, 3, 0, 4, 2])
+        self.assertAlmostEqual(km, 9.0, places=2)
+
+
+class DispatchTests(SimpleTestCase):
+    def driver(self, pk, capacity=20, shift=(None, None)):
+        return Driver(id=pk, name=f'D{pk}', capacity=capacity, shift_start=shift[0], shift_end=shift[1])
+
+    def delivery(self, pk, hour=10):
+        return Delivery(id=pk, order_id=pk, scheduled_at=timezone.make_aware(datetime(2026, 1, 5, hour)))
+
+    def test_greedy_gives_each_delivery_to_the_least_loaded_driver(self):
+        drivers = [self.driver(1), self.driver(2)]
+        deliveries = [self.delivery(n) for n in range(1, 5)]
+        loads = Counter({1: 2, 2: 0})
+        assigned = dispatch.greedy(deliveries, drivers, loads)
+        self.assertEqual([assigned[d] for d in deliveries], [2, 2, 1, 2])
+        self.assertEqual(loads, Counter({1: 3, 2: 3}))
+
+    def test_greedy_respects_capacity(self):
+        drivers = [self.driver(1, capacity=1), self.driver(2, capacity=2)]
+        deliveries = [self.delivery(n) for n in range(1, 6)]
+        loads = Counter({1: 0, 2: 1})
+        assigned = dispatch.greedy(deliveries, drivers, loads)
+        self.assertEqual(assigned, {deliveries[0]: 1, deliveries[1]: 2})
+        self.assertEqual(loads, Counter({1: 1, 2: 2}))
+
+    def test_greedy_respects_shifts(self):
+        drivers = [
+            self.driver(1, shift=(dtime(8), dtime(12))),
+            self.driver(2, shift=(dtime(22), dtime(6))),  # overnight
+            self.driver(3),
+        ]
+        deliveries = [self.delivery(1, 9), self.delivery(2, 23), self.delivery(3, 3), self.delivery(4, 15)]
+        assigned = dispatch.greedy(deliveries, drivers, Counter({1: 5, 2: 5, 3: 10}))
+        self.assertEqual([assigned[d] for d in deliveries], [1, 2, 2, 3])
+
+        drivers = [self.driver(1, shift=(dtime(8), dtime(12)))]
+        self.assertEqual(dispatch.greedy([self.delivery(1, 13)], drivers, Counter({1: 0})), {})
+
+    def test_improve_moves_stops_to_the_zone_owner(self):
+        drivers = [self.driver(1), self.driver(2), self.driver(3, capacity=3)]
+        near, far, full = self.delivery(1), self.delivery(2), self.delivery(3)
+        assigned = {near: 2, far: 2, full: 1}
+        loads = Counter({1: 3, 2: 3, 3: 3})
+        owners = defaultdict(Counter, {(0, 0): Counter({1: 4}), (5, 5): Counter({1: 3}), (9, 9): Counter({3: 5})})
+        zone_of = {near.id: (0, 0), far.id: (5, 5), full.id: (9, 9)}
+
+        self.assertEqual(dispatch.improve(assigned, drivers, loads, zone_of, owners), 1)
+        # far stays: its zone owner ends up busier; full stays: driver 3 has no room.
+        self.assertEqual(assigned, {near: 1, far: 2, full: 1})
+        self.assertEqual(loads, Counter({1: 4, 2: 2, 3: 3}))
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    DRIVER_AUTO_ASSIGN=True,
+)
+class DispatchFlushTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(dispatch, '_checked_until', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.drivers = [Driver.objects.create(name='Ana', capacity=2), Driver.objects.create(name='Ben', capacity=2)]
+        self.deliveries = [Delivery.objects.create(order=Order.objects.create()) for _ in range(3)]
+
+    def test_flush_waits_for_the_window_then_assigns(self):
+        self.assertEqual(dispatch.flush(window=60), 0)
+        self.assertEqual(dispatch.flush(window=0), 3)
+        loads = Counter(Delivery.objects.values_list('driver_id', flat=True))
+        self.assertEqual(sorted(loads.values()), [1, 2])
+        self.assertEqual(OutboxEvent.objects.filter(payload__payload__type='assignment').count(), 3)
+
+        # Nothing new since: the idle poll does not run an assignment.
+        Delivery.objects.create(order=Order.objects.create())
+        with mock.patch.object(dispatch, 'assign_all') as assign_all:
+            self.assertEqual(dispatch.flush(window=60), 0)
+        assign_all.assert_not_called()
+        self.assertEqual(dispatch.flush(window=0), 1)
+
+    def test_deliveries_nobody_can_take_do_not_hold_back_later_ones(self):
+        Delivery.objects.all().delete()
+        Driver.objects.filter(pk=self.drivers[1].pk).delete()
+        Driver.objects.filter(pk=self.drivers[0].pk).update(shift_start=dtime(8), shift_end=dtime(17), capacity=5)
+        day = timezone.localdate()
+        for hour in (3, 3, 3, 12, 12):
+            Delivery.objects.create(order=Order.objects.create(),
+                                    scheduled_at=timezone.make_aware(datetime.combine(day, dtime(hour))))
+        self.assertEqual(dispatch.assign_all(batch_size=3), 2)
+        assigned = Delivery.objects.filter(driver__isnull=False)
+        self.assertEqual(sorted(timezone.localtime(d.scheduled_at).hour for d in assigned), [12, 12])
+        self.assertEqual(Delivery.objects.filter(driver__isnull=True).count(), 3)
+
+    @override_settings(DRIVER_AUTO_ASSIGN=False)
+    def test_flush_is_off_without_auto_assign(self):
+        self.assertEqual(dispatch.flush(window=0), 0)
+        self.assertFalse(Delivery.objects.filter(driver__isnull=False).exists())
+
+
+class SketchTests(SimpleTestCase):
+    def test_quantiles_are_within_the_relative_accuracy(self):
+        rng = random.Random(7)
+        values = sorted(rng.lognormvariate(7, 1) for _ in range(5000))
+        sketch = sla.Sketch()
+        for value in values:
+            sketch.add(value)
+        for q in (0.01, 0.25, 0.5, 0.9, 0.99, 1):
+            exact = values[int(q * (len(values) - 1))]
+            self.assertLessEqual(abs(sketch.quantile(q) - exact), sla.RELATIVE_ACCURACY * exact, q)
+
+    def test_merged_and_serialised_sketches_match(self):
+        left, right, whole = sla.Sketch(), sla.Sketch(), sla.Sketch()
+        for n, value in enumerate([0.2, 5, 60, 61, 900, 3600, 4000]):
+            (left if n % 2 else right).add(value)
+            whole.add(value)
+        merged = sla.Sketch.from_json(left.to_json()).merge(sla.Sketch.from_json(right.to_json()))
+        self.assertEqual(merged.count, 7)
+        self.assertEqual(merged.to_json(), whole.to_json())
+        self.assertEqual(merged.quantile(0), 0.0)
+        self.assertIsNone(sla.Sketch().quantile(0.5))
+
+
+class SLATests(TestCase):
+    def setUp(self):
+        self.driver = Driver.objects.create(name='Ana')
+        self.delivery = Delivery.objects.create(order=Order.objects.create(), driver=self.driver)
+
+    def rows(self):
+        return {row.driver_id: row for row in DeliverySLA.objects.all()}
+
+    def history(self):
+        return list(self.delivery.transitions.order_by('id').values_list('from_status', 'to_status'))
+
+    def test_save_records_transitions_and_counts_the_first_delivery(self):
+        self.delivery.status = 'in_transit'
+        self.delivery.save()
+        self.delivery.status = 'delivered'
+        self.delivery.save()
+        self.assertEqual(self.history(), [('', 'pending'), ('pending', 'in_transit'), ('in_transit', 'delivered')])
+        rows = self.rows()
+        self.assertEqual(set(rows), {None, self.driver.pk})
+        self.assertEqual((rows[None].delivered, rows[None].late), (1, 0))
+        self.assertIsNotNone(rows[None].p50_seconds)
+
+        self.delivery.status = 'in_transit'
+        self.delivery.save()
+        self.delivery.status = 'delivered'
+        self.delivery.save()
+        self.assertEqual(self.rows()[None].delivered, 1)
+
+    def test_update_records_every_changed_delivery(self):
+        other = Delivery.objects.create(order=Order.objects.create(), scheduled_at=timezone.now() - timedelta(hours=2))
+        Delivery.objects.filter(pk__in=[self.delivery.pk, other.pk]).update(status='delivered')
+        self.assertEqual(self.history(), [('', 'pending'), ('pending', 'delivered')])
+        rows = self.rows()
+        self.assertEqual((rows[None].delivered, rows[None].late), (2, 1))
+        self.assertEqual(rows[self.driver.pk].delivered, 1)
+
+    def test_separate_deliveries_add_to_the_day_rows(self):
+        other = Delivery.objects.create(order=Order.objects.create(), driver=self.driver)
+        for delivery in (self.delivery, other):
+            delivery.status = 'delivered'
+            delivery.save()
+        rows = self.rows()
+        self.assertEqual(set(rows), {None, self.driver.pk})
+        for row in rows.values():
+            self.assertEqual((row.delivered, sla.Sketch.from_json(row.sketch).count), (2, 2))
+
+    def test_a_failed_record_leaves_nothing_behind(self):
+        with mock.patch.object(sla, '_deliveries_done', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                sla.record([(self.delivery.pk, 'pending', 'delivered', None)], DeliveryStatusTransition.POS)
+        self.assertEqual(self.history(), [('', 'pending')])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CustomerSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.ana = Customer.objects.create(name='Ana Cruz', phone='+63 917 123 4567', address='12 Rizal St')
+        self.ben = Customer.objects.create(name='Ben Santos', phone='0918 765 4321', address='Unit 5 Mabini Ave')
+
+    def found(self, query):
+        return [row['id'] for row in customer_search.search(query)]
+
+    def test_phone_keys_cover_every_way_a_number_is_typed(self):
+        self.assertEqual(customer_search.phone_keys('+63 917 123 4567'), ['639171234567', '9171234567', '09171234567'])
+        self.assertEqual(customer_search.phone_keys('0917-123'), ['0917123', '917123', '63917123'])
+        self.assertEqual(customer_search.phone_keys(''), [])
+
+    def test_match_expression(self):
+        self.assertEqual(customer_search.match_expression('  Ana  cr '), '"ana"* "cr"*')
+        self.assertEqual(customer_search.match_expression('0917 12'), 'phones : "091712"* OR ("0917"* "12"*)')
+        self.assertEqual(customer_search.match_expression('12'), 'phones : "12"* OR ("12"*)')
+        self.assertEqual(customer_search.match_expression('a'), '')
+
+    def test_names_phones_and_addresses_are_found(self):
+        self.assertEqual(self.found('ana'), [self.ana.pk])
+        self.assertEqual(self.found('san'), [self.ben.pk])
+        self.assertEqual(self.found('0917 123'), [self.ana.pk])
+        self.assertEqual(self.found('+63917'), [self.ana.pk])
+        self.assertEqual(self.found('918'), [self.ben.pk])
+        self.assertEqual(self.found('12'), [self.ana.pk])  # house number
+        self.assertEqual(self.found('mabini 5'), [self.ben.pk])
+        self.assertEqual(self.found('x'), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.ana.name = 'Anabel Reyes'
+        self.ana.save()
+        self.assertEqual(self.found('reyes'), [self.ana.pk])
+        self.assertEqual(self.found('cruz'), [])
+        self.ben.delete()
+        self.assertEqual(self.found('ben'), [])
+
+        Customer.objects.filter(pk=self.ana.pk).update(name='Carla')  # skips signals
+        customer_search.index([self.ana.pk])
+        self.assertEqual(self.found('carla'), [self.ana.pk])
+        self.assertEqual(customer_search.rebuild(), 1)
+        self.assertEqual(self.found('carla'), [self.ana.pk])
+
+    def test_typeahead_endpoint(self):
+        user = User.objects.create_user('cashier')
+        user.groups.add(Group.objects.get_or_create(name='staff')[0])
+        self.client.force_login(user)
+        response = self.client.get('/pos/customers/search/', {'q': 'ben', 'limit': 'x'})
+        self.assertEqual(response.json()['results'], [
+            {'id': self.ben.pk, 'name': 'Ben Santos', 'phone': '0918 765 4321', 'address': 'Unit 5 Mabini Ave'},
+        ])
+        self.assertEqual(self.client.get('/pos/customers/search/', {'q': 'a'}).json(), {'results': []})
+
+        self.client.force_login(User.objects.create_user('buyer'))
+        self.assertEqual(self.client.get('/pos/customers/search/', {'q': 'ben'}).status_code, 302)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('owner')
+        self.user.groups.add(Group.objects.get_or_create(name='admin')[0])
+        self.client.force_login(self.user)
+        self.product = Product.objects.create(name='Gallon', sku='G1', price=30)
+        self.inventory = Inventory.objects.create(product=self.product, quantity=40)
+
+    def etag(self, url='/pos/inventory/'):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def status(self, etag, url='/pos/inventory/'):
+        return self.client.get(url, headers={'If-None-Match': etag}).status_code
+
+    def test_every_kind_of_write_changes_the_etag(self):
+        etag = self.etag()
+        self.assertEqual(self.status(etag), 304)
+
+        self.inventory.quantity = 30
+        self.inventory.save()
+        self.assertEqual(self.status(etag), 200)
+
+        etag = self.etag()
+        Product.objects.filter(pk=self.product.pk).update(price=32)
+        self.assertEqual(self.status(etag), 200)
+
+        etag = self.etag()
+        import_file('inventory', io.BytesIO(b'sku,quantity\nG1,12\n'), 'csv')
+        self.assertEqual(self.status(etag), 200)
+
+        etag = self.etag()
+        ledger.rematerialize({self.product.pk: 25})
+        self.assertEqual(self.status(etag), 200)
+        self.assertEqual(self.status(self.etag()), 304)
+
+    def test_reports_etag_changes_with_the_local_date(self):
+        response = self.client.get('/pos/reports/')
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+        self.assertEqual(self.status(etag, '/pos/reports/'), 304)
+        with mock.patch('django.utils.timezone.localdate', return_value=timezone.localdate() + timedelta(days=1)):
+            self.assertEqual(self.status(etag, '/pos/reports/'), 200)
+
+
+class UnixSocketLayerTests(SimpleTestCase):
+    async def test_stray_group_entries_are_dropped(self):
+        with tempfile.TemporaryDirectory() as path:
+            layer = UnixSocketChannelLayer(path)
+            channel = await layer.new_channel()
+            await layer.group_add('staff', channel)
+            stray = os.path.join(path, 'groups', 'staff', '.staff.swp')
+            open(stray, 'w').close()
+            await layer.group_send('staff', {'type': 'stock.changed'})
+            self.assertEqual((await layer.receive(channel))['type'], 'stock.changed')
+            self.assertFalse(os.path.exists(stray))
+            await layer.close()
+
+    async def test_dot_group_names_are_rejected(self):
+        with tempfile.TemporaryDirectory() as path:
+            layer = UnixSocketChannelLayer(path)
+            channel = await layer.new_channel()
+            for group in ('.', '..'):
+                with self.subTest(group=group), self.assertRaises(TypeError):
+                    await layer.group_add(group, channel)
+            self.assertFalse(os.path.exists(os.path.join(path, 'groups')))
+            await layer.close()
+
+    async def test_group_file_system_work_runs_off_the_event_loop(self):
+        with tempfile.TemporaryDirectory() as path:
+            layer = UnixSocketChannelLayer(path)
+            channel = await layer.new_channel()
+            loop_thread = threading.get_ident()
+            threads = []
+            members = layer._members
+
+            def recording_members(group):
+                threads.append(threading.get_ident())
+                return members(group)
+
+            with mock.patch.object(layer, '_members', recording_members):
+                await layer.group_add('staff', channel)
+                await layer.group_send('staff', {'type': 'stock.changed'})
+                await layer.group_discard('staff', channel)
+            self.assertEqual((await layer.receive(channel))['type'], 'stock.changed')
+            self.assertEqual(len(threads), 3)
+            self.assertNotIn(loop_thread, threads)
+            await layer.flush()
+            await layer.close()
+
+
+class FrameRecorder(CoalescingConsumerMixin):
+    flush_interval = 0
+
+    def __init__(self, batch_frames):
+        self.batch_frames = batch_frames
+        self.frames = []
+
+    async def send(self, text_data=None, bytes_data=None):
+        self.frames.append(json.loads(text_data))
+
+
+class OutboundFrameTests(SimpleTestCase):
+    async def test_only_batching_consumers_get_batch_frames(self):
+        for batch_frames in (True, False):
+            consumer = FrameRecorder(batch_frames)
+            consumer.push(group_event({'type': 'delivery_update', 'status': 'pending'}, entity='delivery:1'))
+            consumer.push(group_event({'type': 'delivery_update', 'status': 'in_transit'}, entity='delivery:1'))
+            consumer.push(group_event({'type': 'order_update'}))
+            await asyncio.sleep(0.01)
+            events = [
+                {'type': 'delivery_update', 'status': 'in_transit'},
+                {'type': 'order_update'},
+            ]
+            if batch_frames:
+                self.assertEqual(consumer.frames, [{'type': 'batch', 'events': events}])
+            else:
+                self.assertEqual(consumer.frames, events)
+
+
+@mock.patch('pos.outbound.GAP_TIMEOUT', 0)
+class OrderedDeliveryTests(TestCase):
+    group = 'staff_group'
+
+    def setUp(self):
+        self.consumer = FrameRecorder(batch_frames=False)
+        self.consumer._seen = {self.group: 0}
+        outbox.publish_many((self.group, group_event({'n': n})) for n in range(1, 4))
+        self.events = list(OutboxEvent.objects.order_by('seq'))
+
+    def live(self, seq):
+        self.consumer.push(sequenced(group_event({'n': seq}), self.group, seq))
+
+    def received(self):
+        return [frame['n'] if 'n' in frame else frame['type'] for frame in self.consumer.frames]
+
+    async def test_early_arrivals_wait_for_the_gap(self):
+        self.live(2)
+        self.live(3)
+        self.live(1)
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.received(), [1, 2, 3])
+
+    async def test_gap_is_filled_from_the_log(self):
+        await database_sync_to_async(outbox.finish)([event.pk for event in self.events], [])
+        self.live(3)
+        await asyncio.sleep(0.2)
+        self.assertEqual(self.received(), [1, 2, 3])
+        self.assertEqual(self.consumer._seen[self.group], 3)
+
+    async def test_lost_events_ask_for_a_resync(self):
+        await database_sync_to_async(outbox.finish)([event.pk for event in self.events], [])
+        await OutboxEvent.objects.filter(seq=1).adelete()
+        self.live(3)
+        await asyncio.sleep(0.2)
+        self.assertEqual(self.received(), ['resync'])
+        self.live(4)
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.received(), ['resync', 4])
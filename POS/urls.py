@@ -5,9 +5,18 @@ app_name = 'pos'
 
 urlpatterns = [
     path('cashier/', views.cashier, name='cashier'),
+    path('checkout/', views.checkout, name='checkout'),
+    path('catalog/', views.catalog, name='catalog'),
+    path('catalog/search/', views.product_search, name='product_search'),
     path('customers/', views.customers, name='customers'),
+    path('customers/search/', views.customer_search, name='customer_search'),
     path('inventory/', views.inventory, name='inventory'),
     path('deliveries/', views.deliveries, name='deliveries'),
+    path('deliveries/assign/', views.assign_drivers, name='assign_drivers'),
     path('payments/', views.payments, name='payments'),
     path('reports/', views.reports, name='reports'),
+    path('export/<str:kind>/', views.export, name='export'),
+    path('import/', views.bulk_import, name='import'),
+    path('replica/lag/', views.replica_lag, name='replica_lag'),
+    path('cache/stats/', views.page_cache_stats, name='page_cache_stats'),
 ]
@@ -0,0 +1,55 @@
+"""Cache-backed version stamps for data that clients keep copies of.
+
+Every stamp is an opaque token that changes whenever ``bump`` is called for
+its name. Stamps live in the shared cache so all worker processes agree on
+them; a missing stamp is simply re-created, which only costs clients one
+extra download.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+STAMP_TIMEOUT = None  # never expire on their own
+
+
+def _key(name):
+    return f"version:{name}"
+
+
+def get_versions(*names):
+    """Return ``{name: token}`` for the given stamp names."""
+    keys = {_key(name): name for name in names}
+    found = cache.get_many(list(keys))
+    missing = {key: time.time_ns() for key in keys if key not in found}
+    for key, value in missing.items():
+        cache.add(key, value, STAMP_TIMEOUT)
+    if missing:
+        found.update(cache.get_many(list(missing)))
+    return {keys[key]: found[key] for key in keys}
+
+
+def get_version(name):
+    return get_versions(name)[name]
+
+
+def bump(*names):
+    """Give the named stamps a fresh token and return the new value."""
+    token = time.time_ns()
+    cache.set_many({_key(name): token for name in names}, STAMP_TIMEOUT)
+    return token
+
+
+def bump_on_commit(*names, using=DEFAULT_DB_ALIAS):
+    """Bump the named stamps once the current transaction commits.
+
+    Bumping earlier would let a reader cache rows that are about to change
+    under the new stamp.
+    """
+    transaction.on_commit(lambda: bump(*names), using=using)
+
+
+def etag(*names):
+    """A strong ETag built from the named stamps, e.g. ``"product.inventory:1-2"``."""
+    versions = get_versions(*names)
+    return '"%s:%s"' % ('.'.join(names), '-'.join(str(versions[n]) for n in names))
@@ -1,49 +1,295 @@
 
+import json
+
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Product, Customer, Inventory, Order, OrderItem, Payment, Driver, Delivery
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET, require_POST
+from .models import Product, Customer, Inventory, Order, OrderItem, Payment, Driver, Delivery, DailySales, DeliverySLA, ProductDailySales
+from datetime import datetime, timedelta
 from django.utils import timezone
-from django.db.models import Sum, F
+from django.db.models import Count, DecimalField, Sum, F
 from django.contrib.auth.decorators import user_passes_test
+from .roles import has_role
+from .checkout import CheckoutError, OutOfStock, checkout as run_checkout
+from . import dispatch, sla, versions
+from .customer_search import filter_customers, search as search_customers
+from .search import get_index
+from .stock import get_tracker as get_stock_tracker
+from .pagination import render_page
+from . import pagecache
+from .pagecache import cached_view, with_stamps
+from .changes import conditional
+from .exports import EXPORTS, FORMATS, astream_export, export_filename, stream_export
+from .importers import import_file
+from .forms import ImportForm
+from project import replica
+from project.replica import use_replica
 
 def if_staff(user):
-    return user.groups.filter(name__in=['staff', 'admin']).exists()
+    return has_role(user, 'staff', 'admin')
 def is_customer_or_staff(user):
-    return user.groups.filter(name__in=['customer', 'staff']).exists()
+    return has_role(user, 'customer', 'staff')
 
 
 
 def if_admin(user):
-    return user.groups.filter(name='admin').exists()
+    return has_role(user, 'admin')
 
 @user_passes_test(if_staff, login_url='/')
 def cashier(request):
-    products = Product.objects.all()
-    return render(request, 'pos/cashier.html', {'products': products})
+    return render(request, 'pos/cashier.html')
+
+def catalog_etag(request):
+    return versions.etag('product', 'inventory')
+
+@user_passes_test(if_staff, login_url='/')
+@require_GET
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=catalog_etag)
+def catalog(request):
+    # Built once per product/stock version and shared by every cashier.
+    key = f"catalog:{catalog_etag(request)}"
+    products = cache.get(key)
+    if products is None:
+        products = [
+            {'id': pid, 'name': name, 'sku': sku, 'price': str(price), 'stock': stock or 0}
+            for pid, name, sku, price, stock in Product.objects.order_by('name').values_list(
+                'id', 'name', 'sku', 'price', 'inventory__quantity'
+            ).iterator()
+        ]
+        cache.set(key, products, 60 * 60)
+    return JsonResponse({'products': products})
+
+@user_passes_test(if_staff, login_url='/')
+@require_GET
+def product_search(request):
+    try:
+        limit = min(int(request.GET.get('limit', 20)), 100)
+    except ValueError:
+        limit = 20
+    results = get_index().search(request.GET.get('q', ''), limit=limit)
+    return JsonResponse({'results': results})
+
+@user_passes_test(if_staff, login_url='/')
+@require_GET
+def customer_search(request):
+    try:
+        limit = min(int(request.GET.get('limit', 20)), 100)
+    except ValueError:
+        limit = 20
+    results = search_customers(request.GET.get('q', ''), limit=limit)
+    return JsonResponse({'results': results})
+
+@user_passes_test(if_staff, login_url='/')
+@require_POST
+def checkout(request):
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON.'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'error': 'Expected a JSON object.'}, status=400)
+
+    items = data.get('items', [])
+    method = data.get('method', 'cash')
+    key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    if not isinstance(items, list):
+        return JsonResponse({'error': 'Items must be a list.'}, status=400)
+    if not isinstance(method, str):
+        return JsonResponse({'error': 'Method must be a string.'}, status=400)
+    if key is not None and (not isinstance(key, str) or len(key) > 64):
+        return JsonResponse({'error': 'Idempotency key must be a string of at most 64 characters.'}, status=400)
+
+    customer = None
+    if data.get('customer'):
+        try:
+            customer_id = int(data['customer'])
+        except (TypeError, ValueError):
+            return JsonResponse({'error': 'Customer must be an id.'}, status=400)
+        customer = get_object_or_404(Customer, pk=customer_id)
+
+    try:
+        order = run_checkout(
+            items,
+            method=method,
+            customer=customer,
+            idempotency_key=key,
+        )
+    except OutOfStock as exc:
+        return JsonResponse({'error': str(exc)}, status=409)
+    except CheckoutError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+    return JsonResponse({'order': order.id, 'total': str(order.total), 'paid': order.paid})
 
 @user_passes_test(if_staff, login_url='/')
+@conditional(Customer)
 def customers(request):
-    customers = Customer.objects.all()
-    return render(request, 'pos/customers.html', {'customers': customers})
+    query = request.GET.get('q', '').strip()
+    return render_page(
+        request, filter_customers(Customer.objects.all(), query), ('-created_at', '-id'),
+        'pos/customers.html',
+        lambda c: {'id': c.id, 'name': c.name, 'phone': c.phone, 'address': c.address, 'created_at': c.created_at},
+        context={'query': query},
+    )
 
 @user_passes_test(if_staff, login_url='/')
+@conditional(Inventory, Product)
+@cached_view('inventory', 'product')
 def inventory(request):
-    items = Inventory.objects.select_related('product').all()
-    return render(request, 'pos/inventory.html', {'items': items})
+    # Low stock comes from the in-process tracker; live changes arrive over the websocket.
+    low_stock = get_stock_tracker().items()
+    return render_page(
+        request, Inventory.objects.select_related('product'), ('id',), 'pos/inventory.html',
+        lambda i: {'id': i.id, 'product': i.product_id, 'name': i.product.name, 'sku': i.product.sku,
+                   'price': i.product.price, 'quantity': i.quantity, 'low_threshold': i.low_threshold},
+        context={
+            'low_stock': low_stock,
+            'totals': Inventory.objects.aggregate(
+                products=Count('id'), items=Sum('quantity'), value=Sum(F('quantity') * F('product__price'), output_field=DecimalField()),
+            ),
+        },
+    )
 
 @user_passes_test(if_staff, login_url='/')
+@conditional(Delivery, Driver)
+@with_stamps('delivery', 'driver')
 def deliveries(request):
-    deliveries = Delivery.objects.select_related('order','driver').all()
-    drivers = Driver.objects.all()
-    return render(request, 'pos/deliveries.html', {'deliveries': deliveries, 'drivers': drivers})
+    return render_page(
+        request, Delivery.objects.select_related('order', 'driver'), ('-scheduled_at', '-id'), 'pos/deliveries.html',
+        lambda d: {'id': d.id, 'order': d.order_id, 'driver': d.driver.name if d.driver else None,
+                   'status': d.status, 'scheduled_at': d.scheduled_at},
+        context={'drivers': Driver.objects.all()},
+    )
+
+@user_passes_test(if_staff, login_url='/')
+@require_POST
+def assign_drivers(request):
+    dispatch.assign()
+    return redirect('pos:deliveries')
 
 @user_passes_test(if_admin , login_url='/')
+@use_replica
+@conditional(Payment)
+@cached_view('payment')
 def payments(request):
-    payments = Payment.objects.select_related('order').all()
-    return render(request, 'pos/payments.html', {'payments': payments})
+    return render_page(
+        request, Payment.objects.all(), ('-recorded_at', '-id'), 'pos/payments.html',
+        lambda p: {'id': p.id, 'order': p.order_id, 'amount': p.amount, 'method': p.method,
+                   'recorded_at': p.recorded_at},
+    )
+
+def local_day(request):
+    # "Today" and the last 7 days roll over at midnight without any write.
+    return timezone.localdate().isoformat()
 
 @user_passes_test(if_admin , login_url='/') 
+@use_replica
+@conditional(Order, OrderItem, Payment, Product, Inventory, DeliverySLA, Driver, vary=local_day)
+@cached_view('order', 'payment', 'product', 'inventory', 'delivery', 'driver', vary=local_day)
 def reports(request):
-    sales_today = Order.objects.filter(created_at__date=timezone.now().date()).aggregate(total=Sum('total'))
-    low_stock = Inventory.objects.filter(quantity__lte=F('low_threshold')).select_related('product')
-    return render(request, 'pos/reports.html', {'sales_today': sales_today, 'low_stock': low_stock})
+    # Reads the rollup tables kept up to date by pos.rollups; never scans orders.
+    today = timezone.localdate()
+    week = [today - timedelta(days=n) for n in range(6, -1, -1)]
+    daily = {row.date: row for row in DailySales.objects.filter(date__gte=week[0], date__lte=today)}
+    sales_today = daily.get(today) or DailySales(date=today)
+    avg_order = sales_today.revenue / sales_today.orders if sales_today.orders else 0
+
+    weekly_sales = [
+        {'name': day.strftime('%a'), 'sales': float(daily[day].revenue) if day in daily else 0}
+        for day in week
+    ]
+    top_products = [
+        {'name': row['product__name'], 'sales': row['qty']}
+        for row in ProductDailySales.objects.filter(date__gte=week[0], date__lte=today)
+        .values('product__name')
+        .annotate(qty=Sum('quantity'))
+        .order_by('-qty')[:5]
+    ]
+    low_stock = get_stock_tracker().items()
+
+    # Delivery SLA aggregates kept by pos.sla; per-day sketches merge into the week.
+    sla_rows = list(DeliverySLA.objects.filter(day__gte=week[0], day__lte=today).select_related('driver'))
+    by_driver = {}
+    for row in sla_rows:
+        if row.driver_id is not None:
+            by_driver.setdefault(row.driver, []).append(row)
+    delivery_sla = [
+        {'label': 'Today', **sla.summary(row for row in sla_rows if row.driver_id is None and row.day == today)},
+        {'label': 'Last 7 days', **sla.summary(row for row in sla_rows if row.driver_id is None)},
+    ] + sorted(
+        ({'label': driver.name, 'driver': True, **sla.summary(rows)} for driver, rows in by_driver.items()),
+        key=lambda item: item['label'],
+    )
+    return render(request, 'pos/reports.html', {
+        'delivery_sla': delivery_sla,
+        'sales_today': sales_today,
+        'avg_order': avg_order,
+        'low_stock': low_stock,
+        'weekly_sales': weekly_sales,
+        'top_products': top_products,
+    })
+
+def _date_param(request, name):
+    value = request.GET.get(name)
+    if not value:
+        return None
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+@user_passes_test(if_admin , login_url='/')
+@require_GET
+@use_replica
+def export(request, kind):
+    fmt = request.GET.get('format', 'csv')
+    if kind not in EXPORTS or fmt not in FORMATS:
+        return HttpResponseBadRequest("Unknown export.")
+    try:
+        since = _date_param(request, 'since')
+        until = _date_param(request, 'until')
+    except ValueError:
+        return HttpResponseBadRequest("Dates must be YYYY-MM-DD.")
+    gzip = request.GET.get('gzip') in ('1', 'true')
+
+    stream = astream_export if isinstance(request, ASGIRequest) else stream_export
+    response = StreamingHttpResponse(
+        stream(kind, fmt, since, until, gzip),
+        content_type='text/csv' if fmt == 'csv' else 'application/x-ndjson',
+    )
+    if gzip:
+        response.headers['Content-Type'] = 'application/gzip'
+    response.headers['Content-Disposition'] = f'attachment; filename="{export_filename(kind, fmt, gzip)}"'
+    return response
+
+@user_passes_test(if_admin , login_url='/')
+@require_GET
+def replica_lag(request):
+    at = replica.refreshed_at()
+    lag = replica.lag()
+    return JsonResponse({
+        'refreshed_at': datetime.fromtimestamp(at, timezone.get_current_timezone()).isoformat() if at else None,
+        'lag_seconds': round(lag, 3) if lag is not None else None,
+        'max_lag_seconds': settings.REPLICA_MAX_LAG,
+        'in_use': lag is not None and lag <= settings.REPLICA_MAX_LAG,
+    })
 
+@user_passes_test(if_admin , login_url='/')
+@require_GET
+def page_cache_stats(request):
+    return JsonResponse({'pages': pagecache.stats()})
+
+@user_passes_test(if_admin , login_url='/')
+def bulk_import(request):
+    result = None
+    form = ImportForm(request.POST or None, request.FILES or None)
+    if request.method == 'POST' and form.is_valid():
+        upload = form.cleaned_data['file']
+        result = import_file(form.cleaned_data['kind'], upload.file, form.file_format())
+    return render(request, 'pos/import.html', {'form': form, 'result': result})
@@ -1,10 +1,22 @@
-import json
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from pos.outbound import CoalescingConsumerMixin
+from pos.roles import has_role
 
-class CustomerConsumer(AsyncWebsocketConsumer):
+class CustomerConsumer(CoalescingConsumerMixin, AsyncWebsocketConsumer):
     async def connect(self):
         # Grab the user_id from the URL
         self.user_id = self.scope['url_route']['kwargs']['user_id']
+        user = self.scope['user']
+
+        # Only the customer themselves (or staff) may follow their updates
+        if user.is_anonymous or (
+            str(user.pk) != self.user_id
+            and not await database_sync_to_async(has_role)(user, 'staff', 'admin')
+        ):
+            await self.close()
+            return
+
         self.group_name = f"customer_{self.user_id}"
 
         # Join the personalized group
@@ -13,18 +25,14 @@ class CustomerConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
-        await self.accept()
+        await self.accept_outbound(self.group_name)
 
     async def disconnect(self, close_code):
+        self.stop_outbound()
         # Leave the group
-        await self.channel_layer.group_discard(
-            self.group_name,
-            self.channel_name
-        )
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(
+                self.group_name,
+                self.channel_name
+            )
 
-    # Receive notification from the group
-    async def send_notification(self, event):
-        await self.send(text_data=json.dumps({
-            "title": event['title'],
-            "message": event['message']
-        }))
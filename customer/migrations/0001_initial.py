@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('pos', '0015_customer_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phone_number', models.CharField(blank=True, max_length=15)),
+                ('address', models.TextField(blank=True)),
+                ('order', models.IntegerField(default=0)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='pos.customer')),
+            ],
+        ),
+    ]
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from pos import customer_search
+from .models import CustomerProfile
+
+
+@receiver(post_save, sender=CustomerProfile)
+@receiver(post_delete, sender=CustomerProfile)
+def profile_changed(sender, instance, **kwargs):
+    # The profile's phone number and address are searched with its customer's.
+    customer_search.index([instance.user_id])
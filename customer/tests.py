@@ -1,3 +1,49 @@
-from django.test import TestCase
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from pos import customer_search
+from pos.models import Customer
+from .models import CustomerProfile
+from .routing import websocket_urlpatterns
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+)
+class CustomerSocketTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner')
+        self.other = User.objects.create_user('other')
+        self.clerk = User.objects.create_user('clerk')
+        self.clerk.groups.add(Group.objects.create(name='staff'))
+
+    async def connects(self, user, user_id):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/customer/{user_id}/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        await communicator.disconnect()
+        return connected
+
+    async def test_only_the_customer_or_staff_may_follow_a_customer(self):
+        self.assertTrue(await self.connects(self.owner, self.owner.pk))
+        self.assertTrue(await self.connects(self.clerk, self.owner.pk))
+        self.assertFalse(await self.connects(self.other, self.owner.pk))
+        self.assertFalse(await self.connects(AnonymousUser(), self.owner.pk))
+
+
+class ProfileSearchTests(TestCase):
+    def found(self, query):
+        return [row['id'] for row in customer_search.search(query)]
+
+    def test_profile_phone_and_address_are_searched_with_the_customer(self):
+        customer = Customer.objects.create(name='Ana Cruz')
+        profile = CustomerProfile.objects.create(user=customer, phone_number='0917 555 0000', address='Purok 3')
+        self.assertEqual(self.found('0917555'), [customer.pk])
+        self.assertEqual(self.found('purok'), [customer.pk])
+        profile.delete()
+        self.assertEqual(self.found('purok'), [])
@@ -1,13 +1,15 @@
 from django.shortcuts import render, redirect
 from pos.models import Customer
 from django.contrib.auth.decorators import user_passes_test
-from .forms import OrderForm
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from django.db import transaction
+from . import forms
+from notifications import outbox
+from pos import outbound
+from pos.roles import has_role
 # Create your views here.
 
 def if_customer(user):
-    return user.groups.filter(name='customer').exists()
+    return has_role(user, 'customer')
 
 
 @user_passes_test( if_customer, login_url='/')
@@ -20,20 +22,17 @@ def customer(request):
 def OrderForm(request):
     """Handle form submission"""
     if request.method == 'POST':
-        channel_layer = get_channel_layer()
-        form = OrderForm(request.POST)
+        form = forms.OrderForm(request.POST)
         if form.is_valid():
-            form.save()  # or assign to `status` if needed
-            async_to_sync(channel_layer.group_send)(
-                "staff_group",  # Only notify admin team
-            {
-            "type": "send_notification",
-            "title": "Delivery Update",
-            "message": "Order has been delivered!",
-            }
-    )
+            # Written to the outbox with the save, so nothing is sent for a rolled-back order.
+            with transaction.atomic():
+                form.save()  # or assign to `status` if needed
+                outbox.publish(
+                    "staff_group",  # Only notify admin team
+                    outbound.notification("Delivery Update", "Order has been delivered!"),
+                )
             return redirect('tracking_success')  
     else:
-        form = OrderForm()
+        form = forms.OrderForm()
 
     return render(request, 'tracking_form.html', {'form': form})
\ No newline at end of file
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class DeliveriesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'deliveries'
+
+    def ready(self):
+        # records status changes for the SLA metrics
+        import deliveries.signals
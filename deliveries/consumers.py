@@ -1,10 +1,18 @@
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-import json
+from pos.outbound import CoalescingConsumerMixin
+from pos.roles import has_role
 
-class DeliveryConsumer(AsyncWebsocketConsumer):
+class DeliveryConsumer(CoalescingConsumerMixin, AsyncWebsocketConsumer):
     async def connect(self):
+        user = self.scope['user']
+        # Only staff, admins and drivers see the delivery board
+        if user.is_anonymous or not await database_sync_to_async(has_role)(user, 'staff', 'admin', 'driver'):
+            await self.close()
+            return
         await self.channel_layer.group_add("staff_group", self.channel_name)
-        await self.accept()
+        await self.accept_outbound("staff_group")
 
     async def disconnect(self, close_code):
+        self.stop_outbound()
         await self.channel_layer.group_discard("staff_group", self.channel_name)
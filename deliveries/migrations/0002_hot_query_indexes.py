@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deliveries', '0001_initial'),
+        ('pos', '0008_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['status', 'date'], name='deliveries_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['date'], name='deliveries_date_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deliveries', '0002_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='delivery',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
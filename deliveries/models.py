@@ -1,6 +1,26 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
-from pos.models import Delivery
+from pos.models import Delivery, DeliveryStatusTransition, TrackedQuerySet
+
+
+class TrackingQuerySet(TrackedQuerySet):
+    # Status changes made with update()/bulk_update() are recorded by pos.sla too.
+    def update(self, **kwargs):
+        from pos import sla
+
+        if 'status' not in kwargs:
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            before = {pk: (delivery_id, status) for pk, delivery_id, status in self.values_list('id', 'customer_id', 'status')}
+            count = super().update(**kwargs)
+            after = self.model.objects.filter(pk__in=before).values_list('id', 'status', 'customer__driver_id')
+            sla.record(
+                [(before[pk][0], before[pk][1], status, driver_id)
+                 for pk, status, driver_id in after if status != before[pk][1]],
+                DeliveryStatusTransition.TRACKING,
+            )
+        return count
+
 
 class Delivery(models.Model):
 
@@ -17,6 +37,15 @@ class Delivery(models.Model):
     date = models.DateTimeField(default=timezone.now)
     status = models.CharField( max_length=20, choices=STATUS_CHOICES)
     amount = models.DecimalField(max_digits=8, decimal_places=2, default=0.00)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TrackingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'date'], name='deliveries_status_date_idx'),
+            models.Index(fields=['date'], name='deliveries_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.customer.customer_name} - {self.status}"
\ No newline at end of file
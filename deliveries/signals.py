@@ -0,0 +1,24 @@
+# deliveries/signals.py
+from django.db.models.signals import post_init, post_save
+from django.dispatch import receiver
+
+from pos import sla
+from pos.models import DeliveryStatusTransition
+from .models import Delivery
+
+
+# Status history for tracking form saves (updates go through TrackingQuerySet).
+
+@receiver(post_init, sender=Delivery)
+def tracking_loaded(sender, instance, **kwargs):
+    deferred = instance.pk is None or 'status' in instance.get_deferred_fields()
+    instance._status_before = None if deferred else instance.status
+
+
+@receiver(post_save, sender=Delivery)
+def tracking_saved(sender, instance, created, **kwargs):
+    before = '' if created else instance._status_before
+    if before is not None and before != instance.status:
+        driver_id = instance.customer.driver_id
+        sla.record([(instance.customer_id, before, instance.status, driver_id)], DeliveryStatusTransition.TRACKING)
+    instance._status_before = instance.status
@@ -1,3 +1,170 @@
-from django.test import TestCase
+import math
+from datetime import timedelta
 
-# Create your tests here.
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from pos import routeplan
+from pos.models import DeliverySLA
+from pos.models import Customer, Delivery as PosDelivery, Driver, Order
+from pos.tests import QueryPlanAssertions
+from . import views
+from .models import Delivery
+from .routing import websocket_urlpatterns
+
+
+class DeliveryQueryPlanTests(QueryPlanAssertions, TestCase):
+    def test_deliveries_by_status(self):
+        self.assertNoFullScan(Delivery.objects.filter(status='delivered').order_by('-date'))
+
+    def test_deliveries_date_window(self):
+        now = timezone.now()
+        self.assertNoFullScan(Delivery.objects.filter(date__gte=now - timedelta(days=1), date__lt=now))
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+)
+class DeliverySocketTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    async def connects(self, user):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/deliveries/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        await communicator.disconnect()
+        return connected
+
+    async def test_only_staff_and_drivers_see_the_board(self):
+        driver = await User.objects.acreate(username='driver')
+        await driver.groups.aadd(await Group.objects.acreate(name='driver'))
+        self.assertTrue(await self.connects(driver))
+        self.assertFalse(await self.connects(await User.objects.acreate(username='buyer')))
+        self.assertFalse(await self.connects(AnonymousUser()))
+
+
+class DeliveryBoardTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.ana, self.ben = Customer.objects.create(name='Ana'), Customer.objects.create(name='Ben')
+
+    def track(self, customer, status, hours_ago=0):
+        delivery = PosDelivery.objects.create(order=Order.objects.create(customer=customer))
+        return Delivery.objects.create(customer=delivery, customer_name=customer.name if customer else 'Walk-in',
+                                       address='Street', status=status, date=self.now - timedelta(hours=hours_ago))
+
+    def columns(self):
+        latest = views.latest_per_customer()
+        return {status: [row.pk for row in views.status_page(latest, status)[0]] for status in views.STATUS_COLUMNS}
+
+    def test_newest_delivery_per_customer_by_status(self):
+        self.track(self.ana, 'delivered', hours_ago=5)
+        ana_latest = self.track(self.ana, 'transporting', hours_ago=1)
+        ben_tied = self.track(self.ben, 'delivered')
+        ben_latest = self.track(self.ben, 'picked_up')  # same date: the higher id wins
+        Delivery.objects.filter(pk=ben_tied.pk).update(date=ben_latest.date)
+        walk_ins = [self.track(None, 'delivered', hours_ago=hours) for hours in (3, 2)]
+
+        self.assertEqual(self.columns(), {
+            'delivered': [walk_ins[1].pk, walk_ins[0].pk],
+            'transporting': [ana_latest.pk],
+            'picked_up': [ben_latest.pk],
+        })
+
+    def test_query_count_does_not_grow_with_the_board(self):
+        def load():
+            with self.assertNumQueries(len(views.STATUS_COLUMNS)):
+                for status in views.STATUS_COLUMNS:
+                    for row in views.status_page(views.latest_per_customer(), status)[0]:
+                        row.customer.order.customer_id
+
+        for status in views.STATUS_COLUMNS:
+            self.track(self.ana, status)
+        load()
+        for n in range(10):
+            customer = Customer.objects.create(name=f'C{n}')
+            for hours, status in enumerate(views.STATUS_COLUMNS):
+                self.track(customer, status, hours_ago=hours)
+        load()
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    ROUTE_DEPOT=(0.0, 0.0),
+)
+class MyRouteTests(TestCase):
+    KM = routeplan.EARTH_RADIUS_KM * math.pi / 180  # per degree at the equator
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('driver')
+        self.user.groups.add(Group.objects.get_or_create(name='driver')[0])
+        self.driver = Driver.objects.create(user=self.user, name='Ben')
+        self.client.force_login(self.user)
+
+    def deliver(self, name, km_east=None, driver=None):
+        located = km_east is not None
+        customer = Customer.objects.create(
+            name=name, latitude=0.0 if located else None, longitude=km_east / self.KM if located else None,
+        )
+        return PosDelivery.objects.create(order=Order.objects.create(customer=customer), driver=driver or self.driver)
+
+    def test_stops_come_in_visiting_order(self):
+        far, near, middle = self.deliver('Far', 6.0), self.deliver('Near', 1.0), self.deliver('Middle', 2.5)
+        unlocated = self.deliver('Walk-in')
+        self.deliver('Other', 0.5, driver=Driver.objects.create(name='Cy'))
+        PosDelivery.objects.filter(pk=far.pk).update(status='delivered')
+        far = self.deliver('Far again', 6.0)
+
+        route = self.client.get('/deliveries/route/').json()
+        self.assertEqual([stop['delivery'] for stop in route['stops']], [near.pk, middle.pk, far.pk])
+        self.assertEqual([stop['delivery'] for stop in route['unlocated']], [unlocated.pk])
+        self.assertAlmostEqual(route['km'], 6.0, places=1)
+
+    def test_needs_a_driver_profile(self):
+        self.driver.delete()
+        self.assertEqual(self.client.get('/deliveries/route/').status_code, 404)
+        self.client.force_login(User.objects.create_user('buyer'))
+        self.assertEqual(self.client.get('/deliveries/route/').status_code, 302)
+
+
+class TrackingSLATests(TestCase):
+    def setUp(self):
+        self.delivery = PosDelivery.objects.create(order=Order.objects.create())
+
+    def history(self):
+        return list(self.delivery.transitions.order_by('id').values_list('source', 'from_status', 'to_status'))
+
+    def track(self, status):
+        return Delivery.objects.create(customer=self.delivery, customer_name='Ana', address='Main St', status=status)
+
+    def test_tracking_statuses_continue_the_pos_history(self):
+        tracking = self.track('picked_up')
+        tracking.status = 'transporting'
+        tracking.save()
+        tracking.status = 'delivered'
+        tracking.save()
+        self.assertEqual(self.history(), [
+            ('pos', '', 'pending'),
+            ('tracking', 'pending', 'in_transit'),
+            ('tracking', 'in_transit', 'delivered'),
+        ])
+        self.assertEqual(DeliverySLA.objects.get(driver=None).delivered, 1)
+
+        # The POS catching up does not count the delivery twice.
+        self.delivery.status = 'delivered'
+        self.delivery.save()
+        self.assertEqual(self.history()[-1], ('pos', 'pending', 'delivered'))
+        self.assertEqual(DeliverySLA.objects.get(driver=None).delivered, 1)
+
+    def test_tracking_updates_are_recorded(self):
+        self.track('transporting')
+        Delivery.objects.filter(customer=self.delivery).update(status='delivered')
+        self.assertEqual(self.history()[-1], ('tracking', 'in_transit', 'delivered'))
+        self.assertEqual(DeliverySLA.objects.get(driver=None).delivered, 1)
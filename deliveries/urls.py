@@ -4,6 +4,7 @@ app_name = 'deliveries'
 
 urlpatterns = [
     path('delivery_list/', views.delivery_list, name='delivery_list'),
+    path('route/', views.my_route, name='my_route'),
     path('form/', views.tracking_form, name='tracking_form'),
     path('form_success/', views.tracking_success, name='tracking_success'),
 
@@ -1,76 +1,117 @@
-from django.http import HttpResponse
+from django.db.models import Exists, OuterRef, Q
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import render, redirect
 from .forms import TrackForm
 from .models import Delivery
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import user_passes_test
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from django.db import transaction
+from notifications import outbox
+from pos import outbound, routeplan
+from pos.changes import conditional
+from pos.models import Customer, Delivery as PosDelivery, Driver, Order
+from pos.roles import has_role
+from pos.pagination import paginate
 
 from django.shortcuts import render
 from .models import Delivery
 
 
 def if_driver(user):
-    return user.groups.filter(name='driver').exists()
+    return has_role(user, 'driver')
+
+PAGE_SIZE = 25
+STATUS_COLUMNS = ('delivered', 'transporting', 'picked_up')
+
+
+def latest_per_customer():
+    """Each customer's newest delivery; walk-in orders (no customer) each stand alone."""
+    newer = Delivery.objects.filter(
+        customer__order__customer=OuterRef('customer__order__customer'),
+    ).filter(Q(date__gt=OuterRef('date')) | Q(date=OuterRef('date'), pk__gt=OuterRef('pk')))
+    return Delivery.objects.filter(~Exists(newer))
+
+
+def status_page(queryset, status, cursor=None):
+    """One page of a status column, newest first, continuing after ``cursor``."""
+    page = paginate(
+        queryset.filter(status=status).select_related('customer__order'),
+        ('-date', '-id'), cursor, PAGE_SIZE,
+    )
+    return page.items, page.next_cursor
+
 
 @user_passes_test(if_driver , login_url='/')
+@conditional(Delivery, PosDelivery, Order)
 def delivery_list(request):
-    all_deliveries = Delivery.objects.all().order_by('-date')
-
-    unique_customers = {}
-    for d in all_deliveries:
-        if d.customer not in unique_customers:
-            unique_customers[d.customer] = d  # keep the latest one only
-
-    # Now separate by status
-    delivered = [d for d in unique_customers.values() if d.status.lower() == "delivered"]
-    transporting = [d for d in unique_customers.values() if d.status.lower() == "transporting"]
-    picked_up = [d for d in unique_customers.values() if d.status.lower() == "picked_up"]
-
-    state = {
-        "delivered": delivered,
-        "transporting": transporting,
-        "picked_up": picked_up,
-    }
-    
+    latest = latest_per_customer()
+
+    state = {}
+    for status in STATUS_COLUMNS:
+        rows, next_cursor = status_page(latest, status, request.GET.get(status))
+        state[status] = rows
+        state[f"{status}_next"] = next_cursor
+
     return render(request, "delivery_list.html", state)
 
-from django.shortcuts import render, redirect
-from .forms import TrackForm
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+@user_passes_test(if_driver , login_url='/')
+@conditional(PosDelivery, Order, Customer, Driver)
+def my_route(request):
+    """The signed-in driver's pending deliveries in planned visiting order."""
+    driver = Driver.objects.filter(user=request.user).first()
+    if driver is None:
+        raise Http404("No driver profile for this account.")
+    route = routeplan.plan_routes([driver.id]).get(driver.id) or routeplan.Route(driver.id)
+
+    def stop(delivery):
+        customer = delivery.order.customer
+        return {
+            'delivery': delivery.id,
+            'order': delivery.order_id,
+            'customer': customer.name if customer else None,
+            'address': customer.address if customer else '',
+            'phone': customer.phone if customer else '',
+            'latitude': customer.latitude if customer else None,
+            'longitude': customer.longitude if customer else None,
+            'scheduled_at': delivery.scheduled_at,
+        }
+
+    return JsonResponse({
+        'driver': driver.id,
+        'km': round(route.km, 2),
+        'stops': [stop(d) for d in route.stops],
+        'unlocated': [stop(d) for d in route.unlocated],
+    })
 
 def tracking_form(request):
     """Handle form submission and send real-time notifications."""
     form = TrackForm(request.POST or None)  # Handles both GET and POST
 
     if request.method == 'POST' and form.is_valid():
-        delivery = form.save()  # Save and get the instance
-        channel_layer = get_channel_layer()
-
-        # Notify POS staff/admin group
-        async_to_sync(channel_layer.group_send)(
-            "staff_admin_group",
-            {
-                "type": "send_notification",
-                "title": "Delivery Update",
-                "message": f"Delivery #{delivery.id} is now {delivery.status}",
-            }
-        )
-
-        # Notify the specific customer
-        customer_user_id = delivery.customer.user.id
-        async_to_sync(channel_layer.group_send)(
-            f"customer_{customer_user_id}",
-            {
-                "type": "send_notification",
-                "title": "Your Order Status",
-                "message": f"Your delivery #{delivery.id} is now {delivery.status}",
-            }
-        )
-
-        return redirect('tracking_success')
+        # The broadcasts are written to the outbox with the save and sent once it commits.
+        with transaction.atomic():
+            delivery = form.save()  # Save and get the instance
+
+            # Notify POS staff/admin group; later updates to the same delivery supersede this one
+            entity = f"delivery:{delivery.id}"
+            events = [(
+                "staff_admin_group",
+                outbound.notification("Delivery Update", f"Delivery #{delivery.id} is now {delivery.status}", entity),
+            )]
+
+            # Notify the specific customer (delivery.customer is the POS delivery)
+            order = delivery.customer.order
+            customer_user_id = order.customer.user_id if order.customer_id else None
+            if customer_user_id is not None:
+                events.append((
+                    f"customer_{customer_user_id}",
+                    outbound.notification(
+                        "Your Order Status", f"Your delivery #{delivery.id} is now {delivery.status}", entity,
+                    ),
+                ))
+            outbox.publish_many(events)
+
+        return redirect('deliveries:tracking_success')
 
     return render(request, 'tracking_form.html', {'form': form})
 
@@ -34,6 +34,7 @@ def register_user(request):
 from django.shortcuts import redirect, render
 from django.contrib.auth import authenticate, login
 from django.http import HttpResponse
+from pos.roles import get_roles
 
 def login_user(request):
     if request.method == 'POST':
@@ -46,11 +47,12 @@ def login_user(request):
             login(request, user)
 
             # Redirect based on group
-            if user.groups.filter(name='admin').exists():
+            roles = get_roles(user)
+            if 'admin' in roles:
                 return redirect('pos:reports')
-            elif user.groups.filter(name='staff').exists():
+            elif 'staff' in roles:
                 return redirect('pos:cashier')
-            elif user.groups.filter(name='driver').exists():
+            elif 'driver' in roles:
                 return redirect('deliveries:delivery_list')
             else:
                 return redirect('pos:customers')
@@ -83,7 +85,7 @@ def create_role_profile(sender, instance, created, **kwargs):
     elif role == "driver":
         Driver.objects.get_or_create(
             user=instance,
-            defaults={"full_name": instance.username}
+            defaults={"name": instance.username}
         )
 
     elif role == "staff":
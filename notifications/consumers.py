@@ -1,7 +1,8 @@
-import json
 from channels.generic.websocket import AsyncWebsocketConsumer
+from pos.outbound import CoalescingConsumerMixin
+from .counters import user_group
 
-class NotificationConsumer(AsyncWebsocketConsumer):
+class NotificationConsumer(CoalescingConsumerMixin, AsyncWebsocketConsumer):
     async def connect(self):
         user = self.scope["user"]
 
@@ -16,15 +17,15 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             else:
                 self.group_name = "general_group"
 
-            # Join the correct group
+            # Join the correct group, plus the user's own group for the unread badge
+            self.user_group = user_group(user.pk)
             await self.channel_layer.group_add(self.group_name, self.channel_name)
-            await self.accept()
+            await self.channel_layer.group_add(self.user_group, self.channel_name)
+            await self.accept_outbound(self.group_name, self.user_group)
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        self.stop_outbound()
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+            await self.channel_layer.group_discard(self.user_group, self.channel_name)
 
-    async def send_notification(self, event):
-        await self.send(text_data=json.dumps({
-            "title": event["title"],
-            "message": event["message"],
-        }))
@@ -0,0 +1,76 @@
+"""Denormalised unread-notification counts.
+
+Every change to the set of unread notifications goes through here and
+adjusts ``UnreadCounter`` inside the same transaction with an
+``INSERT ... ON CONFLICT DO UPDATE`` increment, so the badge is a primary-key
+lookup instead of a COUNT. The new count is published through the outbox to
+the user's ``notifications_user_<id>`` websocket group.
+"""
+from collections import Counter
+
+from django.db import connection, transaction
+from pos.outbound import group_event
+
+from . import outbox
+from .models import Notification, UnreadCounter
+
+
+def user_group(user_id):
+    return f"notifications_user_{user_id}"
+
+
+def adjust(deltas):
+    """Add ``{user_id: delta}`` onto the counters and publish the new values."""
+    rows = [(user_id, delta) for user_id, delta in deltas.items() if delta]
+    if not rows:
+        return
+    qn = connection.ops.quote_name
+    table = qn(UnreadCounter._meta.db_table)
+    user_col = qn(UnreadCounter._meta.get_field('user').column)
+    unread_col = qn('unread')
+    increments = [row for row in rows if row[1] > 0]
+    # Decrements only touch existing rows, so a cascade from a deleted user never re-creates one.
+    decrements = [(delta, user_id) for user_id, delta in rows if delta < 0]
+    with connection.cursor() as cursor:
+        if increments:
+            cursor.executemany(
+                f"INSERT INTO {table} ({user_col}, {unread_col}) VALUES (%s, %s) "
+                f"ON CONFLICT ({user_col}) DO UPDATE SET {unread_col} = {table}.{unread_col} + excluded.{unread_col}",
+                increments,
+            )
+        if decrements:
+            cursor.executemany(
+                f"UPDATE {table} SET {unread_col} = {unread_col} + %s WHERE {user_col} = %s",
+                decrements,
+            )
+    counts = dict(UnreadCounter.objects.filter(user_id__in=[user_id for user_id, delta in rows])
+                  .values_list('user_id', 'unread'))
+    outbox.publish_many(
+        (user_group(user_id), group_event({'type': 'unread_count', 'unread': unread}, entity='unread_count'))
+        for user_id, unread in counts.items()
+    )
+
+
+def unread_count(user_id):
+    return UnreadCounter.objects.filter(user_id=user_id).values_list('unread', flat=True).first() or 0
+
+
+def created(notifications):
+    """Count freshly created (e.g. bulk-created) notifications."""
+    adjust(Counter(n.user_id for n in notifications if not n.is_read))
+
+
+def mark_read(user_id, ids):
+    """Mark the user's notifications ``ids`` read; return how many changed."""
+    with transaction.atomic():
+        changed = Notification.objects.filter(user_id=user_id, id__in=ids, is_read=False).update(is_read=True)
+        adjust({user_id: -changed})
+    return changed
+
+
+def mark_all_read(user_id):
+    with transaction.atomic():
+        changed = Notification.objects.filter(user_id=user_id, is_read=False).update(is_read=True)
+        adjust({user_id: -changed})
+    return changed
+
@@ -0,0 +1,86 @@
+"""Coalescing fan-out of delivery status notifications.
+
+Delivery saves only upsert ``(user, delivery) -> latest status`` into
+``PendingNotification``, in the transaction of the save, so an update is
+queued exactly when its change commits and survives a restart. Once the
+oldest pending update is ``WINDOW_SECONDS`` old, ``flush()`` takes the whole
+window in one statement, stores the in-app notifications with it and then
+emails each user once, so a driver working through a run of deliveries
+produces one ``bulk_create`` and one SMTP connection instead of one of each
+per save.
+
+The outbox dispatcher (``notifications.outbox``) calls ``flush()`` on every
+poll under ASGI; elsewhere run ``manage.py send_notifications --every N``.
+Taking the rows is a single ``DELETE ... RETURNING``, so several processes
+never send the same window twice. If the emails fail, the window goes back
+in the queue marked ``stored`` and only the emails are retried (a user may
+then get an email twice, never none).
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import PendingNotification
+
+WINDOW_SECONDS = getattr(settings, 'NOTIFICATION_COALESCE_SECONDS', 2.0)
+
+logger = logging.getLogger(__name__)
+
+
+def queue_update(user_id, delivery_id, order_id, status):
+    """Record a status change; a later change to the same delivery replaces it."""
+    PendingNotification.objects.bulk_create(
+        [PendingNotification(user_id=user_id, delivery_id=delivery_id, order_id=order_id, status=status)],
+        update_conflicts=True,
+        unique_fields=['user', 'delivery_id'],
+        update_fields=['order_id', 'status', 'stored'],
+    )
+
+
+def take(window=WINDOW_SECONDS):
+    """Remove and return every pending update once the oldest is ``window`` seconds old.
+
+    Rows are ``[user_id, delivery_id, order_id, status, stored]``.
+    """
+    qn = connection.ops.quote_name
+    table = qn(PendingNotification._meta.db_table)
+    due = connection.ops.adapt_datetimefield_value(timezone.now() - timedelta(seconds=window))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {table} WHERE (SELECT MIN({qn('queued_at')}) FROM {table}) <= %s "
+            f"RETURNING {qn('user_id')}, {qn('delivery_id')}, {qn('order_id')}, {qn('status')}, {qn('stored')}",
+            [due],
+        )
+        return [[*row[:4], bool(row[4])] for row in cursor.fetchall()]
+
+
+def requeue_emails(updates):
+    """Put a taken window back with its in-app notifications marked as stored."""
+    PendingNotification.objects.bulk_create(
+        [PendingNotification(user_id=user_id, delivery_id=delivery_id, order_id=order_id, status=status,
+                             stored=True)
+         for user_id, delivery_id, order_id, status, _ in updates],
+        ignore_conflicts=True,  # a newer update to the same delivery already covers it
+    )
+
+
+def flush(window=WINDOW_SECONDS):
+    """Send the pending window if it is due; return the number of updates sent."""
+    from .tasks import email_notifications, store_notifications
+
+    with transaction.atomic():
+        updates = take(window)
+        if not updates:
+            return 0
+        # Stored with the rows they replace; only the emails are sent after commit.
+        per_user, users = store_notifications(updates)
+    try:
+        email_notifications(per_user, users)
+    except Exception:
+        logger.exception("Sending %d delivery notification emails failed; they will be retried", len(per_user))
+        requeue_emails(updates)
+        return 0
+    return len(updates)
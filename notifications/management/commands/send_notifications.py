@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from notifications import fanout
+
+
+class Command(BaseCommand):
+    help = "Send the delivery notification window once it is due (the ASGI outbox dispatcher does this itself)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, help="Keep checking every N seconds.")
+
+    def handle(self, *args, **options):
+        while True:
+            sent = fanout.flush()
+            if sent or not options['every']:
+                self.stdout.write(f"Sent {sent} delivery updates.")
+            if not options['every']:
+                return
+            time.sleep(options['every'])
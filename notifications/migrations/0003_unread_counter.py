@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_existing_unread(apps, schema_editor):
+    Notification = apps.get_model('notifications', 'Notification')
+    UnreadCounter = apps.get_model('notifications', 'UnreadCounter')
+    unread = Notification.objects.filter(is_read=False).values('user_id').annotate(n=Count('id'))
+    UnreadCounter.objects.bulk_create(
+        [UnreadCounter(user_id=row['user_id'], unread=row['n']) for row in unread.iterator()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('notifications', '0002_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='unread_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_existing_unread, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0004_outbox_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupSequence',
+            fields=[
+                ('group', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('last_seq', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='outboxevent',
+            name='seq',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='outboxevent',
+            constraint=models.UniqueConstraint(fields=('group', 'seq'), name='outbox_group_seq_uniq'),
+        ),
+    ]
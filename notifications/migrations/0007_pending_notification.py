@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:34
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0006_notification_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delivery_id', models.BigIntegerField()),
+                ('order_id', models.BigIntegerField()),
+                ('status', models.CharField(max_length=20)),
+                ('queued_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['queued_at'], name='pending_notif_queued_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'delivery_id'), name='pending_notif_user_delivery_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0008_outbox_backoff'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pendingnotification',
+            name='stored',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,12 +1,93 @@
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import User
+from django.utils import timezone
+from pos.models import TrackedQuerySet
 
 class Notification(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     message = models.TextField()
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TrackedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # is_read=False compiles to NOT "is_read", so unread lookups need a partial index.
+            models.Index(fields=['user', 'created_at'], name='notif_unread_idx', condition=Q(is_read=False)),
+            models.Index(fields=['user', 'created_at'], name='notif_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"Notification for {self.user.username}: {self.message[:20]}"
 
+
+
+class UnreadCounter(models.Model):
+    """Per-user count of unread notifications, kept in step by ``notifications.counters``."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='unread_counter')
+    unread = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.unread} unread"
+
+
+class PendingNotification(models.Model):
+    """Latest status of a delivery waiting to go out with the rest of its window (``notifications.fanout``)."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    delivery_id = models.BigIntegerField()  # deliveries.Delivery
+    order_id = models.BigIntegerField()
+    status = models.CharField(max_length=20)
+    queued_at = models.DateTimeField(default=timezone.now)
+    # The in-app notification exists already; only the email failed and is retried.
+    stored = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'delivery_id'], name='pending_notif_user_delivery_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['queued_at'], name='pending_notif_queued_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: delivery {self.delivery_id} {self.status}"
+
+
+class GroupSequence(models.Model):
+    """Last sequence number handed out for a websocket group."""
+    group = models.CharField(max_length=100, primary_key=True)
+    last_seq = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.group} @ {self.last_seq}"
+
+
+class OutboxEvent(models.Model):
+    """A websocket broadcast written with the change it announces; sent by ``notifications.outbox``.
+
+    Sent rows are kept for ``outbox.RETENTION`` as the replay log for reconnecting clients.
+    """
+    group = models.CharField(max_length=100)
+    seq = models.BigIntegerField(null=True, blank=True)  # per group, assigned at publish
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_by = models.CharField(max_length=32, blank=True)
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)  # backoff after a failed send
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], name='outbox_pending_idx', condition=Q(sent_at__isnull=True)),
+            models.Index(fields=['sent_at'], name='outbox_sent_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'seq'], name='outbox_group_seq_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.group}: {self.payload.get('type')}"
@@ -0,0 +1,228 @@
+"""Transactional outbox for websocket broadcasts.
+
+Views and signals call ``publish()`` inside the transaction that makes the
+change, so an event exists exactly when its change committed. A dispatcher
+running on the ASGI server's event loop drains pending rows in batches and
+sends them with concurrent ``group_send`` calls. Rows are claimed under a
+short lease first, so several server processes can share the table without
+sending an event twice, and a crashed worker's claim simply expires. A
+failed send is retried after an exponential backoff, up to ``MAX_ATTEMPTS``
+times; events that run out of attempts are logged and dropped with the
+sent ones once they are older than ``RETENTION``.
+
+Each event gets the next sequence number of its group when it is published
+(``GroupSequence``), and sent rows stay in the table for ``RETENTION`` as
+the log that ``pos.replay`` serves to reconnecting clients.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import timedelta
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from pos.outbound import sequenced
+
+from . import fanout
+from .models import GroupSequence, OutboxEvent
+
+BATCH_SIZE = 200
+LEASE = timedelta(seconds=30)
+POLL_SECONDS = 1.0
+MAX_ATTEMPTS = 10
+BACKOFF = timedelta(seconds=1)
+MAX_BACKOFF = timedelta(minutes=5)
+RETENTION = timedelta(hours=1)
+
+logger = logging.getLogger(__name__)
+
+_wake = None  # (loop, asyncio.Event) of the dispatcher running in this process
+
+
+def publish(group, payload):
+    """Queue ``payload`` for ``group``; it is sent only if the current transaction commits."""
+    publish_many([(group, payload)])
+
+
+def publish_many(events):
+    events = list(events)
+    if not events:
+        return
+    counts = {}
+    for group, _ in events:
+        counts[group] = counts.get(group, 0) + 1
+    with transaction.atomic():
+        # The sequence row stays locked until commit, so a group's events commit in sequence order.
+        next_seq = {group: last - counts[group] + 1 for group, last in reserve_seqs(counts).items()}
+        rows = []
+        for group, payload in events:
+            rows.append(OutboxEvent(group=group, seq=next_seq[group], payload=payload))
+            next_seq[group] += 1
+        OutboxEvent.objects.bulk_create(rows)
+    transaction.on_commit(wake)
+
+
+def reserve_seqs(counts):
+    """Advance each group's sequence by ``counts[group]``; return the new last values."""
+    qn = connection.ops.quote_name
+    table = qn(GroupSequence._meta.db_table)
+    last = {}
+    with connection.cursor() as cursor:
+        for group, count in counts.items():
+            cursor.execute(
+                f"INSERT INTO {table} ({qn('group')}, {qn('last_seq')}) VALUES (%s, %s) "
+                f"ON CONFLICT ({qn('group')}) DO UPDATE SET {qn('last_seq')} = {table}.{qn('last_seq')} + excluded.{qn('last_seq')} "
+                f"RETURNING {qn('last_seq')}",
+                [group, count],
+            )
+            last[group] = cursor.fetchone()[0]
+    return last
+
+
+def wake():
+    """Nudge this process's dispatcher instead of waiting for its next poll."""
+    if _wake is not None:
+        loop, event = _wake
+        loop.call_soon_threadsafe(event.set)
+
+
+def claim(batch_size=BATCH_SIZE):
+    """Lease up to ``batch_size`` pending events; return ``(id, group, seq, payload)`` rows."""
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    claimable = (
+        Q(sent_at__isnull=True, attempts__lt=MAX_ATTEMPTS)
+        & (Q(claimed_until__isnull=True) | Q(claimed_until__lt=now))
+        & (Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+    )
+    ids = list(OutboxEvent.objects.filter(claimable).order_by('id').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return []
+    # Another dispatcher may have claimed some of them in between; only our token's rows are ours.
+    OutboxEvent.objects.filter(claimable, id__in=ids).update(
+        claimed_by=token, claimed_until=now + LEASE, attempts=F('attempts') + 1,
+    )
+    return list(
+        OutboxEvent.objects.filter(id__in=ids, claimed_by=token).order_by('id')
+        .values_list('id', 'group', 'seq', 'payload')
+    )
+
+
+def backoff(attempts):
+    """Wait before the next try of an event that failed ``attempts`` times."""
+    return min(BACKOFF * 2 ** (attempts - 1), MAX_BACKOFF)
+
+
+def finish(sent_ids, failed_ids):
+    now = timezone.now()
+    if sent_ids:
+        OutboxEvent.objects.filter(id__in=sent_ids).update(sent_at=now, claimed_until=None)
+    if failed_ids:
+        by_attempts = {}
+        for event_id, attempts in OutboxEvent.objects.filter(id__in=failed_ids).values_list('id', 'attempts'):
+            by_attempts.setdefault(attempts, []).append(event_id)
+        for attempts, ids in by_attempts.items():
+            if attempts >= MAX_ATTEMPTS:
+                logger.error("Outbox events %s failed %s times; giving up", ids, attempts)
+            OutboxEvent.objects.filter(id__in=ids).update(
+                claimed_until=None, next_attempt_at=now + backoff(attempts),
+            )
+
+
+def prune():
+    """Delete sent events, and events that ran out of attempts, older than ``RETENTION``."""
+    cutoff = timezone.now() - RETENTION
+    OutboxEvent.objects.filter(
+        Q(sent_at__lt=cutoff) | Q(sent_at__isnull=True, attempts__gte=MAX_ATTEMPTS, created_at__lt=cutoff)
+    ).delete()
+
+
+async def dispatch_once(layer, batch_size=BATCH_SIZE):
+    """Send one batch; return how many events were claimed."""
+    events = await database_sync_to_async(claim)(batch_size)
+    if not events:
+        return 0
+    results = await asyncio.gather(
+        *(layer.group_send(group, sequenced(payload, group, seq)) for _, group, seq, payload in events),
+        return_exceptions=True,
+    )
+    sent, failed = [], []
+    for (event_id, group, _, _), result in zip(events, results):
+        if isinstance(result, Exception):
+            logger.warning("Outbox event %s to %s failed: %r", event_id, group, result)
+            failed.append(event_id)
+        else:
+            sent.append(event_id)
+    await database_sync_to_async(finish)(sent, failed)
+    return len(events)
+
+
+async def run_dispatcher(layer=None, poll=POLL_SECONDS):
+    """Drain the outbox until cancelled, waking on local commits or every ``poll`` seconds.
+
+    Each round also sends the delivery notification window and assigns
+    waiting deliveries to drivers once they are due.
+    """
+    from pos import dispatch
+
+    global _wake
+    layer = layer or get_channel_layer()
+    if layer is None:
+        return
+    event = asyncio.Event()
+    _wake = (asyncio.get_running_loop(), event)
+    loop = asyncio.get_running_loop()
+    next_prune = loop.time()
+    try:
+        while True:
+            event.clear()
+            try:
+                while await dispatch_once(layer) == BATCH_SIZE:
+                    pass
+                await database_sync_to_async(fanout.flush)()
+                await database_sync_to_async(dispatch.flush)()
+                if loop.time() >= next_prune:
+                    await database_sync_to_async(prune)()
+                    next_prune = loop.time() + RETENTION.total_seconds() / 4
+            except Exception:
+                logger.exception("Outbox dispatch failed")
+            try:
+                await asyncio.wait_for(event.wait(), poll)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        _wake = None
+
+
+class OutboxDispatcherApp:
+    """ASGI wrapper that keeps the outbox dispatcher running on the server's event loop.
+
+    It starts on ``lifespan.startup`` where the server supports it, and otherwise
+    with the first connection; if the task ever dies it is restarted on the next one.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.task = None
+
+    def ensure_started(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(run_dispatcher())
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    self.ensure_started()
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    if self.task is not None:
+                        self.task.cancel()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        self.ensure_started()
+        return await self.app(scope, receive, send)
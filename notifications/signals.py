@@ -1,21 +1,47 @@
 # notifications/signals.py
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
 from django.apps import apps
+from . import counters, fanout
 from .models import Notification
-from .tasks import send_delivery_notification
+
+
+@receiver(post_init, sender=Notification)
+def remember_read_state(sender, instance, **kwargs):
+    if instance.pk is None or 'is_read' in instance.get_deferred_fields():
+        instance._was_read = None
+    else:
+        instance._was_read = instance.is_read
+
+
+@receiver(post_save, sender=Notification)
+def notification_saved(sender, instance, created, **kwargs):
+    was_read = True if created else instance._was_read
+    if was_read is not None and was_read != instance.is_read:
+        counters.adjust({instance.user_id: -1 if instance.is_read else 1})
+    instance._was_read = instance.is_read
+
+
+@receiver(post_delete, sender=Notification)
+def notification_deleted(sender, instance, **kwargs):
+    if not instance.is_read:
+        counters.adjust({instance.user_id: -1})
+
 
 def connect_delivery_signals():
     Delivery = apps.get_model("deliveries", "Delivery")  # resolves at runtime
+    Order = apps.get_model("pos", "Order")
     @receiver(post_save, sender=Delivery)
     def notify_delivery_update(sender, instance, created, **kwargs):
         # only on updates
         if not created:
-            user = instance.customer
-            message = f"Your order #{instance.id} is now {instance.status}."
-            Notification.objects.create(user=user, message=message)
-            # send async email / SMS
-            send_delivery_notification.delay(user.id, message)
+            # deliveries.Delivery.customer is the POS delivery; its order's customer owns the account.
+            row = Order.objects.filter(delivery__id=instance.customer_id).values_list('id', 'customer__user_id').first()
+            if row is None or row[1] is None:
+                return
+            order_id, user_id = row
+            # Queued with the save and sent in batches by notifications.fanout.
+            fanout.queue_update(user_id, instance.pk, order_id, instance.status)
 
 # Call this at import in apps.ready() (see NotificationsConfig.ready)
 connect_delivery_signals()
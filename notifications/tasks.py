@@ -1,14 +1,83 @@
 from celery import shared_task
-from django.core.mail import send_mail
+from django.core.mail import EmailMultiAlternatives, get_connection, send_mail
 from django.contrib.auth.models import User
+from django.template.loader import render_to_string
+
+from . import counters
+from .models import Notification
+
+FROM_EMAIL = "yourwaterstation@example.com"
+SUBJECT = "Water Delivery Update"
+EMAIL_BATCH_SIZE = 100
+
 
 @shared_task
 def send_delivery_notification(user_id, message):
+    # Kept so tasks queued before the batched fan-out still run.
     user = User.objects.get(id=user_id)
     send_mail(
-        subject="Water Delivery Update",
+        subject=SUBJECT,
         message=message,
-        from_email="yourwaterstation@example.com",
+        from_email=FROM_EMAIL,
         recipient_list=[user.email],
     )
     return "Notification sent"
+
+
+def status_message(order_id, status):
+    return f"Your order #{order_id} is now {status}."
+
+
+def store_notifications(updates):
+    """Create the in-app notifications for a window of updates; return ``(per_user, users)`` for the emails.
+
+    ``updates`` are ``[user_id, delivery_id, order_id, status, stored]`` rows
+    (``notifications.fanout.take``); updates to the same delivery collapse to
+    the latest one, and ``stored`` ones are only emailed.
+    """
+    latest = {}
+    for user_id, delivery_id, order_id, status, stored in updates:
+        latest[(user_id, delivery_id)] = (order_id, status, stored)
+
+    per_user = {}
+    for (user_id, delivery_id), (order_id, status, stored) in latest.items():
+        per_user.setdefault(user_id, []).append(
+            {'order_id': order_id, 'status': status, 'message': status_message(order_id, status), 'stored': stored}
+        )
+
+    users = User.objects.in_bulk(list(per_user))
+    created = Notification.objects.bulk_create([
+        Notification(user_id=user_id, message=item['message'])
+        for user_id, items in per_user.items() if user_id in users
+        for item in items if not item['stored']
+    ])
+    # bulk_create skips the post_save counter hook.
+    counters.created(created)
+    return per_user, users
+
+
+def email_notifications(per_user, users):
+    """Email each user one message covering all of their updates, over one reused connection."""
+    messages = []
+    for user_id, items in per_user.items():
+        user = users.get(user_id)
+        if user is None or not user.email:
+            continue
+        email = EmailMultiAlternatives(
+            subject=SUBJECT,
+            body="\n".join(item['message'] for item in items),
+            from_email=FROM_EMAIL,
+            to=[user.email],
+        )
+        email.attach_alternative(
+            render_to_string("notifications/notify_email.html", {'user': user, 'updates': items}),
+            "text/html",
+        )
+        messages.append(email)
+
+    sent = 0
+    if messages:
+        with get_connection() as connection:
+            for start in range(0, len(messages), EMAIL_BATCH_SIZE):
+                sent += connection.send_messages(messages[start:start + EMAIL_BATCH_SIZE]) or 0
+    return f"{sent} notification emails sent"
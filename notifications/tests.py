@@ -1,3 +1,216 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import call_command
+from django.db import transaction
 from django.test import TestCase
+from django.utils import timezone
+
+from deliveries.models import Delivery as Tracking
+from pos.models import Customer, Delivery, Order
+from pos.tests import QueryPlanAssertions
+from . import counters, fanout, outbox
+from .models import Notification, OutboxEvent, PendingNotification, UnreadCounter
+
+
+class NotificationQueryPlanTests(QueryPlanAssertions, TestCase):
+    def test_unread_for_user(self):
+        self.assertNoFullScan(Notification.objects.filter(user_id=1, is_read=False).order_by('-created_at'))
+
+    def test_list_for_user(self):
+        self.assertNoFullScan(Notification.objects.filter(user_id=1).order_by('-created_at'))
+
+
+class DeliveryFanOutTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', email='buyer@example.com')
+        customer = Customer.objects.create(user=self.user, name='Buyer')
+        self.trackings = []
+        for _ in range(3):
+            order = Order.objects.create(customer=customer, total=10)
+            delivery = Delivery.objects.create(order=order)
+            self.trackings.append(Tracking.objects.create(
+                customer=delivery, customer_name='Buyer', address='Street', status='transporting',
+            ))
+
+    def update_all(self, *statuses):
+        with self.captureOnCommitCallbacks(execute=True):
+            for status in statuses:
+                for tracking in self.trackings:
+                    tracking.status = status
+                    tracking.save()
+
+    def test_burst_is_coalesced_into_one_email(self):
+        self.update_all('transporting', 'picked_up', 'delivered')
+        self.assertEqual(PendingNotification.objects.count(), 3)
+        self.assertEqual(fanout.flush(), 0)  # window still open
+        self.assertEqual(fanout.flush(window=0), 3)
+
+        self.assertFalse(PendingNotification.objects.exists())
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(counters.unread_count(self.user.pk), 3)
+        self.assertEqual(len(mail.outbox), 1)
+        email = mail.outbox[0]
+        self.assertEqual(email.to, ['buyer@example.com'])
+        self.assertEqual(email.body.count('is now delivered'), 3)
+        self.assertNotIn('transporting', email.body)
+        self.assertIn('text/html', email.alternatives[0][1])
+
+    def test_rolled_back_saves_queue_nothing(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.update_all('delivered')
+            raise RuntimeError
+        self.assertEqual(fanout.flush(window=0), 0)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_flush_with_nothing_pending_sends_nothing(self):
+        self.assertEqual(fanout.flush(window=0), 0)
+
+    def test_failed_emails_are_retried_without_duplicate_notifications(self):
+        self.update_all('delivered')
+        with mock.patch('notifications.tasks.get_connection', side_effect=ConnectionRefusedError), \
+                self.assertLogs('notifications.fanout', 'ERROR'):
+            self.assertEqual(fanout.flush(window=0), 0)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(PendingNotification.objects.filter(stored=True).count(), 3)
+
+        self.assertEqual(fanout.flush(window=0), 3)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].body.count('is now delivered'), 3)
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 3)
+        self.assertFalse(PendingNotification.objects.exists())
+
+    def test_newer_update_replaces_a_failed_email(self):
+        self.update_all('picked_up')
+        with mock.patch('notifications.tasks.get_connection', side_effect=ConnectionRefusedError), \
+                self.assertLogs('notifications.fanout', 'ERROR'):
+            fanout.flush(window=0)
+        self.update_all('delivered')
+        self.assertFalse(PendingNotification.objects.filter(stored=True).exists())
+
+        self.assertEqual(fanout.flush(window=0), 3)
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 6)
+        self.assertEqual(mail.outbox[0].body.count('is now delivered'), 3)
+        self.assertNotIn('picked_up', mail.outbox[0].body)
+
+    def test_command_sends_the_due_window(self):
+        self.update_all('delivered')
+        PendingNotification.objects.update(queued_at=timezone.now() - timedelta(minutes=1))
+        out = StringIO()
+        call_command('send_notifications', stdout=out)
+        self.assertIn('Sent 3 delivery updates', out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader', password='pw')
+        self.notes = [Notification.objects.create(user=self.user, message=f"n{i}") for i in range(4)]
+        self.client.login(username='reader', password='pw')
+
+    def badge(self):
+        return self.client.get('/notifications/unread/').json()['unread']
+
+    def test_created_notifications_are_counted(self):
+        self.assertEqual(counters.unread_count(self.user.pk), 4)
+        self.assertEqual(self.badge(), 4)
+
+    def test_badge_is_a_single_lookup(self):
+        with self.assertNumQueries(1):
+            counters.unread_count(self.user.pk)
+
+    def test_mark_read_and_mark_all_read(self):
+        response = self.client.post('/notifications/mark-read/', {'ids': [self.notes[0].pk, self.notes[1].pk]})
+        self.assertEqual(response.json(), {'marked': 2, 'unread': 2})
+        # Already-read ids are not counted twice.
+        self.client.post('/notifications/mark-read/', {'ids': [self.notes[0].pk]})
+        self.assertEqual(self.badge(), 2)
+        self.assertEqual(self.client.post('/notifications/mark-read/', {'all': '1'}).json()['unread'], 0)
+
+    def test_save_and_delete_keep_the_count(self):
+        note = Notification.objects.get(pk=self.notes[0].pk)
+        note.is_read = True
+        note.save()
+        self.notes[1].delete()
+        self.assertEqual(counters.unread_count(self.user.pk), 2)
+        self.assertEqual(counters.unread_count(self.user.pk),
+                         Notification.objects.filter(user=self.user, is_read=False).count())
+
+    def test_deleting_the_user_leaves_no_counter(self):
+        self.user.delete()
+        self.assertFalse(UnreadCounter.objects.exists())
+
+
+class FailingLayer:
+    async def group_send(self, group, message):
+        raise ConnectionError("layer down")
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.layer = InMemoryChannelLayer()
+        self.channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)("staff_admin_group", self.channel)
+
+    def test_rolled_back_events_are_never_sent(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            outbox.publish("staff_admin_group", {"type": "send_notification", "message": "lost"})
+            raise RuntimeError
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertEqual(async_to_sync(outbox.dispatch_once)(self.layer), 0)
+
+    def test_committed_events_are_sent_once(self):
+        outbox.publish_many(
+            ("staff_admin_group", {"type": "send_notification", "message": str(i)}) for i in range(3)
+        )
+        self.assertEqual(async_to_sync(outbox.dispatch_once)(self.layer), 3)
+        received = [async_to_sync(self.layer.receive)(self.channel)["message"] for _ in range(3)]
+        self.assertEqual(received, ["0", "1", "2"])
+        self.assertEqual(async_to_sync(outbox.dispatch_once)(self.layer), 0)
+        self.assertFalse(OutboxEvent.objects.filter(sent_at__isnull=True).exists())
+
+    def test_failed_sends_are_retried(self):
+        outbox.publish("staff_admin_group", {"type": "send_notification", "message": "retry"})
+        with self.assertLogs('notifications.outbox', 'WARNING'):
+            async_to_sync(outbox.dispatch_once)(FailingLayer())
+        event = OutboxEvent.objects.get()
+        self.assertIsNone(event.sent_at)
+        self.assertEqual(event.attempts, 1)
+        self.assertGreater(event.next_attempt_at, timezone.now())
+        self.assertEqual(async_to_sync(outbox.dispatch_once)(self.layer), 0)  # backing off
+        OutboxEvent.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(async_to_sync(outbox.dispatch_once)(self.layer), 1)
+
+    def test_backoff_grows_until_the_event_is_dropped(self):
+        self.assertEqual(
+            [outbox.backoff(n).total_seconds() for n in (1, 2, 3, 10)],
+            [1, 2, 4, outbox.MAX_BACKOFF.total_seconds()],
+        )
+        outbox.publish("staff_admin_group", {"type": "send_notification", "message": "dead"})
+        outbox.publish("staff_admin_group", {"type": "send_notification", "message": "old"})
+        dead, sent = OutboxEvent.objects.order_by('id')
+        OutboxEvent.objects.filter(pk=dead.pk).update(attempts=outbox.MAX_ATTEMPTS)  # claimed the last time
+        with self.assertLogs('notifications.outbox', 'ERROR'):
+            outbox.finish([sent.pk], [dead.pk])
+        OutboxEvent.objects.update(next_attempt_at=None)
+        self.assertEqual(outbox.claim(), [])
+
+        outbox.prune()
+        self.assertEqual(OutboxEvent.objects.count(), 2)  # kept for replay until they age out
+        old = timezone.now() - outbox.RETENTION - timedelta(seconds=1)
+        OutboxEvent.objects.update(created_at=old, sent_at=None)
+        OutboxEvent.objects.filter(pk=sent.pk).update(sent_at=old, attempts=1)
+        outbox.prune()
+        self.assertFalse(OutboxEvent.objects.exists())
 
-# Create your tests here.
+    def test_claimed_events_are_not_claimed_again(self):
+        outbox.publish("staff_admin_group", {"type": "send_notification", "message": "once"})
+        self.assertEqual(len(outbox.claim()), 1)
+        self.assertEqual(outbox.claim(), [])
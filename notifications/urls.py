@@ -3,4 +3,6 @@ from . import views
 
 urlpatterns = [
     path('', views.view_notifications, name='view_notifications'),
+    path('unread/', views.unread_badge, name='unread_badge'),
+    path('mark-read/', views.mark_read, name='mark_read'),
 ]
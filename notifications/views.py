@@ -1,7 +1,38 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET, require_POST
+from pos.changes import conditional
+from pos.pagination import render_page
+from . import counters
 from .models import Notification
 
+@login_required
+@conditional(Notification)
 def view_notifications(request):
-    notifications = Notification.objects.filter(user=request.user).order_by("-created_at")
-    return render(request, "notifications/list.html", {"notifications": notifications})
\ No newline at end of file
+    return render_page(
+        request,
+        Notification.objects.filter(user=request.user),
+        ('-created_at', '-id'),
+        "notifications/list.html",
+        lambda n: {'id': n.id, 'message': n.message, 'is_read': n.is_read, 'created_at': n.created_at},
+    )
+
+@login_required
+@require_GET
+def unread_badge(request):
+    return JsonResponse({'unread': counters.unread_count(request.user.pk)})
+
+@login_required
+@require_POST
+def mark_read(request):
+    # POST ids=1&ids=2 marks those notifications; all=1 marks every one.
+    if request.POST.get('all'):
+        changed = counters.mark_all_read(request.user.pk)
+    else:
+        try:
+            ids = [int(i) for i in request.POST.getlist('ids')]
+        except ValueError:
+            return JsonResponse({'error': 'ids must be integers'}, status=400)
+        changed = counters.mark_read(request.user.pk, ids)
+    return JsonResponse({'marked': changed, 'unread': counters.unread_count(request.user.pk)})
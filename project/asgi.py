@@ -13,21 +13,23 @@ from channels.auth import AuthMiddlewareStack
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
-from channels.auth import AuthMiddlewareStack
-from channels.routing import ProtocolTypeRouter, URLRouter
-from django.core.asgi import get_asgi_application
+# Set up Django before importing anything that touches models.
+django_asgi_app = get_asgi_application()
+
 import pos.routing
 import deliveries.routing
-import customers.routing
+import customer.routing
+from notifications.outbox import OutboxDispatcherApp
 
-application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+# The wrapper runs the outbox dispatcher alongside the server.
+application = OutboxDispatcherApp(ProtocolTypeRouter({
+    "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
         URLRouter(
             pos.routing.websocket_urlpatterns +
             deliveries.routing.websocket_urlpatterns +
-            customers.routing.websocket_urlpatterns
+            customer.routing.websocket_urlpatterns
         )
     ),
-})
+}))
 
@@ -0,0 +1,122 @@
+"""Measure group fan-out throughput of the Unix socket channel layer against the in-memory layer.
+
+Run from the repository root: ``python -m project.bench_channel_layer --workers 4``.
+It needs no Django settings or database.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import tempfile
+import time
+
+from channels.layers import InMemoryChannelLayer
+
+from project.layers import UnixSocketChannelLayer
+
+GROUP = 'bench'
+
+
+async def _consume(layer, channel, expected, deadline):
+    received = 0
+    while received < expected:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            await asyncio.wait_for(layer.receive(channel), remaining)
+        except asyncio.TimeoutError:
+            break
+        received += 1
+    return received
+
+
+def _worker(path, channels, messages, capacity, timeout, ready, results):
+    async def main():
+        layer = UnixSocketChannelLayer(path, capacity=capacity)
+        names = [await layer.new_channel() for _ in range(channels)]
+        for name in names:
+            await layer.group_add(GROUP, name)
+        ready.put(True)
+        deadline = time.monotonic() + timeout
+        counts = await asyncio.gather(*(_consume(layer, name, messages, deadline) for name in names))
+        results.put((sum(counts), time.time(), layer.dropped))
+        await layer.close()
+
+    asyncio.run(main())
+
+
+def bench_memory(options):
+    total_channels = options.workers * options.channels
+    messages = options.messages
+
+    async def main():
+        layer = InMemoryChannelLayer(capacity=options.capacity)
+        names = [await layer.new_channel() for _ in range(total_channels)]
+        for name in names:
+            await layer.group_add(GROUP, name)
+        deadline = time.monotonic() + options.timeout
+        consumers = asyncio.gather(*(_consume(layer, name, messages, deadline) for name in names))
+        start = time.perf_counter()
+        for i in range(messages):
+            await layer.group_send(GROUP, {'type': 'bench.message', 'n': i})
+            await asyncio.sleep(0)  # let the consumers drain, as separate processes would
+        delivered = sum(await consumers)
+        return delivered, time.perf_counter() - start, total_channels * messages - delivered
+
+    return asyncio.run(main())
+
+
+def bench_unix(options):
+    # The platform's default start method; workers only need the module-level _worker.
+    ctx = multiprocessing.get_context()
+    ready, results = ctx.Queue(), ctx.Queue()
+    with tempfile.TemporaryDirectory() as path:
+        procs = [
+            ctx.Process(target=_worker, args=(
+                path, options.channels, options.messages, options.capacity, options.timeout, ready, results,
+            ))
+            for _ in range(options.workers)
+        ]
+        for proc in procs:
+            proc.start()
+        for _ in procs:
+            ready.get()
+
+        async def send_all():
+            layer = UnixSocketChannelLayer(path, capacity=options.capacity)
+            for i in range(options.messages):
+                await layer.group_send(GROUP, {'type': 'bench.message', 'n': i})
+            await layer.close()
+
+        start_wall = time.time()
+        asyncio.run(send_all())
+        reports = [results.get() for _ in procs]
+        for proc in procs:
+            proc.join()
+    delivered = sum(count for count, _, _ in reports)
+    dropped = sum(drops for _, _, drops in reports)
+    return delivered, max(done for _, done, _ in reports) - start_wall, dropped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4, help="Receiving processes.")
+    parser.add_argument('--channels', type=int, default=25, help="Group members per worker.")
+    parser.add_argument('--messages', type=int, default=1000, help="group_send calls.")
+    parser.add_argument('--capacity', type=int, default=100)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    options = parser.parse_args(argv)
+
+    expected = options.workers * options.channels * options.messages
+    print(f"{options.workers} workers x {options.channels} channels, {options.messages} group messages "
+          f"({expected} deliveries)")
+    for name, bench in (('in-memory', bench_memory), ('unix socket', bench_unix)):
+        delivered, elapsed, dropped = bench(options)
+        print(
+            f"{name:12} {delivered:>9} delivered  {dropped:>7} dropped  {elapsed:8.3f}s  "
+            f"{delivered / elapsed if elapsed else 0:>12,.0f} deliveries/s"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+"""Broker-free channel layer for several ASGI worker processes on one host.
+
+Every process binds one Unix datagram socket under ``path/procs/`` and
+hands out process-specific channel names that embed its id, so the owner of
+a channel is known from its name alone. Group membership lives in the file
+system as ``path/groups/<group>/<expires>@<channel>`` entries; a
+``group_send`` lists the group once, drops expired members and sends one
+datagram per destination process carrying the message and the list of its
+local channels. Receiving processes put messages on per-channel queues of
+bounded ``capacity``.
+
+Unix datagram sockets are flow-controlled: when a receiver falls behind,
+its socket buffer fills and senders back off and retry for up to
+``send_timeout`` seconds. After that ``send`` raises ``ChannelFull`` and
+``group_send`` drops the message, as the other layers do.
+
+Group membership is read and written on a worker thread
+(``asyncio.to_thread``), so a slow file system never stalls the event loop.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import string
+import time
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+logger = logging.getLogger(__name__)
+
+MAX_DATAGRAM = 200 * 1024
+
+
+def _random_string(length=12):
+    return ''.join(random.choice(string.ascii_letters) for _ in range(length))
+
+
+class UnixSocketChannelLayer(BaseChannelLayer):
+    extensions = ['groups', 'flush']
+
+    def __init__(self, path, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None,
+                 send_timeout=1.0, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.path = str(path)
+        self.group_expiry = group_expiry
+        self.send_timeout = send_timeout
+        self.process_id = f"unix{os.getpid()}{_random_string(4)}"
+        self.channels = {}  # local channel -> asyncio.Queue of (expires, message)
+        self.dropped = 0    # messages discarded because a local channel was full
+        self._sock = None
+        self._sender = None
+        self._loop = None
+        self._stalled = None      # (channels, message, expires) waiting for room
+        self._stall_timer = None
+
+    # -- sockets --
+
+    def _proc_dir(self):
+        return os.path.join(self.path, 'procs')
+
+    def _socket_path(self, process_id):
+        return os.path.join(self._proc_dir(), f"{process_id}.sock")
+
+    def _group_dir(self, group):
+        if group in ('.', '..'):
+            # Valid channel group names, but they would name groups/ or the layer root.
+            raise TypeError(f"Group name {group!r} is not supported by this layer")
+        return os.path.join(self.path, 'groups', group)
+
+    def _owner(self, channel):
+        if '!' not in channel:
+            raise ValueError(f"{channel!r} is not a process-specific channel")
+        return channel.split('!', 1)[0].rsplit('.', 1)[-1]
+
+    def _get_sender(self):
+        if self._sender is None:
+            self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._sender.setblocking(False)
+        return self._sender
+
+    def _listen(self):
+        """Bind this process's socket and read it on the running loop."""
+        loop = asyncio.get_running_loop()
+        if self._sock is not None and self._loop is loop:
+            return
+        if self._sock is None:
+            os.makedirs(self._proc_dir(), exist_ok=True)
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._sock.bind(self._socket_path(self.process_id))
+            self._sock.setblocking(False)
+        elif self._loop is not None and not self._loop.is_closed():
+            self._loop.remove_reader(self._sock.fileno())
+        loop.add_reader(self._sock.fileno(), self._on_readable)
+        self._loop = loop
+
+    def _on_readable(self):
+        while self._stalled is None:
+            try:
+                data = self._sock.recv(MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                return
+            try:
+                packet = json.loads(data)
+            except ValueError:
+                logger.warning("Discarding an unreadable channel layer datagram")
+                continue
+            self._stalled = (packet['c'], packet['m'], packet['e'])
+            self._fill()
+
+    def _fill(self):
+        """Deliver the datagram in hand; stop reading the socket while a target channel is full."""
+        channels, message, expires = self._stalled
+        while channels:
+            queue = self._queue(channels[-1])
+            if queue.full():
+                if self._stall_timer is None:
+                    # Senders now see a full socket buffer and back off. A consumer
+                    # that never drains only holds everyone up for send_timeout.
+                    self._loop.remove_reader(self._sock.fileno())
+                    self._stall_timer = self._loop.call_later(self.send_timeout, self._give_up)
+                return
+            queue.put_nowait((expires, message))
+            channels.pop()
+        self._stalled = None
+        if self._stall_timer is not None:
+            self._stall_timer.cancel()
+            self._stall_timer = None
+            self._loop.add_reader(self._sock.fileno(), self._on_readable)
+
+    def _give_up(self):
+        channels, message, expires = self._stalled
+        kept = [channel for channel in channels if not self._queue(channel).full()]
+        self.dropped += len(channels) - len(kept)
+        channels[:] = kept
+        self._fill()
+
+    def _queue(self, channel):
+        queue = self.channels.get(channel)
+        if queue is None:
+            queue = self.channels[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+        return queue
+
+    def _is_local(self, process_id):
+        # Queues belong to the loop reading the socket; other threads' loops go through the socket too.
+        if process_id != self.process_id:
+            return False
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _deliver(self, channel, message, expires):
+        try:
+            self._queue(channel).put_nowait((expires, message))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    async def _send_datagram(self, process_id, data):
+        """Send to another process; return False if it is gone or stayed full for ``send_timeout``."""
+        sender = self._get_sender()
+        target = self._socket_path(process_id)
+        deadline = time.monotonic() + self.send_timeout
+        delay = 0.0005
+        while True:
+            try:
+                sender.sendto(data, target)
+                return True
+            except (BlockingIOError, InterruptedError):
+                if time.monotonic() >= deadline:
+                    return False
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.05)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The process exited; its socket file may be left behind.
+                try:
+                    os.unlink(target)
+                except FileNotFoundError:
+                    pass
+                return False
+
+    def _encode(self, channels, message):
+        data = json.dumps(
+            {'c': channels, 'm': message, 'e': time.time() + self.expiry}, separators=(',', ':'),
+        ).encode()
+        if len(data) > MAX_DATAGRAM:
+            raise ValueError(f"Message of {len(data)} bytes exceeds the {MAX_DATAGRAM} byte limit")
+        return data
+
+    # -- channel layer API --
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        owner = self._owner(channel)
+        if self._is_local(owner):
+            if not self._deliver(channel, message, time.time() + self.expiry):
+                raise ChannelFull(channel)
+        elif not await self._send_datagram(owner, self._encode([channel], message)):
+            raise ChannelFull(channel)
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        if self._owner(channel) != self.process_id:
+            raise ValueError(f"{channel!r} belongs to another process")
+        self._listen()
+        queue = self._queue(channel)
+        try:
+            while True:
+                expires, message = await queue.get()
+                if self._stalled is not None:
+                    self._fill()
+                if expires >= time.time():
+                    return message
+        finally:
+            if queue.empty():
+                self.channels.pop(channel, None)
+
+    async def new_channel(self, prefix='specific.'):
+        self._listen()
+        return f"{prefix}.{self.process_id}!{_random_string()}"
+
+    async def flush(self):
+        self.channels = {}
+        await asyncio.to_thread(self._clear_groups)
+
+    async def close(self):
+        if self._sock is not None:
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.remove_reader(self._sock.fileno())
+            self._sock.close()
+            self._sock = None
+            try:
+                os.unlink(self._socket_path(self.process_id))
+            except FileNotFoundError:
+                pass
+        if self._sender is not None:
+            self._sender.close()
+            self._sender = None
+
+    # -- groups --
+
+    def _members(self, group):
+        """``(entry, channel)`` for live members, removing expired entries on the way."""
+        try:
+            entries = os.listdir(self._group_dir(group))
+        except FileNotFoundError:
+            return []
+        now = time.time()
+        members = []
+        for entry in entries:
+            expires, _, channel = entry.partition('@')
+            try:
+                expired = float(expires) < now
+            except ValueError:
+                expired = True  # not an entry we wrote (say an editor's swap file)
+            if expired:
+                self._unlink_member(group, entry)
+            else:
+                members.append((entry, channel))
+        return members
+
+    def _unlink_member(self, group, entry):
+        try:
+            os.unlink(os.path.join(self._group_dir(group), entry))
+        except FileNotFoundError:
+            pass
+
+    def _discard_member(self, group, channel):
+        for entry, member in self._members(group):
+            if member == channel:
+                self._unlink_member(group, entry)
+
+    def _add_member(self, group, channel):
+        os.makedirs(self._group_dir(group), exist_ok=True)
+        self._discard_member(group, channel)
+        expires = int(time.time() + self.group_expiry)
+        open(os.path.join(self._group_dir(group), f"{expires}@{channel}"), 'w').close()
+
+    def _drop_if_gone(self, group, process_id, members):
+        if not os.path.exists(self._socket_path(process_id)):
+            # Gone for good: its memberships would never be discarded otherwise.
+            for entry, _ in members:
+                self._unlink_member(group, entry)
+
+    def _clear_groups(self):
+        groups = os.path.join(self.path, 'groups')
+        if os.path.isdir(groups):
+            for group in os.listdir(groups):
+                for entry in os.listdir(os.path.join(groups, group)):
+                    self._unlink_member(group, entry)
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        self._owner(channel)
+        await asyncio.to_thread(self._add_member, group, channel)
+
+    async def group_discard(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await asyncio.to_thread(self._discard_member, group, channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_group_name(group)
+        by_process = {}
+        for entry, channel in await asyncio.to_thread(self._members, group):
+            by_process.setdefault(self._owner(channel), []).append((entry, channel))
+
+        expires = time.time() + self.expiry
+        remote = []
+        for process_id, members in by_process.items():
+            channels = [channel for _, channel in members]
+            if self._is_local(process_id):
+                for channel in channels:
+                    self._deliver(channel, message, expires)
+            else:
+                remote.append((process_id, members, self._encode(channels, message)))
+
+        results = await asyncio.gather(*(self._send_datagram(pid, data) for pid, _, data in remote))
+        for (process_id, members, _), delivered in zip(remote, results):
+            if not delivered:
+                await asyncio.to_thread(self._drop_if_gone, group, process_id, members)
@@ -0,0 +1,203 @@
+"""Read-only replica of the SQLite database for heavy admin reads.
+
+``refresh()`` copies the primary with the SQLite online backup API
+(``manage.py refresh_replica``, optionally on a loop) into a new file named
+after ``DATABASES['replica']`` and the time of the copy, e.g.
+``db.replica.1700000000000.sqlite3``, then publishes that file and time in
+the shared cache; ``lag()`` is the age of the copy. A file is never replaced
+while it may be open (Windows refuses that), so each request reads the copy
+that was current when it started, and old copies are removed once no longer
+in use.
+
+Reads only go to the replica inside views decorated with ``use_replica``,
+and only while it is at most ``REPLICA_MAX_LAG`` seconds old. Writes always
+go to the primary. A request that writes is pinned to the primary for the
+rest of the request, and ``ReplicaMiddleware`` gives the client a cookie so
+its later requests read from the primary until a replica taken after that
+write is available (read-your-writes).
+"""
+import contextvars
+import functools
+import glob
+import os
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA = 'replica'
+STAMP_KEY = 'replica:copy'  # (refreshed_at, path)
+WROTE_COOKIE = 'pos_wrote'
+
+# ``(refreshed_at, path)`` of the copy this request reads from, or None.
+_reads = contextvars.ContextVar('replica_reads', default=None)
+_wrote = contextvars.ContextVar('replica_wrote', default=False)
+
+
+def current():
+    """``(refreshed_at, path)`` of the latest replica copy, or ``(None, None)``."""
+    return cache.get(STAMP_KEY) or (None, None)
+
+
+def refreshed_at():
+    """Epoch seconds at which the current replica was copied, or None."""
+    return current()[0]
+
+
+def lag():
+    """Seconds the replica is behind the primary at most, or None without a replica."""
+    at = refreshed_at()
+    return None if at is None else max(time.time() - at, 0.0)
+
+
+def refresh(source=None, target=None):
+    """Copy the primary into a new replica file; return the seconds it took.
+
+    ``target`` (the replica's configured name by default) only names the
+    copies. In WAL mode the backup's read transaction does not block writers.
+    """
+    source = str(source or settings.DATABASES[DEFAULT_DB_ALIAS]['NAME'])
+    root, ext = os.path.splitext(str(target or settings.DATABASES[REPLICA]['NAME']))
+    started = time.time()
+    path = f"{root}.{int(started * 1000)}{ext}"
+    partial = f"{path}.partial"
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(partial)
+    try:
+        src.backup(dst)
+        # A WAL replica would leave -wal/-shm files behind when it is replaced.
+        dst.execute("PRAGMA journal_mode = delete")
+    finally:
+        dst.close()
+        src.close()
+    os.replace(partial, path)
+    previous = current()[1]
+    cache.set(STAMP_KEY, (started, path), None)
+    # Requests that started before the switch may still be opening the previous copy.
+    _remove_copies(root, ext, keep={path, previous})
+    return time.time() - started
+
+
+def _remove_copies(root, ext, keep):
+    for path in glob.glob(f"{glob.escape(root)}.*{ext}"):
+        if path not in keep and path[len(root) + 1:-len(ext) or None].isdigit():
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # still open (Windows); removed by a later refresh
+
+
+def _open_copy(path):
+    # Connections are per thread; point this one at the copy its request reads.
+    conn = connections[REPLICA]
+    if path and conn.settings_dict['NAME'] != path:
+        conn.close()
+        conn.settings_dict = {**conn.settings_dict, 'NAME': path}
+
+
+def reading_from():
+    """Stamp of the replica copy reads currently go to, or None when they go to the primary."""
+    reads = _reads.get()
+    return reads[0] if reads and not _wrote.get() else None
+
+
+def replica_usable(request, at=None):
+    if at is None:
+        at = refreshed_at()
+    if at is None or time.time() - at > settings.REPLICA_MAX_LAG:
+        return False
+    try:
+        wrote = float(request.COOKIES.get(WROTE_COOKIE, 0))
+    except ValueError:
+        wrote = 0
+    # The replica must have been taken after this client's last write.
+    return wrote < at
+
+
+def _on_replica(chunks, copy):
+    # The body is produced after the view (and middleware) returned.
+    chunks = iter(chunks)
+    while True:
+        reads, wrote = _reads.set(copy), _wrote.set(False)
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            return
+        finally:
+            _wrote.reset(wrote)
+            _reads.reset(reads)
+        yield chunk
+
+
+async def _aon_replica(chunks, copy):
+    while True:
+        reads, wrote = _reads.set(copy), _wrote.set(False)
+        try:
+            chunk = await anext(chunks)
+        except StopAsyncIteration:
+            return
+        finally:
+            _wrote.reset(wrote)
+            _reads.reset(reads)
+        yield chunk
+
+
+def use_replica(view):
+    """Let ``view`` (and a streamed response body) read from the replica when it is fresh enough.
+
+    Put it below the auth decorators so permission checks read the primary.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        copy = current()
+        copy = copy if replica_usable(request, copy[0]) else None
+        token = _reads.set(copy)
+        try:
+            response = view(request, *args, **kwargs)
+        finally:
+            _reads.reset(token)
+        if copy and response.streaming and not _wrote.get():
+            wrap = _aon_replica if response.is_async else _on_replica
+            response.streaming_content = wrap(response.streaming_content, copy)
+        return response
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        reads = _reads.get()
+        if reads and not _wrote.get():
+            _open_copy(reads[1])
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    """Tracks writes per request and remembers them in a cookie for read-your-writes."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            wrote = _wrote.get()
+        finally:
+            _wrote.reset(token)
+        if wrote:
+            response.set_cookie(WROTE_COOKIE, f"{time.time():.3f}", max_age=settings.REPLICA_MAX_LAG,
+                                httponly=True, samesite='Lax')
+        return response
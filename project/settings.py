@@ -57,18 +57,26 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'project.replica.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'project.urls'
 
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Compiled templates are kept per process in production; DEBUG
+            # re-reads them so edits show up without a restart.
+            'loaders': TEMPLATE_LOADERS if DEBUG else [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)],
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
@@ -84,10 +92,79 @@ WSGI_APPLICATION = 'project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Production SQLite profile (see project/sqlite.py): connections are kept
+# across requests, transactions take the write lock up front and
+# SQLITE_PRAGMAS is applied to each new connection.
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 5,
+        },
+    },
+    # Read-only copy for reports and exports, refreshed by `manage.py
+    # refresh_replica` (see project/replica.py). Not migrated: it is a copy.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.replica.sqlite3',
+        'CONN_MAX_AGE': 0,  # each request opens the copy that is current when it starts
+        'PRAGMAS': {
+            'query_only': 1,
+            'cache_size': -64000,
+            'mmap_size': 268435456,
+            'busy_timeout': 5000,
+        },
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['project.replica.ReplicaRouter']
+
+# Views opted in with @use_replica fall back to the primary past this age (seconds).
+REPLICA_MAX_LAG = 300
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',   # safe with WAL; fsync at checkpoints only
+    'cache_size': -64000,      # KiB, i.e. 64 MB per connection
+    'mmap_size': 268435456,    # 256 MB
+    'busy_timeout': 5000,      # ms
+}
+
+# Send @project.sqlite.serialized writes through one writer thread per process.
+SQLITE_WRITE_QUEUE = False
+
+
+# Cache
+# Shared by every worker process on the host (role membership, version stamps,
+# rendered pages from pos.pagecache). Page entries never expire, so superseded
+# ones are culled once there are MAX_ENTRIES.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }
+}
+
+
+# Channel layer used for websocket group broadcasts.
+# Shared by all ASGI worker processes on the host over Unix sockets (no broker).
+
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'project.layers.UnixSocketChannelLayer',
+        'CONFIG': {
+            'path': BASE_DIR / 'run' / 'channels',
+            'capacity': 100,
+            'group_expiry': 86400,
+        },
     }
 }
 
@@ -134,4 +211,10 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
-LOGIN_URL = 'login:login'
\ No newline at end of file
+LOGIN_URL = 'login:login'
+
+# Where delivery routes start (lat, lng): the water station. See pos/routeplan.py.
+ROUTE_DEPOT = (14.5995, 120.9842)
+
+# Assign new unassigned deliveries to drivers automatically (pos/dispatch.py).
+DRIVER_AUTO_ASSIGN = True
@@ -0,0 +1,112 @@
+"""SQLite tuned for several ASGI/WSGI workers writing to one database file.
+
+``configure()`` applies ``settings.SQLITE_PRAGMAS`` to every new connection
+(WAL, so readers never wait on the writer, plus ``synchronous``, cache,
+mmap and ``busy_timeout``). Connections persist through ``CONN_MAX_AGE``
+and transactions start with ``BEGIN IMMEDIATE``, so a writer waits for the
+lock up front instead of failing with "database is locked" when it upgrades
+a read lock mid-transaction.
+
+``WriteQueue`` optionally funnels write transactions from many threads and
+coroutines in one process through a single writer thread; functions
+decorated with ``serialized`` use it when ``settings.SQLITE_WRITE_QUEUE`` is
+on. ``manage.py bench_sqlite`` compares the profiles.
+"""
+import asyncio
+import functools
+import queue
+import threading
+from concurrent.futures import Future
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+def apply_pragmas(cursor, pragmas):
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+
+
+@receiver(connection_created)
+def configure(sender, connection, **kwargs):
+    # A database entry can bring its own PRAGMAS (the read replica does).
+    pragmas = connection.settings_dict.get('PRAGMAS', getattr(settings, 'SQLITE_PRAGMAS', None))
+    if connection.vendor == 'sqlite' and pragmas:
+        with connection.cursor() as cursor:
+            apply_pragmas(cursor, pragmas)
+
+
+class WriteQueue:
+    """Runs submitted callables one at a time, in order, on a single thread."""
+
+    def __init__(self, name='sqlite-writer', setup=None):
+        self.name = name
+        self.setup = setup  # called on the writer thread before each callable
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        self._queue.put((future, fn, args, kwargs))
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+        return future
+
+    def call(self, fn, *args, **kwargs):
+        return self.submit(fn, *args, **kwargs).result()
+
+    async def acall(self, fn, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def on_writer(self):
+        return threading.current_thread() is self._thread
+
+    def _run(self):
+        while True:
+            future, fn, args, kwargs = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if self.setup is not None:
+                    self.setup()
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as exc:
+                future.set_exception(exc)
+
+
+writer = WriteQueue(setup=close_old_connections)
+
+
+def _atomic_call(fn, args, kwargs):
+    with transaction.atomic():
+        return fn(*args, **kwargs)
+
+
+def serialized(fn):
+    """Run ``fn`` in a transaction on the write queue when ``SQLITE_WRITE_QUEUE`` is on.
+
+    Calls made inside a transaction (or from the writer itself) run inline:
+    queueing them would wait on a lock the caller already holds.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if (not getattr(settings, 'SQLITE_WRITE_QUEUE', False)
+                or connection.in_atomic_block or writer.on_writer()):
+            return fn(*args, **kwargs)
+        return writer.call(_atomic_call, fn, args, kwargs)
+
+    async def awrite(*args, **kwargs):
+        # For coroutines: waits without blocking the event loop.
+        if not getattr(settings, 'SQLITE_WRITE_QUEUE', False):
+            return await sync_to_async(fn)(*args, **kwargs)
+        return await writer.acall(_atomic_call, fn, args, kwargs)
+
+    wrapper.awrite = awrite
+    return wrapper